@@ -1,79 +1,223 @@
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
 
-# Load both files
-df_polygon = pd.read_csv("spy_intra_data_polygon.csv")
-df_alpaca = pd.read_csv("spy_intra_data_alpaca.csv")
-
-# Convert 'caldt' to datetime
-df_polygon['caldt'] = pd.to_datetime(df_polygon['caldt'])
-df_alpaca['caldt'] = pd.to_datetime(df_alpaca['caldt'])
-
-print("\n========== ROW COUNT ==========")
-print(f"[Polygon] Total rows: {len(df_polygon)}")
-print(f"[Alpaca ] Total rows: {len(df_alpaca)}")
-
-# ========== PART 1: Row count per day ==========
-polygon_counts = df_polygon['caldt'].dt.date.value_counts().sort_index()
-alpaca_counts = df_alpaca['caldt'].dt.date.value_counts().sort_index()
-
-comparison_df = pd.DataFrame({
-    'polygon_count': polygon_counts,
-    'alpaca_count': alpaca_counts
-})
-comparison_df['difference'] = comparison_df['polygon_count'] - comparison_df['alpaca_count']
-
-print("\n========== ROW COUNT PER DAY DIFFERENCES ==========")
-diff_days = comparison_df[comparison_df['difference'] != 0]
-if diff_days.empty:
-    print("[✓] No differences in row counts per day.")
-else:
-    print(diff_days)
-
-# ========== PART 2: Unique timestamps ==========
-polygon_timestamps = set(df_polygon['caldt'])
-alpaca_timestamps = set(df_alpaca['caldt'])
-
-only_in_polygon = polygon_timestamps - alpaca_timestamps
-only_in_alpaca = alpaca_timestamps - polygon_timestamps
-shared_timestamps = polygon_timestamps & alpaca_timestamps
-
-print("\n========== TIMESTAMP COMPARISON ==========")
-print(f"[✓] Shared timestamps: {len(shared_timestamps)}")
-print(f"[!] Timestamps only in Polygon: {len(only_in_polygon)}")
-print(f"[!] Timestamps only in Alpaca:  {len(only_in_alpaca)}")
-
-# Save missing timestamps for manual review
-#if only_in_polygon:
-   # pd.DataFrame(sorted(only_in_polygon), columns=["missing_in_alpaca"]).to_csv("missing_in_alpaca.csv", index=False)
-#if only_in_alpaca:
-   #  pd.DataFrame(sorted(only_in_alpaca), columns=["missing_in_polygon"]).to_csv("missing_in_polygon.csv", index=False)
-
-# ========== PART 3: Compare OHLCV values on shared timestamps ==========
-print("\n========== OHLCV VALUE DIFFERENCES ON SHARED TIMESTAMPS ==========")
-# Merge both dataframes on 'caldt'
-df_shared = pd.merge(df_polygon, df_alpaca, on='caldt', suffixes=('_polygon', '_alpaca'))
-
-# Check for differences in OHLCV columns
-ohlcv_cols = ['open', 'high', 'low', 'close', 'volume']
-for col in ohlcv_cols:
-    diff_mask = df_shared[f'{col}_polygon'] != df_shared[f'{col}_alpaca']
-    num_diffs = diff_mask.sum()
-    print(f"[{col.upper()}] Differences: {num_diffs}")
-
-# ========== PART 4: Analyze extra Alpaca timestamps ==========
-if only_in_alpaca:
-    df_extra_alpaca = df_alpaca[df_alpaca['caldt'].isin(only_in_alpaca)].copy()
-    df_extra_alpaca['hour'] = df_extra_alpaca['caldt'].dt.hour
-
-    #print("\n========== HOUR DISTRIBUTION OF EXTRA ALPACA TIMESTAMPS ==========")
-    #print(df_extra_alpaca['hour'].value_counts().sort_index())
-
-    # Save for review
-    # df_extra_alpaca.to_csv("extra_alpaca_rows.csv", index=False)
-
-# ========== PART 5: Check for duplicate timestamps ==========
-print("\n========== DUPLICATE TIMESTAMPS CHECK ==========")
-dups_polygon = df_polygon['caldt'].duplicated().sum()
-dups_alpaca = df_alpaca['caldt'].duplicated().sum()
-print(f"[Polygon] Duplicate timestamps: {dups_polygon}")
-print(f"[Alpaca ] Duplicate timestamps: {dups_alpaca}\n\n")
+# Default inputs sit next to this script, wherever it is run from
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEFT_FILE = os.path.join(HERE, "spy_intra_data_polygon.csv")
+RIGHT_FILE = os.path.join(HERE, "spy_intra_data_alpaca.csv")
+LABELS = ('polygon', 'alpaca')
+CHUNK_ROWS = 500_000
+OHLCV = ['open', 'high', 'low', 'close', 'volume']
+MAX_PRINTED_DAYS = 20
+
+# (absolute, relative) tolerance per column: values differ when |a - b| > atol + rtol * |b|.
+# The price default absorbs float noise in the vendor exports while still catching a 0.0001 move.
+PRICE_TOLERANCE = (1e-6, 0.0)
+VOLUME_TOLERANCE = (0.0, 0.0)
+
+
+def default_tolerances(price=PRICE_TOLERANCE, volume=VOLUME_TOLERANCE):
+    return {**{col: price for col in OHLCV[:4]}, 'volume': volume}
+
+
+def _empty():
+    return pd.DataFrame({'caldt': pd.Series(dtype='datetime64[ns]'), **{col: pd.Series(dtype=float) for col in OHLCV}})
+
+
+def _read_sorted(path, chunk_rows):
+    """Chunks of a minute file, checking that caldt never goes backwards."""
+    last = None
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, parse_dates=['caldt'], usecols=['caldt', *OHLCV]):
+        ts = chunk['caldt'].to_numpy()
+        if (last is not None and ts[0] < last) or (np.diff(ts) < np.timedelta64(0)).any():
+            raise ValueError(f"[ERROR] {path} is not sorted by caldt; sort it before comparing")
+        last = ts[-1]
+        yield chunk
+
+
+def merge_batches(left_path, right_path, chunk_rows=CHUNK_ROWS):
+    """(left, right) pairs of rows covering the same timestamps, in time order.
+
+    Merge-join over the two sorted files read `chunk_rows` at a time: rows
+    before the smaller of the two buffered end timestamps are complete on both
+    sides and are emitted together; the side that reached that timestamp reads
+    its next chunk. All rows of one timestamp land in the same batch, so
+    duplicates are seen together. Memory stays at a few chunks.
+    """
+    readers = [_read_sorted(left_path, chunk_rows), _read_sorted(right_path, chunk_rows)]
+    buffers = [None, None]
+    done = [False, False]
+
+    def refill(i):
+        chunk = next(readers[i], None)
+        if chunk is None:
+            done[i] = True
+        else:
+            buffers[i] = chunk if buffers[i] is None else pd.concat([buffers[i], chunk], ignore_index=True)
+
+    while True:
+        for i in (0, 1):
+            if not done[i] and (buffers[i] is None or buffers[i].empty):
+                refill(i)
+        if all(done):
+            batch = [b if b is not None else _empty() for b in buffers]
+            if any(len(b) for b in batch):
+                yield batch[0], batch[1]
+            return
+
+        watermark = min(buffers[i]['caldt'].iloc[-1] for i in (0, 1) if not done[i])
+        batch = []
+        for i in (0, 1):
+            buffer = buffers[i] if buffers[i] is not None else _empty()
+            k = int(np.searchsorted(buffer['caldt'].to_numpy(), np.datetime64(watermark), side='left'))
+            batch.append(buffer.iloc[:k])
+            buffers[i] = buffer.iloc[k:].reset_index(drop=True)
+        if len(batch[0]) or len(batch[1]):
+            yield batch[0], batch[1]
+        for i in (0, 1):
+            if not done[i] and len(buffers[i]) and buffers[i]['caldt'].iloc[-1] == watermark:
+                refill(i)
+
+
+def _batch_tables(left, right, tolerances, labels):
+    """Per-day and per-hour counts of one batch, plus the largest absolute difference per column."""
+    a, b = labels
+    dup_a = left['caldt'].duplicated().to_numpy()
+    dup_b = right['caldt'].duplicated().to_numpy()
+    merged = left[~dup_a].merge(right[~dup_b], on='caldt', how='outer', suffixes=(f'_{a}', f'_{b}'),
+                                indicator=True)
+    both = (merged['_merge'] == 'both').to_numpy()
+    flags = pd.DataFrame({
+        f'only_{a}': (merged['_merge'] == 'left_only').to_numpy(),
+        f'only_{b}': (merged['_merge'] == 'right_only').to_numpy(),
+    })
+    max_abs = {}
+    for col, (atol, rtol) in tolerances.items():
+        x = merged[f'{col}_{a}'].to_numpy(dtype=float)
+        y = merged[f'{col}_{b}'].to_numpy(dtype=float)
+        flags[col] = both & ~np.isclose(x, y, rtol=rtol, atol=atol, equal_nan=True)
+        gap = np.abs(x[both] - y[both])
+        max_abs[col] = float(np.nanmax(gap)) if gap.size and not np.isnan(gap).all() else 0.0
+
+    sides = [(left, dup_a, a), (right, dup_b, b)]
+    tables = {}
+    for name, key in (('by_day', lambda ts: ts.dt.date), ('by_hour', lambda ts: ts.dt.hour)):
+        parts = [pd.DataFrame({f'{label}_count': 1, f'dup_{label}': dup.astype(int)}).groupby(
+                     key(df['caldt']).to_numpy()).sum() for df, dup, label in sides]
+        parts.append(flags.astype(int).groupby(key(merged['caldt']).to_numpy()).sum())
+        tables[name] = pd.concat(parts, axis=1)
+    return tables, max_abs, merged.loc[~both, ['caldt', '_merge']]
+
+
+def compare(left_path=LEFT_FILE, right_path=RIGHT_FILE, tolerances=None, labels=LABELS,
+            chunk_rows=CHUNK_ROWS, missing_prefix=None):
+    """Diff two minute files sorted by caldt in one streaming pass.
+
+    Returns {'by_day', 'by_hour', 'max_abs'}: per day and per hour of day, row
+    counts of each side and their difference, timestamps only in one side,
+    duplicate timestamps, and the number of shared timestamps whose OHLCV
+    values differ beyond `tolerances` (default_tolerances()); plus the largest
+    absolute difference per column. With `missing_prefix`, the timestamps
+    missing from each side are streamed to <prefix>_missing_in_<label>.csv.
+    """
+    a, b = labels
+    tolerances = tolerances or default_tolerances()
+    by_day, by_hour, max_abs = [], [], dict.fromkeys(tolerances, 0.0)
+    missing = {}
+    if missing_prefix:
+        for side, label in (('left_only', b), ('right_only', a)):
+            missing[side] = open(f"{missing_prefix}_missing_in_{label}.csv", 'w')
+            missing[side].write(f"missing_in_{label}\n")
+    try:
+        for left, right in merge_batches(left_path, right_path, chunk_rows):
+            tables, batch_max, unmatched = _batch_tables(left, right, tolerances, labels)
+            by_day.append(tables['by_day'])
+            by_hour.append(tables['by_hour'])
+            max_abs = {col: max(max_abs[col], batch_max[col]) for col in max_abs}
+            for side, f in missing.items():
+                unmatched.loc[unmatched['_merge'] == side, ['caldt']].to_csv(f, header=False, index=False)
+    finally:
+        for f in missing.values():
+            f.close()
+
+    columns = [f'{a}_count', f'{b}_count', f'only_{a}', f'only_{b}', f'dup_{a}', f'dup_{b}', *tolerances]
+    report = {}
+    for name, parts in (('by_day', by_day), ('by_hour', by_hour)):
+        table = pd.concat(parts).groupby(level=0).sum() if parts else pd.DataFrame(columns=columns)
+        table = table.reindex(columns=columns, fill_value=0).fillna(0).astype(int)
+        table.insert(2, 'difference', table[f'{a}_count'] - table[f'{b}_count'])
+        report[name] = table.rename_axis('day' if name == 'by_day' else 'hour')
+    report['max_abs'] = pd.Series(max_abs)
+    return report
+
+
+def print_report(report, labels=LABELS, tolerances=None):
+    a, b = labels
+    tolerances = tolerances or default_tolerances()
+    by_day, by_hour = report['by_day'], report['by_hour']
+    totals = by_day.sum()
+    width = max(len(a), len(b))
+
+    print("\n========== ROW COUNT ==========")
+    print(f"[{a.capitalize():<{width}}] Total rows: {totals[f'{a}_count']}")
+    print(f"[{b.capitalize():<{width}}] Total rows: {totals[f'{b}_count']}")
+
+    print("\n========== ROW COUNT PER DAY DIFFERENCES ==========")
+    diff_days = by_day.loc[by_day['difference'] != 0, [f'{a}_count', f'{b}_count', 'difference']]
+    if diff_days.empty:
+        print("[✓] No differences in row counts per day.")
+    else:
+        print(diff_days.head(MAX_PRINTED_DAYS).to_string())
+        if len(diff_days) > MAX_PRINTED_DAYS:
+            print(f"... {len(diff_days)} days differ in total (all days with --report)")
+
+    print("\n========== TIMESTAMP COMPARISON ==========")
+    shared = totals[f'{a}_count'] - totals[f'dup_{a}'] - totals[f'only_{a}']
+    print(f"[✓] Shared timestamps: {shared}")
+    print(f"[!] Timestamps only in {a.capitalize()}: {totals[f'only_{a}']}")
+    print(f"[!] Timestamps only in {b.capitalize()}: {totals[f'only_{b}']}")
+
+    print("\n========== OHLCV VALUE DIFFERENCES ON SHARED TIMESTAMPS ==========")
+    for col, (atol, rtol) in tolerances.items():
+        print(f"[{col.upper()}] Differences: {totals[col]} (atol={atol:g}, rtol={rtol:g}; "
+              f"max |diff| {report['max_abs'][col]:g})")
+
+    print("\n========== DIFFERENCES BY HOUR ==========")
+    hours = by_hour.drop(columns=[f'dup_{a}', f'dup_{b}'])
+    print(hours[(hours.drop(columns=[f'{a}_count', f'{b}_count']) != 0).any(axis=1)].to_string())
+
+    print("\n========== DUPLICATE TIMESTAMPS CHECK ==========")
+    print(f"[{a.capitalize():<{width}}] Duplicate timestamps: {totals[f'dup_{a}']}")
+    print(f"[{b.capitalize():<{width}}] Duplicate timestamps: {totals[f'dup_{b}']}\n\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff two sorted minute-bar files (Polygon vs Alpaca) in one streaming pass.")
+    parser.add_argument("--left", default=LEFT_FILE)
+    parser.add_argument("--right", default=RIGHT_FILE)
+    parser.add_argument("--labels", nargs=2, default=list(LABELS))
+    parser.add_argument("--price-atol", type=float, default=PRICE_TOLERANCE[0])
+    parser.add_argument("--price-rtol", type=float, default=PRICE_TOLERANCE[1])
+    parser.add_argument("--volume-atol", type=float, default=VOLUME_TOLERANCE[0])
+    parser.add_argument("--volume-rtol", type=float, default=VOLUME_TOLERANCE[1])
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--report", default=None, metavar="PREFIX",
+                        help="Write <PREFIX>_by_day.csv, <PREFIX>_by_hour.csv and the missing timestamps")
+    args = parser.parse_args(argv)
+
+    labels = tuple(args.labels)
+    tolerances = default_tolerances((args.price_atol, args.price_rtol), (args.volume_atol, args.volume_rtol))
+    report = compare(args.left, args.right, tolerances, labels, args.chunk_rows, args.report)
+    print_report(report, labels, tolerances)
+    if args.report:
+        report['by_day'].to_csv(f"{args.report}_by_day.csv")
+        report['by_hour'].to_csv(f"{args.report}_by_hour.csv")
+        print(f"[INFO] Report saved in {args.report}_by_day.csv, {args.report}_by_hour.csv "
+              f"and {args.report}_missing_in_*.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,165 @@
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
-from datetime import datetime
 
-# Ask the user for the date range
-start_date_str = input("Enter the start date (YYYY-MM-DD): ")
-end_date_str = input("Enter the end date (YYYY-MM-DD): ")
+# The Alpaca export sits next to this script; the outputs go to the working directory
+SOURCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SPY_1min_adjusted_alpaca.csv")
+INTRA_FILE = "spy_intra_data.csv"
+DAILY_FILE = "spy_daily_data.csv"
+CHUNK_ROWS = 500_000
+SEEK_BLOCK = 1 << 16            # binary search stops when the window is this many bytes
+
+SESSION_FIRST_MINUTE = 9 * 60 + 30     # 09:30
+SESSION_LAST_MINUTE = 15 * 60 + 59     # 15:59
+OHLCV = ['open', 'high', 'low', 'close', 'volume']
+
+
+def seconds_of_day(times, dates=None):
+    """Seconds since midnight of zero-padded "HH:MM" / "HH:MM:SS" strings.
+
+    Integer arithmetic on the ASCII digits of a fixed-width byte view; no
+    per-row string parsing. Any other format raises ValueError naming the
+    first offending value (and its date, when `dates` is given), since a
+    misread time would move the bar to another day.
+    """
+    raw = np.asarray(times, dtype='S9').view(np.uint8).reshape(-1, 9).astype(np.int64)
+    digits = raw - ord('0')
+    is_digit = (digits >= 0) & (digits <= 9)
+    short = (raw[:, 5:] == 0).all(axis=1)
+    valid = ((raw[:, 2] == ord(':')) & is_digit[:, [0, 1, 3, 4]].all(axis=1) & (raw[:, 8] == 0)
+             & (short | ((raw[:, 5] == ord(':')) & is_digit[:, 6] & is_digit[:, 7])))
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 3] * 10 + digits[:, 4]
+    seconds = np.where(short, 0, digits[:, 6] * 10 + digits[:, 7])
+    valid &= (hours < 24) & (minutes < 60) & (seconds < 60)
+    if not valid.all():
+        i = int(np.argmin(valid))
+        row = f"{dates[i]} {times[i]}" if dates is not None else times[i]
+        raise ValueError(f"[ERROR] Bad time in row '{row}'; expected zero-padded HH:MM or HH:MM:SS")
+    return (hours * 60 + minutes) * 60 + seconds
+
+
+def _line_date(line, date_index):
+    return line.split(b',')[date_index].strip().strip(b'"').decode()
+
+
+def _seek_start(f, start, date_index):
+    """Byte offset of the first line dated >= `start` in a file sorted by date.
+
+    `f` is a binary handle positioned after the header. Binary search on byte
+    offsets (reading one line per probe) narrows the range to SEEK_BLOCK bytes,
+    which are then scanned line by line.
+    """
+    data_start = f.tell()
+    lo, hi = data_start, f.seek(0, os.SEEK_END)
+    while hi - lo > SEEK_BLOCK:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline()
+        line = f.readline()
+        if not line or _line_date(line, date_index) >= start:
+            hi = mid
+        else:
+            lo = mid
+    f.seek(lo)
+    if lo != data_start:
+        f.readline()
+    while True:
+        offset = f.tell()
+        line = f.readline()
+        if not line or _line_date(line, date_index) >= start:
+            return offset
+
+
+def iter_bars(source=SOURCE_FILE, start=None, end=None, chunk_rows=CHUNK_ROWS, sorted_input=True):
+    """Bars of a vendor 1-minute file dated within [start, end], `chunk_rows` rows at a time.
+
+    Rows are filtered on the raw ISO date strings before anything is parsed.
+    With `sorted_input` (the vendor files are in date order), reading starts at
+    the byte offset of `start` and stops after the first chunk past `end`.
+    Yields frames with caldt (date + time of day, both parsed vectorized),
+    minute (of the day) and OHLCV.
+    """
+    start = pd.Timestamp(start).strftime('%Y-%m-%d') if start else None
+    stop = (pd.Timestamp(end) + pd.Timedelta(days=1)).strftime('%Y-%m-%d') if end else None
+
+    with open(source, 'rb') as f:
+        columns = f.readline().decode().strip().split(',')
+        if not {'date', 'time', *OHLCV} <= set(columns):
+            raise ValueError(f"[ERROR] {source} needs date, time and {', '.join(OHLCV)} columns")
+        if start and sorted_input:
+            f.seek(_seek_start(f, start, columns.index('date')))
+        reader = pd.read_csv(f, header=None, names=columns, usecols=['date', 'time', *OHLCV],
+                             dtype={'date': str, 'time': str}, chunksize=chunk_rows)
+        for chunk in reader:
+            keep = np.ones(len(chunk), dtype=bool)
+            if start:
+                keep &= (chunk['date'] >= start).to_numpy()
+            past_end = False
+            if stop:
+                before_stop = (chunk['date'] < stop).to_numpy()
+                past_end = sorted_input and not before_stop[-1]
+                keep &= before_stop
+            chunk = chunk[keep]
+            if len(chunk):
+                seconds = seconds_of_day(chunk['time'].to_numpy(), chunk['date'].to_numpy())
+                caldt = pd.to_datetime(chunk['date'], format='%Y-%m-%d') + pd.to_timedelta(seconds, unit='s')
+                yield pd.DataFrame({'caldt': caldt, 'minute': seconds // 60, **{c: chunk[c] for c in OHLCV}})
+            if past_end:
+                return
 
-# Convert strings to datetime
-start_date = pd.to_datetime(start_date_str)
-end_date = pd.to_datetime(end_date_str + ' 23:59:59')  # include the entire end day
 
-# Load the original CSV data
-df = pd.read_csv("SPY_1min_adjusted_alpaca.csv")
+def _combine_daily(parts):
+    """Daily OHLCV from per-chunk daily aggregates (chunks in file order)."""
+    daily = pd.concat(parts).groupby(level=0).agg({'open': 'first', 'high': 'max', 'low': 'min',
+                                                   'close': 'last', 'volume': 'sum'})
+    return daily.rename_axis('caldt').reset_index()
 
-# Combine 'date' and 'time' into a single datetime column
-df['datetime'] = pd.to_datetime(df['date'] + ' ' + df['time'])
 
-# Reorder and rename columns as needed
-df = df[['datetime', 'open', 'high', 'low', 'close', 'volume']].copy()
-df.rename(columns={'datetime': 'caldt'}, inplace=True)
+def convert(source=SOURCE_FILE, start=None, end=None, intra_path=INTRA_FILE, daily_path=DAILY_FILE,
+            chunk_rows=CHUNK_ROWS, sorted_input=True):
+    """Write the session bars (09:30-15:59) and the daily OHLCV of `source` in one streaming pass.
 
-# Filter the selected date range (inclusive)
-df = df[(df['caldt'] >= start_date) & (df['caldt'] <= end_date)]
+    Session bars are appended to `intra_path` chunk by chunk. Daily bars
+    cover all bars of the day (extended hours included); each chunk is reduced
+    to one row per day and the rows are combined at the end, so memory is one
+    chunk plus one row per day. Returns (session rows, days).
+    """
+    n_intra, daily = 0, []
+    with open(intra_path, 'w', newline='') as f:
+        for bars in iter_bars(source, start, end, chunk_rows, sorted_input):
+            session = (bars['minute'] >= SESSION_FIRST_MINUTE) & (bars['minute'] <= SESSION_LAST_MINUTE)
+            bars[session].to_csv(f, columns=['caldt', *OHLCV], index=False, header=not daily)
+            n_intra += int(session.sum())
+            daily.append(bars.groupby(bars['caldt'].dt.date, sort=False)[OHLCV].agg(
+                {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}))
+    if not daily:
+        raise ValueError(f"[ERROR] No bars in {source} between {start or 'the start'} and {end or 'the end'}")
 
-# ========== CREATE spy_intra_data_2.csv ==========
-# Filter only between 09:30 and 15:59
-df_intra = df[
-    (df['caldt'].dt.time >= datetime.strptime("09:30", "%H:%M").time()) &
-    (df['caldt'].dt.time <= datetime.strptime("15:59", "%H:%M").time())
-].copy()
+    df_daily = _combine_daily(daily)
+    df_daily.to_csv(daily_path, index=False)
+    return n_intra, len(df_daily)
 
-df_intra.to_csv("spy_intra_data.csv", index=False)
-print("[INFO] File spy_intra_data.csv saved successfully.")
 
-# ========== CREATE spy_daily_data_2.csv ==========
-# Create a column with just the date
-df['date'] = df['caldt'].dt.date
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Alpaca 1-minute bars to spy_intra_data.csv / spy_daily_data.csv.")
+    parser.add_argument("--start", default=None, help="First day (YYYY-MM-DD); default: start of the file")
+    parser.add_argument("--end", default=None, help="Last day, inclusive (YYYY-MM-DD); default: end of the file")
+    parser.add_argument("--source", default=SOURCE_FILE)
+    parser.add_argument("--intra-output", default=INTRA_FILE)
+    parser.add_argument("--daily-output", default=DAILY_FILE)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--unsorted", action="store_true",
+                        help="Source is not in date order: read it all instead of seeking to --start")
+    args = parser.parse_args(argv)
 
-# Aggregate by date
-df_daily = df.groupby('date').agg({
-    'open': 'first',
-    'high': 'max',
-    'low': 'min',
-    'close': 'last',
-    'volume': 'sum'
-}).reset_index()
+    n_intra, n_days = convert(args.source, args.start, args.end, args.intra_output, args.daily_output,
+                              args.chunk_rows, not args.unsorted)
+    print(f"[INFO] File {args.intra_output} saved successfully ({n_intra} rows).")
+    print(f"[INFO] File {args.daily_output} saved successfully ({n_days} days).")
 
-df_daily.rename(columns={'date': 'caldt'}, inplace=True)
 
-df_daily.to_csv("spy_daily_data.csv", index=False)
-print("[INFO] File spy_daily_data.csv saved successfully.")
+if __name__ == "__main__":
+    main()
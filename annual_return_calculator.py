@@ -1,12 +1,20 @@
+import math
+
+MONTHS = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
+
+
+def annual_return(monthly_returns):
+    """Compound annual return (%) of monthly returns given in %."""
+    return (math.prod(1 + r / 100 for r in monthly_returns) - 1) * 100
+
+
 def calculate_annual_return():
-    months = ["January", "February", "March", "April", "May", "June",
-              "July", "August", "September", "October", "November", "December"]
-    
     returns = []
 
     print("Enter monthly returns in % (e.g., 3.5 for 3.5%):\n")
-    
-    for month in months:
+
+    for month in MONTHS:
         while True:
             try:
                 r = float(input(f"{month}: ").replace(",", "."))
@@ -15,11 +23,9 @@ def calculate_annual_return():
             except ValueError:
                 print("Invalid input. Please enter a valid number (e.g., 1.5, -2.3).")
 
-    # Calculate compound annual return
-    factors = [(1 + r / 100) for r in returns]
-    annual_return = (__import__('math').prod(factors)) - 1
     print("\n=== Result ===")
-    print(f"Compound annual return: {round(annual_return * 100, 2)}%")
+    print(f"Compound annual return: {round(annual_return(returns), 2)}%")
+
 
-# Run the function
-calculate_annual_return()
+if __name__ == "__main__":
+    calculate_annual_return()
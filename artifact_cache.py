@@ -0,0 +1,171 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+CACHE_DIR = '.cache'
+INDEX_FILE = 'index.json'
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+
+def content_key(**fields):
+    """Stable sha256 key for a set of descriptive fields (ticker, timespan, dates, page...)."""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_digest(path):
+    """sha256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Content-addressed store for raw vendor responses plus an artifact manifest.
+
+    Blobs live under <root>/objects/<key[:2]>/<key> and are evicted least
+    recently used first once their total size exceeds `max_bytes`. Artifacts
+    (files produced by a pipeline stage) are recorded with a hash of their
+    inputs and parameters so a stage can be skipped when nothing changed.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, INDEX_FILE)
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'blobs': {}, 'artifacts': {}, 'files': {}}
+
+    # === Raw responses ===
+    def _blob_path(self, key):
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def get(self, key):
+        """Cached bytes for `key`, or None."""
+        entry = self.index['blobs'].get(key)
+        if entry is None or not os.path.exists(self._blob_path(key)):
+            return None
+        entry['last_access'] = time.time()
+        self._save_index()
+        with open(self._blob_path(key), 'rb') as f:
+            return f.read()
+
+    def put(self, key, data, **meta):
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+        self.index['blobs'][key] = {'size': len(data), 'last_access': time.time(), 'meta': meta}
+        self.evict()
+
+    def get_json(self, key):
+        data = self.get(key)
+        return None if data is None else json.loads(data)
+
+    def put_json(self, key, value, **meta):
+        self.put(key, json.dumps(value).encode(), **meta)
+
+    def total_bytes(self):
+        return sum(entry['size'] for entry in self.index['blobs'].values())
+
+    def evict(self, max_bytes=None, older_than=None):
+        """Drop least recently used blobs until the cache fits in `max_bytes`.
+
+        With `older_than` (seconds), blobs not accessed for that long go as well.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        cutoff = time.time() - older_than if older_than is not None else -1
+        total = self.total_bytes()
+        removed = 0
+        for key, entry in sorted(self.index['blobs'].items(), key=lambda kv: kv[1]['last_access']):
+            if total <= max_bytes and entry['last_access'] >= cutoff:
+                break
+            if os.path.exists(self._blob_path(key)):
+                os.remove(self._blob_path(key))
+            total -= entry['size']
+            del self.index['blobs'][key]
+            removed += 1
+        self._save_index()
+        return removed
+
+    def clear(self):
+        return self.evict(max_bytes=0)
+
+    # === Derived artifacts ===
+    def digest(self, path):
+        """file_digest() remembered across runs while the file's size and mtime are unchanged."""
+        stat = os.stat(path)
+        entry = self.index['files'].get(os.path.abspath(path))
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': file_digest(path)}
+            self.index['files'][os.path.abspath(path)] = entry
+        return entry['digest']
+
+    def _fingerprint(self, inputs, params):
+        return content_key(inputs={p: self.digest(p) for p in sorted(inputs)}, params=params)
+
+    def record_artifact(self, path, inputs, params=None):
+        """Remember that `path` was produced from `inputs` (file paths) and `params`."""
+        self.index['artifacts'][path] = {
+            'fingerprint': self._fingerprint(inputs, params or {}),
+            'inputs': sorted(inputs),
+            'params': params or {},
+            'output_digest': self.digest(path),
+            'created': time.time(),
+        }
+        self._save_index()
+
+    def is_up_to_date(self, path, inputs, params=None):
+        """True when `path` exists unchanged and was built from identical inputs and params."""
+        entry = self.index['artifacts'].get(path)
+        if entry is None or not os.path.exists(path) or not all(os.path.exists(p) for p in inputs):
+            return False
+        return (entry['fingerprint'] == self._fingerprint(inputs, params or {})
+                and entry['output_digest'] == self.digest(path))
+
+    def _save_index(self):
+        with open(self.index_path + '.tmp', 'w') as f:
+            json.dump(self.index, f)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the local artifact cache.")
+    parser.add_argument("--root", default=CACHE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List cached responses and recorded artifacts")
+    p_prune = sub.add_parser("prune", help="Evict least recently used responses")
+    p_prune.add_argument("--max-mb", type=float, default=DEFAULT_MAX_BYTES / 1024 ** 2)
+    p_prune.add_argument("--older-than-days", type=float, default=None)
+    sub.add_parser("clear", help="Remove every cached response and artifact record")
+    args = parser.parse_args()
+
+    cache = ArtifactCache(args.root)
+    if args.command == "list":
+        for key, entry in sorted(cache.index['blobs'].items(), key=lambda kv: -kv[1]['last_access']):
+            accessed = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_access']))
+            print(f"{key[:12]}  {entry['size'] / 1024:10.1f} KB  {accessed}  {entry['meta']}")
+        print(f"[INFO] {len(cache.index['blobs'])} responses, {cache.total_bytes() / 1024 ** 2:.1f} MB")
+        for path, entry in cache.index['artifacts'].items():
+            print(f"{path}  <- {', '.join(entry['inputs'])}  params={entry['params']}")
+        return
+
+    if args.command == "prune":
+        older_than = args.older_than_days * 86400 if args.older_than_days is not None else None
+        removed = cache.evict(args.max_mb * 1024 ** 2, older_than)
+    else:
+        cache.index['artifacts'] = {}
+        removed = cache.clear()
+    print(f"[INFO] Removed {removed} responses, {cache.total_bytes() / 1024 ** 2:.1f} MB left")
+
+
+if __name__ == "__main__":
+    main()
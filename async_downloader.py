@@ -0,0 +1,179 @@
+import asyncio
+import os
+import random
+import time
+
+import pandas as pd
+import requests
+
+from artifact_cache import content_key
+
+# ===== CONFIGURATION =====
+BASE_URL = 'https://api.polygon.io'
+CHECKPOINT_DIR = '.download_checkpoints'
+CHUNK_DAYS = 90                    # calendar days per independent chunk
+MAX_CONCURRENCY = 8                # chunks fetched at the same time
+REQUESTS_PER_MINUTE = 5            # Polygon free tier
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0                 # seconds, doubled on every retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SESSION_START = 9 * 3600 + 30 * 60     # 09:30:00 in seconds since midnight
+SESSION_LAST_BAR = 15 * 3600 + 59 * 60  # 15:59:00
+EXCHANGE_TZ = 'America/New_York'
+BAR_COLUMNS = {'t': 't', 'o': 'open', 'h': 'high', 'l': 'low', 'c': 'close', 'v': 'volume'}
+
+
+class DownloadError(RuntimeError):
+    """Raised when a chunk cannot be fetched completely (never returns partial data)."""
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    A caller that finds the bucket empty reserves the next token (the balance
+    goes negative) and sleeps outside the lock until it is due, so waiters are
+    served in arrival order and never block each other's bookkeeping.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - 1
+            self.updated = now
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def split_date_range(start_date, end_date, chunk_days=CHUNK_DAYS):
+    """Split [start_date, end_date] into consecutive (from, to) ISO date pairs."""
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    chunks = []
+    while start <= end:
+        stop = min(start + pd.Timedelta(days=chunk_days - 1), end)
+        chunks.append((start.strftime('%Y-%m-%d'), stop.strftime('%Y-%m-%d')))
+        start = stop + pd.Timedelta(days=1)
+    return chunks
+
+
+def bars_to_frame(results, period):
+    """Convert raw Polygon aggregates to the caldt/OHLCV frame in one vectorized step.
+
+    Timestamps go from epoch milliseconds to naive US/Eastern, and minute bars
+    are restricted to the 09:30-15:59 session.
+    """
+    raw = pd.DataFrame(results, columns=list(BAR_COLUMNS)).rename(columns=BAR_COLUMNS)
+    caldt = (pd.to_datetime(raw['t'], unit='ms', utc=True)
+             .dt.tz_convert(EXCHANGE_TZ).dt.tz_localize(None))
+    df = raw.drop(columns='t')
+    df.insert(0, 'caldt', caldt)
+    if period == 'minute':
+        seconds = (caldt - caldt.dt.normalize()).dt.total_seconds()
+        df = df[(seconds >= SESSION_START) & (seconds <= SESSION_LAST_BAR)]
+    return df.reset_index(drop=True)
+
+
+def _checkpoint_path(checkpoint_dir, ticker, period, start, end):
+    return os.path.join(checkpoint_dir, f"{ticker}_{period}", f"{start}_{end}.csv")
+
+
+async def _get_json(session, url, bucket, max_retries, backoff_base):
+    """GET with token-bucket pacing, retries on transient failures and exponential backoff."""
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        try:
+            response = await asyncio.to_thread(session.get, url, timeout=30)
+        except requests.RequestException as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        else:
+            if response.status_code == 200:
+                return response.json()
+            error = f"HTTP {response.status_code}"
+            if response.status_code not in RETRY_STATUSES:
+                raise DownloadError(f"[ERROR] {error} for {url.split('apiKey=')[0]}")
+        if attempt < max_retries:
+            delay = backoff_base * 2 ** attempt * (1 + random.random())
+            print(f"[WARN] {error}; retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+    raise DownloadError(f"[ERROR] Giving up after {max_retries} retries: {error}")
+
+
+async def fetch_chunk(ticker, start, end, period, bucket, api_key, base_url=BASE_URL,
+                      checkpoint_dir=CHECKPOINT_DIR, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                      cache=None):
+    """Fetch every page of one date chunk, or load it from its checkpoint.
+
+    With an ArtifactCache, raw pages are served from / stored in the cache,
+    keyed by ticker, timespan, date range and page number. A chunk ending
+    today or later is still open: it is neither checkpointed nor cached, so
+    its partial bars are never reused.
+    """
+    path = _checkpoint_path(checkpoint_dir, ticker, period, start, end)
+    closed = pd.Timestamp(end).date() < pd.Timestamp.now(tz=EXCHANGE_TZ).date()
+    if not closed:
+        cache = None
+    elif os.path.exists(path):
+        return pd.read_csv(path)
+
+    url = (f'{base_url}/v2/aggs/ticker/{ticker}/range/1/{period}/{start}/{end}'
+           f'?adjusted=false&sort=asc&limit=50000&apiKey={api_key}')
+    results = []
+    page = 0
+    with requests.Session() as session:
+        while url:
+            key = content_key(ticker=ticker, timespan=period, start=start, end=end, page=page)
+            data = cache.get_json(key) if cache is not None else None
+            if data is None:
+                data = await _get_json(session, url, bucket, max_retries, backoff_base)
+                if cache is not None:
+                    cache.put_json(key, data, ticker=ticker, timespan=period, start=start, end=end, page=page)
+            results.extend(data.get('results', []))
+            page += 1
+            next_url = data.get('next_url')
+            url = f"{next_url}&apiKey={api_key}" if next_url else None
+
+    chunk = pd.DataFrame(results, columns=list(BAR_COLUMNS))
+    if closed:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        chunk.to_csv(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+    print(f"[INFO] {ticker} {period} {start} → {end}: {len(chunk)} bars")
+    return chunk
+
+
+async def fetch_polygon_data_async(ticker, start_date, end_date, period, api_key, base_url=BASE_URL,
+                                   chunk_days=CHUNK_DAYS, max_concurrency=MAX_CONCURRENCY,
+                                   requests_per_minute=REQUESTS_PER_MINUTE,
+                                   checkpoint_dir=CHECKPOINT_DIR, max_retries=MAX_RETRIES,
+                                   backoff_base=BACKOFF_BASE, cache=None):
+    """Minute or daily aggregates of `ticker` from Polygon.io.
+
+    The date range is split into independent chunks fetched concurrently under
+    a shared token bucket. Finished chunks are checkpointed, so rerunning after
+    an interruption only fetches what is missing. Any chunk that still fails
+    after retries raises DownloadError instead of returning partial data.
+    """
+    bucket = TokenBucket(requests_per_minute / 60, capacity=requests_per_minute)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(start, end):
+        async with semaphore:
+            return await fetch_chunk(ticker, start, end, period, bucket, api_key, base_url,
+                                     checkpoint_dir, max_retries, backoff_base, cache)
+
+    chunks = await asyncio.gather(*(run(s, e) for s, e in split_date_range(start_date, end_date, chunk_days)))
+    raw = pd.concat(chunks, ignore_index=True).drop_duplicates('t').sort_values('t')
+    return bars_to_frame(raw, period)
+
+
+def download(ticker, start_date, end_date, period, api_key, **kwargs):
+    """Blocking wrapper around fetch_polygon_data_async()."""
+    return asyncio.run(fetch_polygon_data_async(ticker, start_date, end_date, period, api_key, **kwargs))
@@ -0,0 +1,311 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+
+from instrumentation import span, traced
+from metrics import STATS, performance_metrics
+
+# === Defaults (also the backtest_strategy.py options) ===
+MINUTES_PER_SESSION = 390
+AUM_0 = 100000.0
+COMMISSION = 0.0035
+MIN_COMM_PER_ORDER = 0.35
+BAND_MULT = 1
+TRADE_FREQ = 30
+SIZING_TYPE = "vol_target"
+TARGET_VOL = 0.02
+MAX_LEVERAGE = 4
+
+# Decimals used when printing each entry of performance_stats()
+STATS_DECIMALS = {
+    'Total Return (%)': 1,
+    'Annualized Return (%)': 1,
+    'Annualized Volatility (%)': 1,
+    'Sharpe Ratio': 2,
+    'Hit Ratio (%)': 1,
+    'Max Drawdown (%)': 1,
+    'Alpha (%)': 2,
+    'Beta': 2,
+}
+
+# Columns of the processed data that build_day_arrays() reads
+DAY_ARRAY_COLUMNS = ['day', 'open', 'close', 'vwap', 'sigma_open', 'min_from_open', 'spy_dvol', 'dividend']
+
+# Dense (days x minutes) keys; every other key holds one value per day.
+# They are stored in the smallest exact dtype: int16 for whole numbers,
+# int32 for prices in whole cents, float32 when the float64 values survive the
+# round trip, float64 otherwise. minute_values() restores float64.
+MINUTE_KEYS = ['close', 'vwap', 'sigma_open', 'min_from_open']
+PRICE_SCALE = 100
+
+
+def load_processed_data(path="spy_processed_data.csv", columns=DAY_ARRAY_COLUMNS):
+    """Load the processed minute data (only `columns`; all with None) with `day` as datetime64."""
+    return pd.read_csv(path, usecols=columns, parse_dates=['day'])
+
+
+def load_daily_returns(path="spy_daily_data.csv"):
+    """Close-to-close SPY returns indexed by datetime.date."""
+    spy_daily_data = pd.read_csv(path, parse_dates=['caldt'])
+    spy_daily_data['caldt'] = spy_daily_data['caldt'].dt.date
+    spy_daily_data.set_index('caldt', inplace=True)
+    return spy_daily_data['close'].diff() / spy_daily_data['close'].shift()
+
+
+@traced('build_day_arrays')
+def build_day_arrays(df, compact=True, width=MINUTES_PER_SESSION):
+    """Reshape processed minute data into dense (days x minutes) NumPy arrays.
+
+    Bars are packed by their position inside the day (not by clock minute), so
+    shifts and diffs behave exactly like the per-day Series in the original loop.
+    Rows have at least `width` slots (fewer for coarser bars, see bar_pyramid.py),
+    padded with NaN past the last bar of each day. With `compact`, the
+    minute arrays are stored with compact_minutes(); read them through
+    minute_values().
+    """
+    codes, days = pd.factorize(df['day'], sort=False)
+    days = days.date if isinstance(days, pd.DatetimeIndex) else np.asarray(days)
+    n_rows = len(codes)
+    n_days = len(days)
+
+    n_bars = np.bincount(codes, minlength=n_days)
+    first_row = np.concatenate(([0], np.cumsum(n_bars)[:-1]))
+    last_row = first_row + n_bars - 1
+    position = np.arange(n_rows) - first_row[codes]
+    width = max(width, int(n_bars.max()))
+
+    def dense(column):
+        out = np.full((n_days, width), np.nan)
+        out[codes, position] = df[column].to_numpy(dtype=float)
+        return out
+
+    close = dense('close')
+    sigma_open = dense('sigma_open')
+
+    open_price = df['open'].to_numpy(dtype=float)[first_row]
+    last_close = close[np.arange(n_days), n_bars - 1]
+    prev_close = np.concatenate(([np.nan], last_close[:-1]))
+    dividend = df['dividend'].to_numpy(dtype=float)[last_row]
+
+    arrays = {
+        'days': days,
+        'n_bars': n_bars,
+        'close': close,
+        'vwap': dense('vwap'),
+        'sigma_open': sigma_open,
+        'min_from_open': dense('min_from_open'),
+        'open_price': open_price,
+        'prev_close': prev_close,
+        'dividend': dividend,
+        'prev_close_adjusted': prev_close - dividend,
+        'spy_dvol': df['spy_dvol'].to_numpy(dtype=float)[first_row],
+        'has_sigma': ~np.isnan(sigma_open).all(axis=1),
+    }
+    if compact:
+        padding = np.arange(width) >= n_bars[:, None]
+        for key in MINUTE_KEYS:
+            arrays[key] = compact_minutes(arrays[key], padding)
+    return arrays
+
+
+def compact_minutes(values, padding):
+    """Smallest dtype that stores a dense minute array exactly (see MINUTE_KEYS).
+
+    Only the slots inside the days are checked; `padding` slots are restored
+    as NaN by minute_values() for the integer encodings.
+    """
+    inside = values[~padding]
+    if inside.size and not np.isnan(inside).any():
+        if np.array_equal(np.round(inside), inside) and np.abs(inside).max() < 2 ** 15:
+            out = np.zeros(values.shape, dtype=np.int16)
+            out[~padding] = inside
+            return out
+        cents = np.round(inside * PRICE_SCALE)
+        if np.array_equal(cents / PRICE_SCALE, inside) and np.abs(cents).max() < 2 ** 31:
+            out = np.zeros(values.shape, dtype=np.int32)
+            out[~padding] = cents
+            return out
+    single = values.astype(np.float32)
+    if np.array_equal(single.astype(np.float64), values, equal_nan=True):
+        return single
+    return values
+
+
+def minute_values(arrays, key):
+    """Dense minute array `key` as float64 (NaN past each day's last bar), whatever its storage."""
+    values = arrays[key]
+    if values.dtype == np.float64:
+        return values
+    if values.dtype == np.float32:
+        return values.astype(np.float64)
+    out = values / PRICE_SCALE if values.dtype == np.int32 else values.astype(np.float64)
+    out[np.arange(out.shape[-1]) >= np.asarray(arrays['n_bars'])[:, None]] = np.nan
+    return out
+
+
+def day_table(arrays):
+    """Day-level fields (one row per day) as a DataFrame."""
+    keys = ['n_bars', 'open_price', 'prev_close', 'dividend', 'prev_close_adjusted', 'spy_dvol', 'has_sigma']
+    return pd.DataFrame({key: np.asarray(arrays[key]) for key in keys if key in arrays}, index=arrays['days'])
+
+
+def save_day_arrays(arrays, directory):
+    """Write day arrays as one .npy file per key so they can be memory-mapped."""
+    os.makedirs(directory, exist_ok=True)
+    for key, value in arrays.items():
+        if key == 'days':
+            value = np.asarray(value, dtype='datetime64[D]')
+        np.save(os.path.join(directory, f"{key}.npy"), value)
+
+
+def load_day_arrays(directory, mmap_mode='r'):
+    """Load arrays written by save_day_arrays(), memory-mapped read-only by default."""
+    arrays = {}
+    for filename in sorted(os.listdir(directory)):
+        key, ext = os.path.splitext(filename)
+        if ext == '.npy':
+            arrays[key] = np.load(os.path.join(directory, filename), mmap_mode=mmap_mode)
+    arrays['days'] = np.asarray(arrays['days']).astype(object)
+    return arrays
+
+
+def compute_bands(arrays, band_mult=BAND_MULT):
+    """Upper/lower bands for every day and minute.
+
+    `band_mult` may be a scalar or an array shaped (params, 1, 1), in which case
+    the bands gain a leading parameter axis.
+    """
+    open_price = arrays['open_price'][:, None]
+    prev_close_adjusted = arrays['prev_close_adjusted'][:, None]
+    sigma_open = minute_values(arrays, 'sigma_open')
+    UB = np.maximum(open_price, prev_close_adjusted) * (1 + band_mult * sigma_open)
+    LB = np.minimum(open_price, prev_close_adjusted) * (1 - band_mult * sigma_open)
+    return UB, LB
+
+
+def compute_signals(arrays, band_mult=BAND_MULT):
+    """Raw +1/0/-1 signals: price beyond a band and on the same side of VWAP."""
+    UB, LB = compute_bands(arrays, band_mult)
+    close = minute_values(arrays, 'close')
+    vwap = minute_values(arrays, 'vwap')
+    signals = np.zeros(UB.shape, dtype=np.int8)
+    signals[(close > UB) & (close > vwap)] = 1
+    signals[(close < LB) & (close < vwap)] = -1
+    return signals
+
+
+def compute_exposure(arrays, signals, trade_freq=TRADE_FREQ):
+    """Sample signals every `trade_freq` minutes, hold them, and lag by one bar.
+
+    Equivalent to the original forward fill that resets on zero followed by
+    `shift(1).fillna(0)`: each bar holds the signal of the latest gate strictly
+    before it, or 0 before the first gate of the day. `trade_freq` may be an
+    array shaped (params, 1, 1) matching a leading parameter axis of `signals`.
+    """
+    width = signals.shape[-1]
+    columns = np.arange(width, dtype=np.int16)
+    gate = minute_values(arrays, 'min_from_open') % trade_freq == 0
+    last_gate = np.maximum.accumulate(np.where(gate, columns, -1), axis=-1)
+    held = np.take_along_axis(signals, np.maximum(last_gate, 0), axis=-1)
+    held[last_gate < 0] = 0
+
+    exposure = np.zeros_like(held)
+    exposure[..., 1:] = held[..., :-1]
+    exposure[..., columns >= arrays['n_bars'][:, None]] = 0
+    return exposure
+
+
+def daily_pnl_per_share(arrays, exposure):
+    """Per-share gross PnL and number of position changes for every day.
+
+    Rows are summed over their true length only, so NumPy's pairwise summation
+    sees the same operands as the original per-day `np.sum`.
+    """
+    close = minute_values(arrays, 'close')
+    steps = np.diff(close, axis=-1, prepend=close[:, :1])
+    steps[np.isnan(steps)] = 0
+    weighted = exposure * steps
+
+    n_bars = arrays['n_bars']
+    pnl_per_share = np.zeros(weighted.shape[:-1])
+    for n in np.unique(n_bars):
+        rows = n_bars == n
+        pnl_per_share[..., rows] = weighted[..., rows, :n].sum(axis=-1)
+
+    trades_count = np.abs(np.diff(exposure, axis=-1, append=0)).sum(axis=-1)
+    return pnl_per_share, trades_count
+
+
+def compound(arrays, pnl_per_share, trades_count, AUM_0=AUM_0, commission=COMMISSION,
+             min_comm_per_order=MIN_COMM_PER_ORDER, sizing_type=SIZING_TYPE,
+             target_vol=TARGET_VOL, max_leverage=MAX_LEVERAGE, seed_aum=None):
+    """Size, charge commissions and compound AUM day by day.
+
+    Shares are rounded from the previous day's AUM, so this recurrence is
+    inherently sequential; it runs over plain floats, one step per day.
+    Days that are not traded hold AUM_0; `seed_aum` replaces it on row 0
+    only, which is never traded (a run continued from an earlier one).
+    """
+    n_days = len(arrays['days'])
+    open_price = arrays['open_price'].tolist()
+    spy_dvol = arrays['spy_dvol'].tolist()
+    has_sigma = arrays['has_sigma'].tolist()
+    pnl_per_share = pnl_per_share.tolist()
+    trades_count = trades_count.tolist()
+
+    aum = [AUM_0] * n_days
+    if seed_aum is not None and n_days:
+        aum[0] = seed_aum
+    ret = [math.nan] * n_days
+    shares_held = [0] * n_days
+
+    for d in range(1, n_days):
+        if not has_sigma[d]:
+            continue
+        prev_aum = aum[d - 1]
+        spx_vol = spy_dvol[d]
+
+        if sizing_type == "vol_target":
+            if math.isnan(spx_vol) or spx_vol == 0:
+                shares = round(prev_aum / open_price[d] * max_leverage)
+            else:
+                shares = round(prev_aum / open_price[d] * min(target_vol / spx_vol, max_leverage))
+        else:
+            shares = round(prev_aum / open_price[d])
+
+        gross_pnl = pnl_per_share[d] * shares
+        commission_paid = trades_count[d] * max(min_comm_per_order, commission * shares)
+        net_pnl = gross_pnl - commission_paid
+
+        aum[d] = prev_aum + net_pnl
+        ret[d] = net_pnl / prev_aum
+        shares_held[d] = shares
+
+    return np.array(ret), np.array(aum), np.array(shares_held)
+
+
+def run_backtest(arrays, band_mult=BAND_MULT, trade_freq=TRADE_FREQ, AUM_0=AUM_0,
+                 commission=COMMISSION, min_comm_per_order=MIN_COMM_PER_ORDER,
+                 sizing_type=SIZING_TYPE, target_vol=TARGET_VOL, max_leverage=MAX_LEVERAGE, seed_aum=None):
+    """Run the full strategy on dense day arrays and return daily ret/AUM/shares."""
+    with span('backtest.signals'):
+        signals = compute_signals(arrays, band_mult)
+    with span('backtest.exposure'):
+        exposure = compute_exposure(arrays, signals, trade_freq)
+    with span('backtest.pnl'):
+        pnl_per_share, trades_count = daily_pnl_per_share(arrays, exposure)
+    with span('backtest.compound') as sp:
+        ret, aum, shares = compound(arrays, pnl_per_share, trades_count, AUM_0=AUM_0,
+                                    commission=commission, min_comm_per_order=min_comm_per_order,
+                                    sizing_type=sizing_type, target_vol=target_vol,
+                                    max_leverage=max_leverage, seed_aum=seed_aum)
+        sp.add(days=len(ret))
+    return pd.DataFrame({'ret': ret, 'AUM': aum, 'shares': shares}, index=arrays['days'])
+
+
+def performance_stats(strat):
+    """Unrounded strategy statistics; `strat` needs `ret`, `AUM` and `ret_spy` columns (see metrics.py)."""
+    with span('stats'):
+        stats = performance_metrics(strat['ret'], strat['ret_spy'], strat['AUM'])
+    return {key: stats[key] for key in STATS}
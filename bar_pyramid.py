@@ -0,0 +1,233 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (BAND_MULT, MINUTES_PER_SESSION, TRADE_FREQ, build_day_arrays, compound,
+                             compute_exposure, compute_signals, daily_pnl_per_share, load_processed_data,
+                             minute_values)
+from data_store import DEFAULT_TICKER, load_table, read_day_arrays, table_name, write_day_arrays, write_table
+from instrumentation import add_trace_arguments, configure, span
+from stage_cache import data_version
+
+RESOLUTIONS = [5, 15, 30]       # bar sizes (minutes) stored next to the 1-minute data
+
+
+def level_name(ticker, resolution):
+    """Store name of a coarser level, e.g. ('SPY', 30) -> 'spy_processed_data_30min'."""
+    return f"{table_name(ticker, 'processed_data')}_{resolution}min"
+
+
+def check_resolution(trade_freqs, resolution):
+    """Raise unless every trade_freq gate falls on the last minute of a `resolution`-minute bar."""
+    if np.any(np.mod(trade_freqs, resolution)):
+        raise ValueError(f"[ERROR] trade_freq {sorted(set(np.atleast_1d(trade_freqs).tolist()))} is not "
+                         f"a multiple of the {resolution}-minute resolution")
+
+
+def bar_starts(day, min_from_open, resolution):
+    """First row of every `resolution`-minute bar of time-ordered minute rows.
+
+    A day's bar k holds minutes (k-1)*resolution+1 .. k*resolution from the
+    open (min_from_open counts from 1), so every bar ends on a multiple of
+    `resolution`, where a trade_freq gate can fire.
+    """
+    codes = pd.factorize(day, sort=False)[0]
+    bucket = np.ceil(np.asarray(min_from_open, dtype=float) / resolution)
+    new = np.ones(len(codes), dtype=bool)
+    new[1:] = (codes[1:] != codes[:-1]) | (bucket[1:] != bucket[:-1])
+    return np.flatnonzero(new)
+
+
+def aggregate_bars(df, resolution):
+    """Processed minute rows rolled up into `resolution`-minute bars.
+
+    OHLCV take the first open, highest high, lowest low, last close and total
+    volume. Every other column is the value of the bar's last minute: the VWAP
+    cumulated since the open, move_open and the per-slot sigma_open of the
+    minute that closes the bar, which is what the strategy reads at a gate
+    (a VWAP rebuilt from the coarse bars themselves would not be).
+    """
+    starts = bar_starts(df['day'], df['min_from_open'], resolution)
+    ends = np.append(starts[1:], len(df)) - 1
+    bars = df.iloc[ends].reset_index(drop=True)
+    if 'open' in df:
+        bars['open'] = df['open'].to_numpy()[starts]
+    for column, reduce in [('high', np.maximum), ('low', np.minimum), ('volume', np.add)]:
+        if column in df:
+            bars[column] = reduce.reduceat(df[column].to_numpy(dtype=float), starts)
+    return bars
+
+
+def build_level(df, resolution, bars=None):
+    """Day arrays of the `resolution`-minute bars of processed minute data.
+
+    Days trade when any of their minutes has a sigma_open, as on the minute
+    arrays, not only when a bar end has one.
+    """
+    bars = aggregate_bars(df, resolution) if bars is None else bars
+    level = build_day_arrays(bars, width=-(-MINUTES_PER_SESSION // resolution))
+    codes, days = pd.factorize(df['day'], sort=False)
+    level['has_sigma'] = np.bincount(codes, weights=df['sigma_open'].notna().to_numpy(dtype=float),
+                                     minlength=len(days)) > 0
+    return level
+
+
+def write_levels(df, ticker, resolutions=RESOLUTIONS, arrays=None):
+    """Store every level of a symbol's processed minute data (table and day arrays).
+
+    Each level records the data version of the minute arrays it came from, so
+    load_level() can tell when it is out of date.
+    """
+    version = data_version(arrays if arrays is not None else build_day_arrays(df))
+    for resolution in resolutions:
+        name = level_name(ticker, resolution)
+        with span('pyramid.level', ticker=ticker, resolution=resolution) as sp:
+            bars = aggregate_bars(df, resolution)
+            write_table(bars, name, date_column='day', csv_index=True)
+            level = build_level(df, resolution, bars)
+            level['source_version'] = np.array(version)
+            write_day_arrays(level, name)
+            sp.add(bars=len(bars))
+        print(f"[INFO] {resolution}-minute bars saved in '{name}' ({len(bars)} bars)")
+
+
+def load_level(arrays, trade_freq, resolution=1, ticker=DEFAULT_TICKER):
+    """Stored `resolution`-minute level to backtest `trade_freq` on (the minute `arrays` for 1).
+
+    Levels are opt-in: daily returns on coarse bars match the minute run only
+    up to float rounding. A level built from other minute data than `arrays`
+    is refused.
+    """
+    if resolution == 1:
+        return arrays
+    check_resolution(trade_freq, resolution)
+    name = level_name(ticker, resolution)
+    level = read_day_arrays(name)
+    if level is None:
+        raise ValueError(f"[ERROR] No stored {resolution}-minute level for {ticker}; "
+                         f"run prepare_indicators.py --resolutions {resolution}")
+    if 'source_version' not in level or str(level['source_version']) != data_version(arrays):
+        raise ValueError(f"[ERROR] '{name}' is out of date; rerun prepare_indicators.py --resolutions")
+    return level
+
+
+def sweep_arrays(df, trade_freqs, resolution=1):
+    """Day arrays of processed minute data, or of its `resolution`-minute bars."""
+    check_resolution(trade_freqs, resolution)
+    if resolution == 1:
+        return build_day_arrays(df)
+    print(f"[INFO] Backtesting on {resolution}-minute bars")
+    return build_level(df, resolution)
+
+
+def minute_slots(arrays, resolution):
+    """Slot in the `resolution`-minute level of every minute-array slot (-1 past the last bar)."""
+    bucket = np.ceil(minute_values(arrays, 'min_from_open') / resolution)
+    new = np.ones(bucket.shape, dtype=bool)
+    new[:, 1:] = bucket[:, 1:] != bucket[:, :-1]
+    slots = np.cumsum(new, axis=1) - 1
+    slots[np.arange(bucket.shape[1]) >= np.asarray(arrays['n_bars'])[:, None]] = -1
+    return slots
+
+
+def _timed_backtest(arrays, band_mult, trade_freq):
+    start = time.perf_counter()
+    exposure = compute_exposure(arrays, compute_signals(arrays, band_mult), trade_freq)
+    pnl_per_share, trades_count = daily_pnl_per_share(arrays, exposure)
+    ret = compound(arrays, pnl_per_share, trades_count)[0]
+    return exposure, trades_count, ret, time.perf_counter() - start
+
+
+def check_level(arrays, level, resolution, band_mult=BAND_MULT, trade_freq=TRADE_FREQ):
+    """Backtest the minute arrays and a level with the same parameters and compare them.
+
+    'decisions' holds when the position of every minute bar is the one of its
+    coarse bar, 'trades' when every day has the same position changes. Daily
+    returns differ only by float rounding (fewer price steps are summed);
+    the largest difference is reported with both runtimes.
+    """
+    check_resolution(trade_freq, resolution)
+    exposure, trades_count, ret, minute_seconds = _timed_backtest(arrays, band_mult, trade_freq)
+    coarse, coarse_count, coarse_ret, coarse_seconds = _timed_backtest(level, band_mult, trade_freq)
+
+    slots = minute_slots(arrays, resolution)
+    aligned = (np.array_equal(np.asarray(arrays['days']), np.asarray(level['days']))
+               and np.array_equal(np.asarray(level['n_bars']), slots.max(axis=1) + 1))
+    decisions = trades = False
+    max_diff = np.nan
+    if aligned:
+        expanded = np.take_along_axis(coarse, np.maximum(slots, 0), axis=1)
+        expanded[slots < 0] = 0
+        decisions = np.array_equal(expanded, exposure)
+        trades = np.array_equal(coarse_count, trades_count)
+        max_diff = np.nanmax(np.abs(coarse_ret - ret), initial=0.0)
+    return {
+        'resolution': resolution,
+        'band_mult': band_mult,
+        'trade_freq': trade_freq,
+        'bars (%)': np.sum(level['n_bars']) / np.sum(arrays['n_bars']) * 100,
+        'decisions': decisions,
+        'trades': trades,
+        'max |ret diff|': max_diff,
+        'minute (ms)': minute_seconds * 1000,
+        'coarse (ms)': coarse_seconds * 1000,
+    }
+
+
+def _processed_data(ticker):
+    name = table_name(ticker, 'processed_data')
+    return load_table(name, f"{name}.csv", index_col=0, parse_dates=['day'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coarser bar levels (5/15/30 minutes) of the processed data.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="Store the levels of already processed data")
+    p_build.add_argument("--tickers", nargs="+", default=[DEFAULT_TICKER])
+    p_build.add_argument("--resolutions", type=int, nargs="+", default=RESOLUTIONS)
+    add_trace_arguments(p_build)
+    p_check = sub.add_parser("check", help="Compare backtests on every level with the 1-minute backtest")
+    p_check.add_argument("--ticker", default=DEFAULT_TICKER)
+    p_check.add_argument("--resolutions", type=int, nargs="+", default=RESOLUTIONS)
+    p_check.add_argument("--band-mult", type=float, nargs="+", default=[BAND_MULT])
+    p_check.add_argument("--trade-freq", type=int, nargs="+", default=[5, 15, TRADE_FREQ, 60])
+    add_trace_arguments(p_check)
+    args = parser.parse_args(argv)
+    configure(args)
+
+    if args.command == "build":
+        for ticker in args.tickers:
+            write_levels(_processed_data(ticker), ticker, args.resolutions)
+        return
+
+    name = table_name(args.ticker, 'processed_data')
+    arrays = read_day_arrays(name)
+    df = None
+    if arrays is None:
+        df = load_processed_data(f"{name}.csv")
+        arrays = build_day_arrays(df)
+    rows = []
+    for resolution in args.resolutions:
+        level = read_day_arrays(level_name(args.ticker, resolution))
+        if level is None:
+            df = _processed_data(args.ticker) if df is None else df
+            level = build_level(df, resolution)
+            print(f"[INFO] No stored {resolution}-minute level; checking one built in memory")
+        rows += [check_level(arrays, level, resolution, band_mult, trade_freq)
+                 for band_mult in args.band_mult for trade_freq in args.trade_freq if trade_freq % resolution == 0]
+    if not rows:
+        raise ValueError("[ERROR] No trade_freq is a multiple of the chosen resolutions")
+
+    report = pd.DataFrame(rows)
+    print(f"\n=== {args.ticker}: bar levels vs 1-minute backtest ===")
+    print(report.round({'bars (%)': 1, 'minute (ms)': 1, 'coarse (ms)': 1}).to_string(index=False))
+    if not (report['decisions'] & report['trades']).all():
+        print("[ERROR] A level takes different trade decisions than the 1-minute data")
+        raise SystemExit(1)
+    print(f"[INFO] Same trade decisions on every level ({len(report)} runs)")
+
+
+if __name__ == "__main__":
+    main()
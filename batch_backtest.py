@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (AUM_0, BAND_MULT, COMMISSION, MAX_LEVERAGE, MIN_COMM_PER_ORDER,
+                             SIZING_TYPE, TARGET_VOL, TRADE_FREQ, compute_exposure,
+                             compute_signals, daily_pnl_per_share)
+
+# Default memory budget for one broadcast chunk (params x days x minutes)
+DEFAULT_MAX_BYTES = 1 << 30
+
+# Rough number of float64-sized (days x minutes) temporaries alive per parameter
+# pair while computing bands, signals, exposure and the weighted price steps
+_TEMPS_PER_PAIR = 6
+
+BATCH_DEFAULTS = {
+    'band_mult': BAND_MULT,
+    'trade_freq': TRADE_FREQ,
+    'AUM_0': AUM_0,
+    'commission': COMMISSION,
+    'min_comm_per_order': MIN_COMM_PER_ORDER,
+    'sizing_type': SIZING_TYPE,
+    'target_vol': TARGET_VOL,
+    'max_leverage': MAX_LEVERAGE,
+}
+
+
+def make_param_table(params):
+    """Normalize a dict of equal-length vectors (scalars broadcast) into a DataFrame."""
+    unknown = set(params) - set(BATCH_DEFAULTS)
+    if unknown:
+        raise ValueError(f"[ERROR] Unknown batch parameters: {sorted(unknown)}")
+    lengths = {len(v) for v in params.values() if np.ndim(v) == 1}
+    if len(lengths) > 1:
+        raise ValueError(f"[ERROR] Parameter vectors have different lengths: {sorted(lengths)}")
+    n = lengths.pop() if lengths else 1
+    table = {name: params.get(name, default) for name, default in BATCH_DEFAULTS.items()}
+    return pd.DataFrame({name: list(v) if np.ndim(v) == 1 else [v] * n for name, v in table.items()})
+
+
+def signal_stage_batch(arrays, pairs, max_bytes=DEFAULT_MAX_BYTES):
+    """Per-share PnL and trade counts for every (band_mult, trade_freq) pair.
+
+    Pairs are evaluated by broadcasting over a leading parameter axis, in
+    chunks sized so each (chunk x days x minutes) pass stays under `max_bytes`.
+    """
+    n_days, width = arrays['close'].shape
+    per_pair = n_days * width * 8 * _TEMPS_PER_PAIR
+    chunk = max(1, max_bytes // per_pair)
+
+    band_mult = pairs['band_mult'].to_numpy(dtype=float)
+    trade_freq = pairs['trade_freq'].to_numpy(dtype=float)
+    pnl_per_share = np.empty((len(pairs), n_days))
+    trades_count = np.empty((len(pairs), n_days))
+
+    for start in range(0, len(pairs), chunk):
+        stop = min(start + chunk, len(pairs))
+        signals = compute_signals(arrays, band_mult[start:stop, None, None])
+        exposure = compute_exposure(arrays, signals, trade_freq[start:stop, None, None])
+        del signals
+        pnl_per_share[start:stop], trades_count[start:stop] = daily_pnl_per_share(arrays, exposure)
+
+    return pnl_per_share, trades_count
+
+
+def compound_batch(arrays, pnl_per_share, trades_count, table, seed_aum=None):
+    """Vectorized counterpart of backtest_engine.compound() across parameter sets.
+
+    `pnl_per_share` and `trades_count` are (params x days); the day loop stays
+    sequential but every step updates all parameter sets at once. `seed_aum`
+    (one value or one per row) replaces AUM_0 on day 0, as in compound().
+    """
+    n_params, n_days = pnl_per_share.shape
+    open_price = arrays['open_price']
+    spy_dvol = arrays['spy_dvol']
+    has_sigma = arrays['has_sigma']
+
+    AUM_0 = table['AUM_0'].to_numpy(dtype=float)
+    commission = table['commission'].to_numpy(dtype=float)
+    min_comm_per_order = table['min_comm_per_order'].to_numpy(dtype=float)
+    vol_target = (table['sizing_type'] == "vol_target").to_numpy()
+    target_vol = table['target_vol'].to_numpy(dtype=float)
+    max_leverage = table['max_leverage'].to_numpy(dtype=float)
+
+    aum = np.empty((n_days, n_params))
+    aum[:] = AUM_0
+    if seed_aum is not None and n_days:
+        aum[0] = seed_aum
+    ret = np.full((n_days, n_params), np.nan)
+
+    for d in range(1, n_days):
+        if not has_sigma[d]:
+            continue
+        prev_aum = aum[d - 1]
+        spx_vol = spy_dvol[d]
+
+        if np.isnan(spx_vol) or spx_vol == 0:
+            leverage = max_leverage
+        else:
+            leverage = np.minimum(target_vol / spx_vol, max_leverage)
+        notional = prev_aum / open_price[d]
+        shares = np.round(np.where(vol_target, notional * leverage, notional))
+
+        gross_pnl = pnl_per_share[:, d] * shares
+        commission_paid = trades_count[:, d] * np.maximum(min_comm_per_order, commission * shares)
+        net_pnl = gross_pnl - commission_paid
+
+        aum[d] = prev_aum + net_pnl
+        ret[d] = net_pnl / prev_aum
+
+    return ret, aum
+
+
+def run_batch(arrays, params, max_bytes=DEFAULT_MAX_BYTES):
+    """Evaluate many parameter sets in one broadcast pass.
+
+    `params` maps parameter names to equal-length vectors (scalars broadcast);
+    missing names take the backtest_strategy.py defaults. Returns the parameter
+    table plus (days x params) DataFrames of daily returns and AUM whose columns
+    are the table's row numbers. Results match run_backtest() exactly.
+    """
+    table = make_param_table(params)
+    pairs = table[['band_mult', 'trade_freq']].drop_duplicates().reset_index(drop=True)
+    pair_of = table.merge(pairs.reset_index(), on=['band_mult', 'trade_freq'], how='left')['index']
+
+    pnl_per_share, trades_count = signal_stage_batch(arrays, pairs, max_bytes)
+    rows = pair_of.to_numpy()
+    ret, aum = compound_batch(arrays, pnl_per_share[rows], trades_count[rows], table)
+
+    index = arrays['days']
+    return table, pd.DataFrame(ret, index=index), pd.DataFrame(aum, index=index)
@@ -0,0 +1,243 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import BAND_MULT, TRADE_FREQ, build_day_arrays, load_processed_data, run_backtest
+from data_store import read_day_arrays, table_name, write_day_arrays
+from prepare_indicators import compute_indicators
+from synthetic_data import DEFAULT_SEED, DEFAULT_START, generate_symbol, synthetic_tickers
+from trade_log import extract_trades
+
+BASELINE_FILE = "benchmark_baseline.json"
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.20        # flag a stage when it gets this much slower (or bigger) than its baseline
+MIN_SECONDS = 0.05              # stages faster than this are too noisy to flag on time
+
+STAGES = ['indicators', 'load_csv', 'build_arrays', 'load_store', 'backtest', 'trade_log', 'metrics', 'startup']
+MOMENTUM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "momentum.py")
+STARTUP_COMMAND = ['backtest', '--no-plot']
+HEAVY_MODULES = ['matplotlib', 'requests', 'statsmodels']
+
+
+def measure(func, *args, repeat=DEFAULT_REPEAT):
+    """Best wall time over `repeat` calls, then the traced peak of one more call.
+
+    Memory is traced in a separate call because tracemalloc slows down
+    allocation-heavy code. Returns (seconds, peak bytes, result).
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(seconds), peak, result
+
+
+def _materialize(name, root):
+    return {key: np.array(value) for key, value in read_day_arrays(name, root).items()}
+
+
+def _check_results(directory):
+    """check_results.py (without the chart) on the trades/minute data in `directory`."""
+    import check_results
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_results.main(['--no-plot'])
+    finally:
+        os.chdir(cwd)
+
+
+def cold_start(directory, repeat=DEFAULT_REPEAT):
+    """Best wall time and peak RSS (MB) of `momentum.py backtest --no-plot` in a fresh interpreter.
+
+    Imports are part of the measurement. One more run with -X importtime
+    lists the top-level packages loaded; returns (seconds, peak MB, packages).
+    """
+    command = [sys.executable, MOMENTUM, *STARTUP_COMMAND]
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=directory, check=True, stdout=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    try:
+        import resource
+        peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    except ImportError:
+        peak_mb = np.nan
+    imports = subprocess.run([sys.executable, '-X', 'importtime', *command[1:]], cwd=directory, check=True,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    packages = {line.rsplit('|', 1)[-1].strip().split('.')[0]
+                for line in imports.splitlines() if line.startswith('import time:')}
+    return min(seconds), peak_mb, packages
+
+
+def run_benchmarks(tickers, years, start=DEFAULT_START, seed=DEFAULT_SEED, repeat=DEFAULT_REPEAT, stages=STAGES):
+    """Time and memory-profile each pipeline stage on synthetic data.
+
+    Symbols are generated and processed one at a time in a scratch directory,
+    so memory stays bounded by one symbol; stage times are summed over the
+    symbols and peaks are the largest over the symbols. check_results.py
+    (metrics) and the cold start of `momentum.py backtest --no-plot` (startup,
+    peak RSS of the child process) run once, on the first symbol. Returns one
+    row per stage.
+    """
+    totals = {stage: {'seconds': 0.0, 'peak_mb': 0.0} for stage in stages}
+    rows = 0
+
+    def record(stage, func, *args):
+        if stage not in totals:
+            return func(*args)
+        seconds, peak, result = measure(func, *args, repeat=repeat)
+        totals[stage]['seconds'] += seconds
+        totals[stage]['peak_mb'] = max(totals[stage]['peak_mb'], peak / 2 ** 20)
+        return result
+
+    with tempfile.TemporaryDirectory(prefix="momentum_bench_") as directory:
+        root = os.path.join(directory, "market_data")
+        for i, ticker in enumerate(tickers):
+            intra, daily, dividends = generate_symbol(ticker, start, years, seed)
+            rows += len(intra)
+
+            processed = record('indicators', compute_indicators, intra, dividends)
+            name = table_name(ticker, 'processed_data')
+            csv_path = os.path.join(directory, f"{name}.csv")
+            if 'load_csv' in totals:
+                processed.to_csv(csv_path)
+                processed = record('load_csv', load_processed_data, csv_path)
+                os.remove(csv_path)
+
+            arrays = record('build_arrays', build_day_arrays, processed)
+            del processed
+            if 'load_store' in totals:
+                write_day_arrays(arrays, name, root)
+                arrays = record('load_store', _materialize, name, root)
+
+            strat = record('backtest', run_backtest, arrays)
+            trades = record('trade_log', extract_trades, arrays, strat, BAND_MULT, TRADE_FREQ)
+
+            if i == 0 and 'metrics' in totals:
+                trades.to_csv(os.path.join(directory, "trades.csv"), index=False)
+                intra.to_csv(os.path.join(directory, "spy_intra_data.csv"), index=False)
+                record('metrics', _check_results, directory)
+            if i == 0 and 'startup' in totals:
+                daily.to_csv(os.path.join(directory, f"{table_name(ticker, 'daily_data')}.csv"), index=False)
+                write_day_arrays(arrays, name, root)
+                seconds, peak_mb, packages = cold_start(directory, repeat)
+                totals['startup'].update(seconds=seconds, peak_mb=peak_mb)
+                heavy = [package for package in HEAVY_MODULES if package in packages]
+                print(f"[INFO] {' '.join(STARTUP_COMMAND)}: {len(packages)} top-level packages imported, "
+                      f"heavy: {', '.join(heavy) or 'none'}")
+            print(f"[INFO] {ticker}: {len(arrays['days'])} days, {len(intra)} bars, {len(trades)} trades")
+            del intra, daily, arrays, strat, trades
+
+    table = pd.DataFrame(totals).T.rename_axis('stage')
+    table['bars_per_sec'] = rows / table['seconds']
+    return table
+
+
+def scale_key(years, n_symbols):
+    """Baselines are kept per data scale, e.g. '1y_1sym'."""
+    return f"{years:g}y_{n_symbols}sym"
+
+
+def load_baselines(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(table, key, path=BASELINE_FILE):
+    """Store the results of one scale, keeping the baselines of the other scales."""
+    baselines = load_baselines(path)
+    baselines[key] = {
+        'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpus': os.cpu_count(),
+        'stages': {stage: {'seconds': row['seconds'], 'peak_mb': row['peak_mb']}
+                   for stage, row in table.iterrows()},
+    }
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2)
+
+
+def compare(table, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Add baseline columns and a regression flag per stage.
+
+    A stage regresses when its time (above MIN_SECONDS) or its peak memory
+    exceeds the baseline by more than `tolerance`.
+    """
+    table = table.copy()
+    stages = baseline.get('stages', {})
+    table['base_seconds'] = [stages.get(stage, {}).get('seconds', np.nan) for stage in table.index]
+    table['base_peak_mb'] = [stages.get(stage, {}).get('peak_mb', np.nan) for stage in table.index]
+    table['time_change (%)'] = (table['seconds'] / table['base_seconds'] - 1) * 100
+    table['mem_change (%)'] = (table['peak_mb'] / table['base_peak_mb'] - 1) * 100
+    slower = (table['time_change (%)'] > tolerance * 100) & (table['seconds'] > MIN_SECONDS)
+    bigger = table['mem_change (%)'] > tolerance * 100
+    table['regression'] = np.select([slower & bigger, slower, bigger], ['time+memory', 'time', 'memory'], '')
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--symbols", type=int, default=1)
+    parser.add_argument("--start", default=DEFAULT_START)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    years = int(args.years) if args.years.is_integer() else args.years
+    key = scale_key(years, args.symbols)
+    table = run_benchmarks(synthetic_tickers(args.symbols), years, args.start, args.seed, args.repeat,
+                           [stage for stage in STAGES if stage in args.stages])
+
+    baseline = load_baselines(args.baseline).get(key)
+    if baseline is not None:
+        table = compare(table, baseline, args.tolerance)
+    print(f"\n=== Benchmarks ({key}, best of {args.repeat}) ===")
+    print(table.round(3).to_string())
+
+    if args.save_baseline:
+        save_baseline(table, key, args.baseline)
+        print(f"[INFO] Baseline for {key} saved in '{args.baseline}'")
+    elif baseline is None:
+        print(f"[INFO] No baseline for {key} in '{args.baseline}'; rerun with --save-baseline to store one")
+    elif (table['regression'] != '').any():
+        flagged = table.index[table['regression'] != ''].tolist()
+        print(f"[ERROR] Regression in {flagged} (tolerance {args.tolerance:.0%})")
+        raise SystemExit(1)
+    else:
+        print(f"[INFO] No regression against the {baseline['created']} baseline")
+
+
+if __name__ == "__main__":
+    main()
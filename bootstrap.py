@@ -0,0 +1,172 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import STATS_DECIMALS, build_day_arrays, load_daily_returns, load_processed_data, run_backtest
+from check_results import load_trades
+from data_store import read_day_arrays
+from instrumentation import add_trace_arguments, configure, span
+from metrics import STATS, matrix_metrics, max_drawdown, performance_metrics
+
+DEFAULT_RESAMPLES = 100_000
+DEFAULT_BLOCK = 20                 # mean block length (days) of the stationary bootstrap
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MAX_BYTES = 8 << 20        # one chunk of resamples; small enough to stay in cache
+
+# Rough number of 8-byte (resamples x days) temporaries alive while computing metrics
+_TEMPS_PER_RESAMPLE = 5
+
+DAILY_METRICS = STATS
+TRADE_METRICS = ['Max Drawdown (%)', 'Longest Losing Streak']
+
+
+def stationary_indices(rng, n_resamples, n, block):
+    """(resamples x n) index matrix of a circular stationary block bootstrap.
+
+    Blocks have geometric lengths with mean `block` and start at a uniform
+    random day. Lengths are capped at n, so indices stay below 2n and are used
+    directly on the series concatenated with itself instead of wrapping with a
+    modulo. The matrix is the cumulative sum of unit steps with a jump at every
+    block start.
+    """
+    k = int(n / block * 2 + 8 * np.sqrt(n / block) + 8)
+    while True:
+        lengths = np.minimum(rng.geometric(1 / block, size=(n_resamples, k)), n)
+        ends = np.cumsum(lengths, axis=1)
+        if (ends[:, -1] >= n).all():
+            break
+        k *= 2
+    origin = rng.integers(0, n, size=(n_resamples, k))
+    starts = ends - lengths
+    jump = origin.copy()
+    jump[:, 1:] -= origin[:, :-1] + lengths[:, :-1] - 1
+
+    steps = np.ones((n_resamples, n), dtype=np.int64)
+    rows, blocks = np.nonzero(starts < n)
+    steps[rows, starts[rows, blocks]] = jump[rows, blocks]
+    return np.cumsum(steps, axis=1, out=steps)
+
+
+def trade_metrics(R):
+    """Path metrics of trade sequences: max drawdown and longest run of losing trades."""
+    losses = R < 0
+    count = np.cumsum(losses, axis=1, dtype=np.int32)
+    reset = np.maximum.accumulate(np.where(losses, 0, count), axis=1)
+    np.subtract(count, reset, out=count)
+    return {
+        'Max Drawdown (%)': max_drawdown(R),
+        'Longest Losing Streak': count.max(axis=1).astype(float),
+    }
+
+
+def _chunk_size(n, max_bytes):
+    return max(1, max_bytes // (n * 8 * _TEMPS_PER_RESAMPLE))
+
+
+def _summarize(estimate, samples, confidence):
+    tail = (1 - confidence) / 2 * 100
+    rows = {}
+    for name, values in samples.items():
+        values = np.concatenate(values)
+        lower, upper = np.nanpercentile(values, [tail, 100 - tail])
+        rows[name] = {'estimate': float(estimate[name]), 'mean': float(np.nanmean(values)),
+                      'lower': lower, 'upper': upper}
+    return pd.DataFrame(rows).T
+
+
+def bootstrap_daily(ret, ret_spy, n_resamples=DEFAULT_RESAMPLES, block=DEFAULT_BLOCK,
+                    confidence=DEFAULT_CONFIDENCE, seed=None, max_bytes=DEFAULT_MAX_BYTES, aum=None):
+    """Stationary block bootstrap CIs for the daily-return statistics.
+
+    Every traded day of the strategy is resampled, as performance_stats()
+    scores it (the estimate is that figure; pass `aum` for its drawdown).
+    The benchmark is resampled with the same index matrix, and days without
+    a benchmark return are only left out of alpha/beta. Resamples are drawn
+    and evaluated in chunks whose (chunk x days) temporaries stay within
+    `max_bytes`.
+    """
+    traded = ret.dropna()
+    Y = traded.to_numpy(dtype=float)
+    X = ret_spy.reindex(traded.index).to_numpy(dtype=float)
+    Y2 = np.concatenate([Y, Y])
+    X2 = np.concatenate([X, X])
+    rng = np.random.default_rng(seed)
+
+    samples = {name: [] for name in DAILY_METRICS}
+    chunk = _chunk_size(len(Y), max_bytes)
+    for start in range(0, n_resamples, chunk):
+        index = stationary_indices(rng, min(chunk, n_resamples - start), len(Y), block)
+        for name, values in matrix_metrics(Y2[index], X2[index]).items():
+            samples[name].append(values)
+    return _summarize(performance_metrics(ret, ret_spy, aum), samples, confidence)
+
+
+def shuffle_trades(trades, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, seed=None,
+                   max_bytes=DEFAULT_MAX_BYTES):
+    """CIs for path statistics when the order of the trades is shuffled.
+
+    Each trade's return is its P&L over the balance before it; shuffling keeps
+    the total return but changes drawdowns and losing streaks.
+    """
+    pnl = pd.to_numeric(trades['P&L'], errors='coerce').to_numpy(dtype=float)
+    balance = pd.to_numeric(trades['Account_Balance'], errors='coerce').to_numpy(dtype=float)
+    R = pnl / (balance - pnl)
+    R = R[~np.isnan(R)]
+    rng = np.random.default_rng(seed)
+
+    samples = {name: [] for name in TRADE_METRICS}
+    chunk = _chunk_size(len(R), max_bytes)
+    for start in range(0, n_resamples, chunk):
+        rows = min(chunk, n_resamples - start)
+        order = rng.permuted(np.broadcast_to(np.arange(len(R)), (rows, len(R))), axis=1)
+        for name, values in trade_metrics(R[order]).items():
+            samples[name].append(values)
+    estimate = {name: values[0] for name, values in trade_metrics(R[None, :].copy()).items()}
+    return _summarize(estimate, samples, confidence)
+
+
+def _round(table, decimals):
+    return table.apply(lambda row: row.round(decimals.get(row.name, 2)), axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals for the strategy statistics.")
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES)
+    parser.add_argument("--block", type=float, default=DEFAULT_BLOCK, help="Mean block length in days")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-mb", type=int, default=DEFAULT_MAX_BYTES >> 20, help="Memory budget per chunk")
+    parser.add_argument("--data", default="spy_processed_data.csv")
+    parser.add_argument("--daily", default="spy_daily_data.csv")
+    parser.add_argument("--trades", default=None,
+                        help="Trade log CSV (default: the stored trades table, else trades.csv)")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+    max_bytes = args.max_mb << 20
+
+    arrays = read_day_arrays()
+    if arrays is None:
+        arrays = build_day_arrays(load_processed_data(args.data))
+    strat = run_backtest(arrays)
+    ret_spy = load_daily_returns(args.daily).reindex(strat.index)
+
+    with span('bootstrap.daily') as sp:
+        daily = bootstrap_daily(strat['ret'], ret_spy, args.resamples, args.block, args.confidence, args.seed,
+                                max_bytes, strat['AUM'])
+        sp.add(resamples=args.resamples)
+    level = f"{args.confidence:.0%}"
+    print(f"\n=== Stationary Block Bootstrap ({args.resamples} resamples, {level} CI) ===")
+    print(_round(daily, STATS_DECIMALS).to_string())
+
+    trades = load_trades(args.trades)
+    with span('bootstrap.trades') as sp:
+        shuffled = shuffle_trades(trades, args.resamples, args.confidence, args.seed, max_bytes)
+        sp.add(resamples=args.resamples)
+    print(f"\n=== Trade Order Shuffling ({args.resamples} resamples, {level} CI) ===")
+    print(_round(shuffled, {**STATS_DECIMALS, 'Longest Losing Streak': 0}).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,135 +1,150 @@
+import argparse
+import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import FuncFormatter
-import statsmodels.api as sm
-
-# === Load data ===
-trades = pd.read_csv("trades.csv", parse_dates=["Date"])
-spy = pd.read_csv("spy_intra_data.csv", parse_dates=["caldt"])
-
-# === Process SPY data ===
-spy['date'] = spy['caldt'].dt.date
-spy_daily = spy.groupby('date').agg({'close': 'last'})
-spy_daily['ret'] = spy_daily['close'].pct_change()
-spy_daily = spy_daily.dropna()
-
-# === Process strategy data ===
-trades.sort_values("Date", inplace=True)
-daily_balance = trades.groupby("Date").agg({'Account_Balance': 'last'})
-daily_balance['ret'] = daily_balance['Account_Balance'].pct_change()
-daily_balance = daily_balance.dropna()
-
-# === Align time series ===
-combined = pd.merge(daily_balance[['ret']], spy_daily[['ret']], left_index=True, right_index=True, suffixes=('_strategy', '_spy'))
-
-# === Compute performance metrics ===
-Y = combined['ret_strategy']
-X = sm.add_constant(combined['ret_spy'])
-model = sm.OLS(Y, X).fit()
-
-# === Extra metrics: Win Rate & Profit Factor ===
-positive_returns = Y[Y > 0]
-negative_returns = Y[Y < 0]
-win_rate = round(len(positive_returns) / len(Y) * 100, 1)
-profit_factor = round(positive_returns.sum() / abs(negative_returns.sum()), 2) if len(negative_returns) > 0 else np.nan
-
-# === Max Drawdown and period ===
-cum_balance = daily_balance['Account_Balance']
-roll_max = cum_balance.cummax()
-drawdown = cum_balance / roll_max - 1
-min_drawdown_idx = drawdown.idxmin()
-max_dd_pct = round(drawdown.min() * -100, 1)
-peak_date = roll_max[:min_drawdown_idx].idxmax()
-valley_date = min_drawdown_idx
-
-# === Store performance statistics ===
-stats = {
-    'Total Return (%)': round((np.prod(1 + Y) - 1) * 100, 1),
-    'Annualized Return (%)': round((np.prod(1 + Y) ** (252 / len(Y)) - 1) * 100, 1),
-    'Annualized Volatility (%)': round(Y.std() * np.sqrt(252) * 100, 1),
-    'Sharpe Ratio': round(Y.mean() / Y.std() * np.sqrt(252), 2),
-    'Win Rate (%)': win_rate,
-    'Profit Factor': profit_factor,
-    'Max Drawdown (%)': f"{max_dd_pct} ({peak_date.date()} → {valley_date.date()})",
-    'Alpha (%)': round(model.params['const'] * 100 * 252, 2),
-    'Beta': round(model.params['ret_spy'], 2)
-}
-
-# === Calculate AUM for Buy & Hold ===
-initial_balance = trades['Account_Balance'].iloc[0]
-spy_daily['AUM_SPY'] = initial_balance * (1 + spy_daily['ret']).cumprod()
-daily_balance['AUM_Strategy'] = daily_balance['Account_Balance']
-
-# === Merge for plot ===
-aum_compare = pd.merge(daily_balance[['AUM_Strategy']], spy_daily[['AUM_SPY']], left_index=True, right_index=True)
-
-# === Plot AUM comparison ===
-fig, ax = plt.subplots()
-ax.plot(aum_compare.index, aum_compare['AUM_Strategy'], label='Momentum Strategy', linewidth=2, color='k')
-ax.plot(aum_compare.index, aum_compare['AUM_SPY'], label='S&P 500 (Buy & Hold)', linewidth=1, color='r')
-
-ax.grid(True, linestyle=':')
-ax.xaxis.set_major_locator(mdates.YearLocator())
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
-plt.xticks(rotation=45)
-ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'${x:,.0f}'))
-ax.set_ylabel('Account Balance ($)')
-plt.legend(loc='upper left')
-plt.title('Strategy vs. Buy & Hold')
-plt.tight_layout()
-plt.show()
-
-# === Display performance metrics ===
-print("\n=== Strategy Performance Metrics ===")
-for k, v in stats.items():
-    print(f"{k}: {v}")
-
-# === Long/Short Trade Stats ===
-trades['P&L'] = pd.to_numeric(trades['P&L'], errors='coerce')
-trades['Side'] = trades['Side'].str.lower()
-
-long_trades = trades[trades['Side'] == 'long']
-short_trades = trades[trades['Side'] == 'short']
-
-long_count = len(long_trades)
-short_count = len(short_trades)
-
-long_profit = long_trades['P&L'].sum()
-short_profit = short_trades['P&L'].sum()
-
-print("\n=== Long/Short Breakdown ===")
-print(f"Number of long trades: {long_count}")
-print(f"Number of short trades: {short_count}")
-print(f"Total profit from longs: ${long_profit:,.2f}")
-print(f"Total profit from shorts: ${short_profit:,.2f}")
-
-# === Monthly and Yearly Returns Table ===
-trades["Year"] = trades["Date"].dt.year
-trades["Month"] = trades["Date"].dt.month
-trades["Daily_Return"] = trades["Account_Balance"].pct_change() * 100
-
-monthly_returns = (
-    trades.groupby(["Year", "Month"])["Account_Balance"]
-    .agg(["first", "last"])
-    .assign(Monthly_Return=lambda x: (x["last"] / x["first"] - 1) * 100)
-)
-
-monthly_table = monthly_returns["Monthly_Return"].unstack(level=1).round(1)
-yearly_returns = (
-    trades.groupby("Year")["Account_Balance"]
-    .agg(["first", "last"])
-    .assign(Yearly_Return=lambda x: (x["last"] / x["first"] - 1) * 100)
-)
-
-monthly_table = monthly_table.reindex(columns=range(1, 13)).round(1)
-monthly_table.columns = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", 
-                         "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-monthly_table["Yearly"] = yearly_returns["Yearly_Return"].round(1)
-
-# === Display monthly and yearly return table ===
-print("\n=====     Monthly & Yearly Returns Table     =====\n")
-print(monthly_table)
-print("\n\n")
-# monthly_table.to_csv("monthly_returns.csv")
+from backtest_engine import minute_values
+from data_store import load_table, read_day_arrays
+from instrumentation import add_trace_arguments, configure, span
+from metrics import performance_metrics, period_returns, rolling_metrics
+
+PLOT_FILE = "check_results.png"
+TRADES_FILE = "trades.csv"
+
+
+def load_trades(path=None):
+    """Trade log sorted by date: the CSV at `path`, else the stored trades table (or trades.csv)."""
+    if path is None:
+        trades = load_table('trades', TRADES_FILE, parse_dates=["Date"])
+    else:
+        trades = pd.read_csv(path, parse_dates=["Date"])
+    trades['Date'] = pd.to_datetime(trades['Date'])
+    return trades.sort_values("Date")
+
+
+def spy_daily_returns():
+    """SPY daily closes and returns: last minute bar of each day, from the stored day arrays when available."""
+    with span('spy_daily'):
+        arrays = read_day_arrays()
+        if arrays is not None:
+            n_bars = np.asarray(arrays['n_bars'])
+            last_close = minute_values(arrays, 'close')[np.arange(len(n_bars)), n_bars - 1]
+            spy_daily = pd.DataFrame({'close': last_close}, index=pd.to_datetime(arrays['days']))
+        else:
+            spy = load_table('spy_intra_data', "spy_intra_data.csv", parse_dates=["caldt"], usecols=["caldt", "close"])
+            spy_daily = spy.groupby(spy['caldt'].dt.normalize()).agg({'close': 'last'})
+        spy_daily['ret'] = spy_daily['close'].pct_change()
+        return spy_daily.dropna()
+
+
+def daily_balance(trades):
+    """End-of-day account balance and its daily return."""
+    balance = trades.groupby("Date").agg({'Account_Balance': 'last'})
+    balance['ret'] = balance['Account_Balance'].pct_change()
+    return balance.dropna()
+
+
+def performance_report(balance, spy_daily):
+    """Rounded statistics block and rolling metrics of the strategy against SPY."""
+    combined = pd.merge(balance[['ret']], spy_daily[['ret']], left_index=True, right_index=True,
+                        suffixes=('_strategy', '_spy'))
+
+    # metrics.py; max drawdown on the account balance
+    with span('stats'):
+        metrics = performance_metrics(combined['ret_strategy'], combined['ret_spy'], balance['Account_Balance'])
+        rolling = rolling_metrics(combined['ret_strategy'], combined['ret_spy'])
+
+    stats = {
+        'Total Return (%)': round(metrics['Total Return (%)'], 1),
+        'Annualized Return (%)': round(metrics['Annualized Return (%)'], 1),
+        'Annualized Volatility (%)': round(metrics['Annualized Volatility (%)'], 1),
+        'Sharpe Ratio': round(metrics['Sharpe Ratio'], 2),
+        'Win Rate (%)': round(metrics['Win Rate (%)'], 1),
+        'Profit Factor': round(metrics['Profit Factor'], 2),
+        'Max Drawdown (%)': f"{round(metrics['Max Drawdown (%)'], 1)} "
+                            f"({metrics['Drawdown Peak'].date()} → {metrics['Drawdown Valley'].date()})",
+        'Alpha (%)': round(metrics['Alpha (%)'], 2),
+        'Beta': round(metrics['Beta'], 2)
+    }
+    return stats, rolling
+
+
+def plot_aum(balance, spy_daily, initial_balance, path=PLOT_FILE):
+    """Account balance vs. buy & hold SPY, saved to `path` (matplotlib is only imported here)."""
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from matplotlib.ticker import FuncFormatter
+
+    aum_spy = (initial_balance * (1 + spy_daily['ret']).cumprod()).rename('AUM_SPY')
+    aum_compare = pd.merge(balance['Account_Balance'].rename('AUM_Strategy'), aum_spy,
+                           left_index=True, right_index=True)
+
+    fig, ax = plt.subplots()
+    ax.plot(aum_compare.index, aum_compare['AUM_Strategy'], label='Momentum Strategy', linewidth=2, color='k')
+    ax.plot(aum_compare.index, aum_compare['AUM_SPY'], label='S&P 500 (Buy & Hold)', linewidth=1, color='r')
+
+    ax.grid(True, linestyle=':')
+    ax.xaxis.set_major_locator(mdates.YearLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+    plt.xticks(rotation=45)
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'${x:,.0f}'))
+    ax.set_ylabel('Account Balance ($)')
+    plt.legend(loc='upper left')
+    plt.title('Strategy vs. Buy & Hold')
+    plt.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def print_side_breakdown(trades):
+    """Number of trades and total P&L of the long and the short side."""
+    pnl = pd.to_numeric(trades['P&L'], errors='coerce')
+    side = trades['Side'].str.lower()
+    print("\n=== Long/Short Breakdown ===")
+    print(f"Number of long trades: {(side == 'long').sum()}")
+    print(f"Number of short trades: {(side == 'short').sum()}")
+    print(f"Total profit from longs: ${pnl[side == 'long'].sum():,.2f}")
+    print(f"Total profit from shorts: ${pnl[side == 'short'].sum():,.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Post-analysis of trades.csv against SPY.")
+    parser.add_argument("--trades", default=None,
+                        help="Trade log CSV (default: the stored trades table, else trades.csv)")
+    parser.add_argument("--plot", default=PLOT_FILE, metavar="PATH", help=f"AUM chart (default: {PLOT_FILE})")
+    parser.add_argument("--no-plot", action="store_true", help="Skip the chart (matplotlib is not imported)")
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
+
+    trades = load_trades(args.trades)
+    spy_daily = spy_daily_returns()
+    balance = daily_balance(trades)
+    stats, rolling = performance_report(balance, spy_daily)
+
+    if not args.no_plot:
+        with span('plot'):
+            plot_aum(balance, spy_daily, trades['Account_Balance'].iloc[0], args.plot)
+        print("[INFO] Chart saved in", args.plot)
+
+    # === Display performance metrics ===
+    print("\n=== Strategy Performance Metrics ===")
+    for k, v in stats.items():
+        print(f"{k}: {v}")
+
+    print_side_breakdown(trades)
+
+    # === Rolling metrics (63 / 252 trading days) ===
+    print("\n=== Rolling Metrics ===")
+    print(pd.DataFrame({'last': rolling.iloc[-1], 'min': rolling.min(), 'max': rolling.max()}).round(2))
+
+    # === Monthly and Yearly Returns Table (compounded daily returns) ===
+    with span('monthly_table'):
+        monthly_table = period_returns(balance['ret']).round(1)
+    print("\n=====     Monthly & Yearly Returns Table     =====\n")
+    print(monthly_table)
+    print("\n\n")
+
+
+if __name__ == "__main__":
+    main()
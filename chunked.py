@@ -0,0 +1,300 @@
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (AUM_0, BAND_MULT, DAY_ARRAY_COLUMNS, MINUTE_KEYS, STATS_DECIMALS, TRADE_FREQ,
+                             build_day_arrays, load_daily_returns, minute_values, performance_stats, run_backtest)
+from data_store import append_table, drop_table, table_name, write_table
+from instrumentation import add_trace_arguments, configure, span
+from prepare_indicators import (DVOL_WINDOW, SIGMA_MIN_PERIODS, SIGMA_WINDOW, day_layout, per_day_cumsum,
+                                window_std)
+from trade_log import extract_trades
+
+PARTITIONS = ['day', 'month', 'year']
+DEFAULT_PARTITION = 'year'
+READ_ROWS = 100_000          # CSV rows parsed per read
+TRADES_FILE = "trades.csv"
+
+# sigma_open state has one slot per clock minute; minute_of_day 1 is 09:30
+_SLOT_OFFSET = 9 * 60 + 30
+_SLOTS = 24 * 60 + 1
+
+
+def _partition_key(dates, partition):
+    dates = pd.DatetimeIndex(dates)
+    if partition == 'year':
+        return dates.year.to_numpy()
+    if partition == 'month':
+        return dates.year.to_numpy() * 12 + dates.month.to_numpy()
+    return dates.normalize().asi8
+
+
+def iter_partitions(path, date_column, partition=DEFAULT_PARTITION, read_rows=READ_ROWS, **read_csv_kwargs):
+    """Rows of a date-sorted CSV, one calendar partition (day, month or year) at a time.
+
+    The file is parsed `read_rows` rows at a time and the rows of the last
+    partition of a block are held back until the partition is complete, so at
+    most one partition plus one block is in memory.
+    """
+    if partition not in PARTITIONS:
+        raise ValueError(f"[ERROR] Unknown partition '{partition}'; choose from {PARTITIONS}")
+    pending, pending_key = [], None
+    reader = pd.read_csv(path, chunksize=read_rows, parse_dates=[date_column], **read_csv_kwargs)
+    for block in reader:
+        if block.empty:
+            continue
+        key = _partition_key(block[date_column], partition)
+        starts = np.flatnonzero(key[1:] != key[:-1]) + 1
+        if pending and key[0] != pending_key:
+            yield pd.concat(pending, ignore_index=True)
+            pending = []
+        if len(starts):
+            yield pd.concat(pending + [block.iloc[:starts[0]]], ignore_index=True)
+            for start, stop in zip(starts[:-1], starts[1:]):
+                yield block.iloc[start:stop].reset_index(drop=True)
+            pending = [block.iloc[starts[-1]:]]
+        else:
+            pending.append(block)
+        pending_key = key[-1]
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+# === Indicators ===
+
+def new_indicator_state(processed=None):
+    """Everything compute_indicators() carries from one day to the next.
+
+    Previous close, the last DVOL_WINDOW + 1 daily returns, and per clock minute
+    the last SIGMA_WINDOW move_open values (NaN before a minute's first bar):
+    before the first day, or after the last day of a `processed` history.
+    """
+    state = {
+        'rows': 0,
+        'last_close': math.nan,
+        'ret_tail': np.full(DVOL_WINDOW + 1, np.nan),
+        'window': np.full((_SLOTS, SIGMA_WINDOW), np.nan),
+    }
+    if processed is None or not len(processed):
+        return state
+
+    codes, all_days, n_bars, first_row, position = day_layout(pd.to_datetime(processed['day']).dt.date)
+    day_close = processed['close'].to_numpy(dtype=float)[first_row + n_bars - 1]
+    returns = np.concatenate((state['ret_tail'], [np.nan], day_close[1:] / day_close[:-1] - 1))
+    slots = processed['minute_of_day'].to_numpy() + _SLOT_OFFSET
+    from_end = pd.Series(slots).groupby(slots).cumcount(ascending=False).to_numpy()
+    tail = from_end < SIGMA_WINDOW
+    state['window'][slots[tail], SIGMA_WINDOW - 1 - from_end[tail]] = processed['move_open'].to_numpy(dtype=float)[tail]
+    state.update(rows=int(processed.index[-1]) + 1, last_close=float(day_close[-1]),
+                 ret_tail=returns[-(DVOL_WINDOW + 1):].copy())
+    return state
+
+
+def next_sigma_open(state, minutes):
+    """sigma_open of the given minutes of day on the day after `state`, as partition_indicators() gives it."""
+    windows = pd.DataFrame(state['window'][np.asarray(minutes) + _SLOT_OFFSET].T)
+    return windows.rolling(window=SIGMA_WINDOW, min_periods=SIGMA_MIN_PERIODS).mean().to_numpy()[-1]
+
+
+def _rolling_means(state, slots, values):
+    """Per-minute rolling means of a partition's move_open, continuing from the carried windows.
+
+    Each minute's window tail is put in front of its new values and
+    `groupby(minute).rolling(...).mean()` runs over them, as in
+    compute_indicators(). pandas accumulates the rolling sums over the whole
+    history, so the means can differ from a single run in the last bits.
+    Returns (previous mean, new mean) per row and updates the tails.
+    """
+    present = np.unique(slots)
+    keys = np.concatenate((np.repeat(present, SIGMA_WINDOW), slots))
+    series = pd.Series(np.concatenate((state['window'][present].ravel(), values)))
+    rolling_mean = (series.groupby(keys).rolling(window=SIGMA_WINDOW, min_periods=SIGMA_MIN_PERIODS).mean()
+                    .droplevel(0).sort_index())
+    previous = rolling_mean.groupby(keys).shift(1).to_numpy()
+
+    from_end = series.groupby(keys).cumcount(ascending=False).to_numpy()
+    tail = from_end < SIGMA_WINDOW
+    state['window'][keys[tail], SIGMA_WINDOW - 1 - from_end[tail]] = series.to_numpy()[tail]
+    new = slice(len(keys) - len(slots), None)
+    return previous[new], rolling_mean.to_numpy()[new]
+
+
+def partition_indicators(intra, dividends, state):
+    """compute_indicators() for the next whole days of a history, continuing from `state`.
+
+    `state` (new_indicator_state() for the first partition) is updated in
+    place, so running consecutive partitions gives the rows of a single
+    compute_indicators() call on the whole history, index included.
+    """
+    df = intra.set_index('caldt')
+    df['day'] = df.index.date
+    codes, all_days, n_bars, first_row, position = day_layout(df['day'])
+    n_days = len(all_days)
+    last_row = first_row + n_bars - 1
+
+    # VWAP e move_open (o primeiro dia do histórico só semeia o fechamento anterior)
+    high = df['high'].to_numpy(dtype=float)
+    low = df['low'].to_numpy(dtype=float)
+    close = df['close'].to_numpy(dtype=float)
+    volume = df['volume'].to_numpy(dtype=float)
+    hlc = (high + low + close) / 3
+    vwap = (per_day_cumsum(volume * hlc, codes, position, n_days, int(n_bars.max()))
+            / per_day_cumsum(volume, codes, position, n_days, int(n_bars.max())))
+    move_open = np.abs(close / df['open'].to_numpy(dtype=float)[first_row][codes] - 1)
+    if math.isnan(state['last_close']):
+        vwap[codes == 0] = np.nan
+        move_open[codes == 0] = np.nan
+    df['move_open'] = move_open
+    df['vwap'] = vwap
+
+    # Volatilidade diária: retornos anteriores + retornos da partição
+    day_close = close[last_row]
+    spy_ret = day_close / np.concatenate(([state['last_close']], day_close[:-1])) - 1
+    returns = np.concatenate((state['ret_tail'], spy_ret))
+    dvol = window_std(np.lib.stride_tricks.sliding_window_view(returns, DVOL_WINDOW))[:n_days]
+    df['spy_dvol'] = dvol[codes]
+    state['last_close'] = float(day_close[-1])
+    state['ret_tail'] = returns[-(DVOL_WINDOW + 1):].copy()
+
+    # Métricas por minuto: janelas anteriores + valores da partição
+    df['min_from_open'] = ((df.index - df.index.normalize()) / pd.Timedelta(minutes=1)) - (9 * 60 + 30) + 1
+    df['minute_of_day'] = df['min_from_open'].round().astype(int)
+    slots = df['minute_of_day'].to_numpy() + _SLOT_OFFSET
+    sigma_open, rolling_mean = _rolling_means(state, slots, move_open)
+    df['move_open_rolling_mean'] = rolling_mean
+    df['sigma_open'] = sigma_open
+
+    # Mesclar dividendos
+    dividends = dividends.assign(day=pd.to_datetime(dividends['caldt']).dt.date)
+    df = df.merge(dividends[['day', 'dividend']], on='day', how='left')
+    df['dividend'] = df['dividend'].fillna(0)
+    df.index = pd.RangeIndex(state['rows'], state['rows'] + len(df))
+    state['rows'] += len(df)
+    return df
+
+
+def prepare_chunked(ticker='SPY', partition=DEFAULT_PARTITION, read_rows=READ_ROWS):
+    """prepare_indicators.py for one symbol, one partition at a time.
+
+    Reads <ticker>_intra_data.csv in partitions and appends each processed
+    partition to <ticker>_processed_data.csv (same bytes as the in-memory
+    run). Only the CSV is written; the store is left untouched.
+    """
+    intra_path = f"{table_name(ticker, 'intra_data')}.csv"
+    dividends = pd.read_csv(f"{table_name(ticker, 'dividends')}.csv", parse_dates=["caldt"])
+    output = f"{table_name(ticker, 'processed_data')}.csv"
+
+    state = new_indicator_state()
+    with open(output, 'w', newline='') as f:
+        for part in iter_partitions(intra_path, 'caldt', partition, read_rows):
+            with span('chunked.indicators', ticker=ticker) as sp:
+                df = partition_indicators(part, dividends, state)
+                f.write(df.to_csv(header=state['rows'] == len(df)))
+                sp.add(bars=len(df))
+    print(f"[INFO] Calculated indicators ({state['rows']} bars, by {partition}) and data saved in '{output}'")
+    return state['rows']
+
+
+# === Backtest ===
+
+def new_backtest_state(AUM_0=AUM_0):
+    """What the backtest carries between days: last day, its close, and AUM."""
+    return {'day': None, 'last_close': math.nan, 'AUM': AUM_0}
+
+
+def _with_seed_day(arrays, state):
+    """Prepend the previous partition's last day as a flat seed row.
+
+    The seed trades nothing and holds the carried AUM (passed as seed_aum), so
+    the partition's first day is sized from it exactly as inside a full run
+    (compound() and extract_trades() always skip row 0).
+    """
+    arrays = dict(arrays)
+    arrays['prev_close'] = arrays['prev_close'].copy()
+    arrays['prev_close'][0] = state['last_close']
+    arrays['prev_close_adjusted'] = arrays['prev_close'] - arrays['dividend']
+
+    seed = {'days': state['day'], 'n_bars': 0, 'has_sigma': False, 'dividend': 0.0}
+    seeded = {}
+    for key, value in arrays.items():
+        value = np.asarray(value)
+        if key in MINUTE_KEYS:
+            fill = np.nan if value.dtype.kind == 'f' else 0
+            row = np.full((1, value.shape[1]), fill, dtype=value.dtype)
+        else:
+            row = np.array([seed.get(key, np.nan)], dtype=value.dtype)
+        seeded[key] = np.concatenate((row, value))
+    return seeded
+
+
+def backtest_chunked(path="spy_processed_data.csv", trades_path=TRADES_FILE, partition=DEFAULT_PARTITION,
+                     read_rows=READ_ROWS, band_mult=BAND_MULT, trade_freq=TRADE_FREQ, AUM_0=AUM_0, **params):
+    """run_backtest() and extract_trades() one partition at a time.
+
+    Each partition becomes day arrays and is traded from the carried AUM and
+    previous close; days without sigma_open reset to AUM_0 as in compound().
+    Trades are appended to `trades_path`, and to the stored trades table when
+    that is trades.csv (the table mirrors it). Returns the daily ret/AUM/shares
+    frame (one row per day), identical to the in-memory run.
+    """
+    state = new_backtest_state(AUM_0)
+    daily, n_trades = [], 0
+    mirror = trades_path == TRADES_FILE
+    if mirror:
+        drop_table('trades')
+    with open(trades_path, 'w', newline='') as f:
+        for part in iter_partitions(path, 'day', partition, read_rows, usecols=DAY_ARRAY_COLUMNS):
+            with span('chunked.backtest') as sp:
+                arrays = _with_seed_day(build_day_arrays(part), state)
+                strat = run_backtest(arrays, band_mult=band_mult, trade_freq=trade_freq, AUM_0=AUM_0,
+                                     seed_aum=state['AUM'], **params)
+                trades = extract_trades(arrays, strat, band_mult, trade_freq)
+                f.write(trades.to_csv(index=False, header=not daily))
+                if mirror and len(trades):
+                    (append_table if n_trades else write_table)(trades, 'trades')
+                daily.append(strat.iloc[1:])
+                n_trades += len(trades)
+                last_close = minute_values(arrays, 'close')[-1, arrays['n_bars'][-1] - 1]
+                state.update(day=arrays['days'][-1], AUM=float(strat['AUM'].iloc[-1]), last_close=float(last_close))
+                sp.add(days=len(strat) - 1)
+    print(f"[INFO] {trades_path} saved with {n_trades} records")
+    return pd.concat(daily)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Out-of-core pipeline: indicators and backtest by day/month/year partitions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_indicators = sub.add_parser("indicators", help="prepare_indicators.py in partitions")
+    p_indicators.add_argument("--tickers", nargs="+", default=['SPY'])
+    p_backtest = sub.add_parser("backtest", help="Daily P&L, trades.csv and statistics in partitions")
+    p_backtest.add_argument("--data", default="spy_processed_data.csv")
+    p_backtest.add_argument("--daily", default="spy_daily_data.csv")
+    p_backtest.add_argument("--trades", default=TRADES_FILE)
+    p_backtest.add_argument("--band-mult", type=float, default=BAND_MULT)
+    p_backtest.add_argument("--trade-freq", type=int, default=TRADE_FREQ)
+    for p in (p_indicators, p_backtest):
+        p.add_argument("--partition", choices=PARTITIONS, default=DEFAULT_PARTITION)
+        p.add_argument("--read-rows", type=int, default=READ_ROWS, help="CSV rows parsed per read")
+        add_trace_arguments(p)
+    args = parser.parse_args()
+    configure(args)
+
+    if args.command == "indicators":
+        for ticker in args.tickers:
+            prepare_chunked(ticker, args.partition, args.read_rows)
+        return
+
+    strat = backtest_chunked(args.data, args.trades, args.partition, args.read_rows, args.band_mult,
+                             args.trade_freq)
+    strat['ret_spy'] = load_daily_returns(args.daily).reindex(strat.index).where(strat['ret'].notna())
+    stats = {k: round(v, STATS_DECIMALS[k]) for k, v in performance_stats(strat).items()}
+
+    print("\n=== Strategy Performance Metrics ===")
+    for k, v in stats.items():
+        print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (MINUTE_KEYS, build_day_arrays, compact_minutes, load_day_arrays, minute_values,
+                             save_day_arrays)
+from instrumentation import span
+
+DATA_DIR = "market_data"
+SCHEMA_FILE = "schema.json"
+DAY_ARRAYS_DIR = "day_arrays"
+
+# Column holding the partition date for each known table
+DATE_COLUMNS = {
+    'spy_intra_data': 'caldt',
+    'spy_daily_data': 'caldt',
+    'spy_dividends': 'caldt',
+    'spy_processed_data': 'day',
+    'trades': 'Date',
+}
+DEFAULT_TICKER = 'SPY'
+
+
+def table_name(ticker, kind):
+    """Per-symbol table/file stem, e.g. ('QQQ', 'intra_data') -> 'qqq_intra_data'."""
+    return f"{ticker.lower()}_{kind}"
+
+
+def date_column_for(name):
+    """Partition column of a table; per-symbol tables follow their spy_* counterpart."""
+    if name in DATE_COLUMNS:
+        return DATE_COLUMNS[name]
+    for known, column in DATE_COLUMNS.items():
+        kind = known.removeprefix(table_name(DEFAULT_TICKER, ''))
+        if name.endswith('_' + kind):
+            return column
+    raise ValueError(f"[ERROR] Unknown table '{name}'; pass date_column explicitly")
+
+
+def _column_kind(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return 'numeric'
+    sample = series.dropna()
+    first = sample.iloc[0] if len(sample) else None
+    if isinstance(first, datetime.date) and not isinstance(first, datetime.datetime):
+        return 'date'
+    return 'string'
+
+
+def _encode(series, kind):
+    if kind == 'datetime':
+        return series.to_numpy(dtype='datetime64[ns]')
+    if kind == 'date':
+        return pd.to_datetime(series).to_numpy(dtype='datetime64[D]')
+    if kind == 'string':
+        return series.astype(str).to_numpy(dtype=str)
+    return series.to_numpy()
+
+
+def _decode(values, kind):
+    if kind == 'date':
+        return np.asarray(values).astype(object)
+    if kind == 'string':
+        return np.asarray(values).astype(object)
+    return values
+
+
+def table_dir(name, root=DATA_DIR):
+    return os.path.join(root, name)
+
+
+def has_table(name, root=DATA_DIR):
+    return os.path.exists(os.path.join(table_dir(name, root), SCHEMA_FILE))
+
+
+def write_table(df, name, date_column=None, csv_index=False, root=DATA_DIR):
+    """Write `df` as typed .npy columns partitioned by year of `date_column`.
+
+    Layout: <root>/<name>/<year>/<column>.npy plus a schema.json with column
+    order and kinds. `csv_index` records whether the CSV export writes the index.
+    """
+    date_column = date_column or date_column_for(name)
+    directory = table_dir(name, root)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+
+    kinds = {column: _column_kind(df[column]) for column in df.columns}
+    years = pd.to_datetime(df[date_column]).dt.year.to_numpy()
+    partitions = []
+    for year in np.unique(years):
+        rows = years == year
+        year_dir = os.path.join(directory, str(year))
+        os.makedirs(year_dir)
+        for column in df.columns:
+            np.save(os.path.join(year_dir, f"{column}.npy"), _encode(df[column][rows], kinds[column]))
+        partitions.append(int(year))
+
+    schema = {
+        'columns': list(df.columns),
+        'kinds': kinds,
+        'date_column': date_column,
+        'partitions': partitions,
+        'csv_index': csv_index,
+    }
+    with open(os.path.join(directory, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=2)
+
+
+def drop_table(name, root=DATA_DIR):
+    """Remove a stored table, if any, so readers fall back to its CSV."""
+    directory = table_dir(name, root)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+
+
+def append_npy(path, values):
+    """Append rows to a .npy file in place; False when its dtype, row shape or header cannot take them.
+
+    The data goes at the end of the file and the shape in the header is then
+    rewritten within the header's existing padding (numpy leaves room for the
+    first axis to grow), so nothing already stored is read or copied.
+    """
+    values = np.ascontiguousarray(values)
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        prefix = f.tell() + (2 if version == (1, 0) else 4)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        room = f.tell() - prefix
+        if fortran_order or dtype != values.dtype or tuple(shape[1:]) != values.shape[1:]:
+            return False
+        header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                       'shape': (shape[0] + len(values), *shape[1:])})
+        if len(header) >= room:
+            return False
+        f.seek(0, os.SEEK_END)
+        f.write(values.tobytes())
+        f.seek(prefix)
+        f.write((header.ljust(room - 1) + '\n').encode('latin1'))
+    return True
+
+
+def append_table(df, name, root=DATA_DIR):
+    """Append rows (newer than the stored ones) to a table written by write_table().
+
+    Only the year partitions of the new rows are touched: their column files
+    grow in place with append_npy(), and a new year gets a new partition.
+    """
+    schema = read_schema(name, root)
+    directory = table_dir(name, root)
+    years = pd.to_datetime(df[schema['date_column']]).dt.year.to_numpy()
+    for year in np.unique(years):
+        rows = years == year
+        year_dir = os.path.join(directory, str(year))
+        stored = int(year) in schema['partitions']
+        os.makedirs(year_dir, exist_ok=True)
+        for column in schema['columns']:
+            path = os.path.join(year_dir, f"{column}.npy")
+            values = _encode(df[column][rows], schema['kinds'][column])
+            if not stored:
+                np.save(path, values)
+            elif not append_npy(path, values):
+                np.save(path, np.concatenate((np.load(path), values)))
+        if not stored:
+            schema['partitions'].append(int(year))
+    with open(os.path.join(directory, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=2)
+
+
+def read_schema(name, root=DATA_DIR):
+    with open(os.path.join(table_dir(name, root), SCHEMA_FILE)) as f:
+        return json.load(f)
+
+
+def read_table(name, columns=None, years=None, root=DATA_DIR):
+    """Load a stored table, optionally restricted to some columns and years."""
+    schema = read_schema(name, root)
+    columns = columns or schema['columns']
+    partitions = [y for y in schema['partitions'] if years is None or y in years]
+    directory = table_dir(name, root)
+
+    data = {}
+    for column in columns:
+        parts = [np.load(os.path.join(directory, str(y), f"{column}.npy"), mmap_mode='r') for y in partitions]
+        values = np.concatenate(parts) if parts else np.array([])
+        data[column] = _decode(values, schema['kinds'][column])
+    return pd.DataFrame(data, columns=columns)
+
+
+def load_table(name, csv_path=None, root=DATA_DIR, **read_csv_kwargs):
+    """Read a table from the columnar store, falling back to its CSV export."""
+    source = 'store' if has_table(name, root) else 'csv'
+    with span(f"load.{name}", source=source) as sp:
+        if source == 'store':
+            df = read_table(name, root=root)
+        else:
+            df = pd.read_csv(csv_path or f"{name}.csv", **read_csv_kwargs)
+        sp.add(rows=len(df))
+    return df
+
+
+def export_csv(name, path=None, root=DATA_DIR):
+    """Write a stored table back to the CSV format the scripts used to exchange."""
+    schema = read_schema(name, root)
+    df = read_table(name, root=root)
+    df.to_csv(path or f"{name}.csv", index=schema['csv_index'])
+
+
+def write_day_arrays(arrays, name='spy_processed_data', root=DATA_DIR):
+    """Store dense (days x minutes) arrays next to a table as memory-mappable .npy."""
+    save_day_arrays(arrays, os.path.join(table_dir(name, root), DAY_ARRAYS_DIR))
+
+
+def append_day_arrays(arrays, name='spy_processed_data', root=DATA_DIR):
+    """Append the day arrays of days after the stored ones, growing each .npy in place.
+
+    `arrays` must already carry the stored last close as its first prev_close.
+    A minute key whose new days need another compact dtype or width than the
+    stored one is rewritten whole.
+    """
+    directory = os.path.join(table_dir(name, root), DAY_ARRAYS_DIR)
+    stored = load_day_arrays(directory)
+    for key, value in arrays.items():
+        path = os.path.join(directory, f"{key}.npy")
+        if key == 'days':
+            value = np.asarray(value, dtype='datetime64[D]')
+        elif key in MINUTE_KEYS and value.dtype != stored[key].dtype:
+            value = minute_values(arrays, key)
+            if stored[key].dtype != np.float64 or value.shape[1:] != stored[key].shape[1:]:
+                old = minute_values(stored, key)
+                width = max(old.shape[1], value.shape[1])
+                merged = np.full((len(old) + len(value), width), np.nan)
+                merged[:len(old), :old.shape[1]] = old
+                merged[len(old):, :value.shape[1]] = value
+                n_bars = np.concatenate((stored['n_bars'], arrays['n_bars']))
+                np.save(path, compact_minutes(merged, np.arange(width) >= n_bars[:, None]))
+                continue
+        old = np.load(path, mmap_mode='r')
+        value = np.asarray(value, dtype=old.dtype)
+        if not append_npy(path, value):
+            np.save(path, np.concatenate((old, value)))
+
+
+def read_day_arrays(name='spy_processed_data', root=DATA_DIR):
+    """Memory-map the dense arrays written by write_day_arrays(), or None if absent."""
+    directory = os.path.join(table_dir(name, root), DAY_ARRAYS_DIR)
+    if not os.path.isdir(directory):
+        return None
+    return load_day_arrays(directory, mmap_mode='r')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar storage for market data tables.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="Import a CSV into the store")
+    p_import.add_argument("csv")
+    p_import.add_argument("--name", default=None, help="Table name (default: CSV file stem)")
+    p_import.add_argument("--date-column", default=None)
+
+    p_export = sub.add_parser("export", help="Export a stored table as CSV")
+    p_export.add_argument("name")
+    p_export.add_argument("--output", default=None)
+
+    sub.add_parser("list", help="List stored tables")
+    parser.add_argument("--root", default=DATA_DIR)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        name = args.name or os.path.splitext(os.path.basename(args.csv))[0]
+        date_column = args.date_column or date_column_for(name)
+        csv_index = name.endswith('_processed_data')
+        df = pd.read_csv(args.csv, index_col=0 if csv_index else None)
+        if date_column == 'caldt':
+            df[date_column] = pd.to_datetime(df[date_column])
+        else:
+            df[date_column] = pd.to_datetime(df[date_column]).dt.date
+        write_table(df, name, date_column, csv_index=csv_index, root=args.root)
+        if csv_index:
+            write_day_arrays(build_day_arrays(df), name, root=args.root)
+        print(f"[INFO] Imported {len(df)} rows into '{table_dir(name, args.root)}'")
+    elif args.command == "export":
+        export_csv(args.name, args.output, root=args.root)
+        print(f"[INFO] Exported '{args.name}' to {args.output or args.name + '.csv'}")
+    else:
+        for name in sorted(os.listdir(args.root)) if os.path.isdir(args.root) else []:
+            if has_table(name, args.root):
+                schema = read_schema(name, args.root)
+                print(f"{name}: {len(schema['columns'])} columns, years {schema['partitions']}")
+
+
+if __name__ == "__main__":
+    main()
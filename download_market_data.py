@@ -1,90 +1,35 @@
+import argparse
 import requests
-import time
 import pandas as pd
 from datetime import datetime
-import pytz
+from artifact_cache import ArtifactCache, content_key
+from async_downloader import BASE_URL, DownloadError, download
+from data_store import table_name, write_table
+from instrumentation import add_trace_arguments, configure, span
 
 # ===== CONFIGURATION =====
 API_KEY = 'YOUR_API'  # Replace with your actual Polygon.io API key
-BASE_URL = 'https://api.polygon.io'
-ENFORCE_RATE_LIMIT = True
-eastern = pytz.timezone('America/New_York')
 
 # ===== FUNCTIONS =====
 
-def fetch_polygon_data(ticker, start_date, end_date, period, enforce_rate_limit=ENFORCE_RATE_LIMIT):
-    """Fetch stock data from Polygon.io based on the given period (minute or day)."""
-    multiplier = '1'
-    timespan = period
-    limit = '50000'
-
-    url = f'{BASE_URL}/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start_date}/{end_date}?adjusted=false&sort=asc&limit={limit}&apiKey={API_KEY}'
-    
-    data_list = []
-    request_count = 0
-    first_request_time = None
-
-    while True:
-        if enforce_rate_limit and request_count == 5:
-            elapsed_time = time.time() - first_request_time
-            if elapsed_time < 60:
-                wait_time = 60 - elapsed_time
-                print(f"[INFO] Rate limit reached. Waiting {wait_time:.2f} seconds...")
-                time.sleep(wait_time)
-            request_count = 0
-            first_request_time = time.time()
-
-        if first_request_time is None and enforce_rate_limit:
-            first_request_time = time.time()
-
-        response = requests.get(url)
-        if response.status_code != 200:
-            error_message = response.json().get('error', 'No error message provided.')
-            print(f"[ERROR] API response error: {error_message}")
-            break
-
-        data = response.json()
-        request_count += 1
-        print(f"[INFO] Fetched {len(data.get('results', []))} entries.")
-
-        if 'results' in data:
-            for entry in data['results']:
-                utc_time = datetime.fromtimestamp(entry['t'] / 1000, pytz.utc)
-                eastern_time = utc_time.astimezone(eastern)
-
-                data_entry = {
-                    'caldt': eastern_time.replace(tzinfo=None),
-                    'open': entry['o'],
-                    'high': entry['h'],
-                    'low': entry['l'],
-                    'close': entry['c'],
-                    'volume': entry['v'],
-                }
-
-                if period == 'minute':
-                    if eastern_time.time() >= datetime.strptime('09:30', '%H:%M').time() and eastern_time.time() <= datetime.strptime('15:59', '%H:%M').time():
-                        data_list.append(data_entry)
-                else:
-                    data_list.append(data_entry)
-
-        if 'next_url' in data and data['next_url']:
-            url = data['next_url'] + '&apiKey=' + API_KEY
-        else:
-            break
-
-    df = pd.DataFrame(data_list)
-    print("[INFO] Data fetching complete.")
-    return df
-
-
-def fetch_polygon_dividends(ticker):
-    """Fetches dividend data from Polygon.io."""
-    url = f'{BASE_URL}/v3/reference/dividends?ticker={ticker}&limit=1000&apiKey={API_KEY}'
+def fetch_polygon_dividends(ticker, cache=None, base_url=BASE_URL):
+    """Fetches dividend data from Polygon.io (raw pages reused from `cache` when given)."""
+    url = f'{base_url}/v3/reference/dividends?ticker={ticker}&limit=1000&apiKey={API_KEY}'
     
     dividends_list = []
+    page = 0
     while True:
-        response = requests.get(url)
-        data = response.json()
+        key = content_key(ticker=ticker, timespan='dividends', as_of=datetime.now().date(), page=page)
+        data = cache.get_json(key) if cache is not None else None
+        if data is None:
+            response = requests.get(url)
+            if response.status_code != 200:
+                raise DownloadError(f"[ERROR] HTTP {response.status_code} for {ticker} dividends")
+            data = response.json()
+            if cache is not None:
+                cache.put_json(key, data, ticker=ticker, timespan='dividends', page=page,
+                               as_of=str(datetime.now().date()))
+        page += 1
         if 'results' in data:
             for entry in data['results']:
                 dividends_list.append({
@@ -101,20 +46,42 @@ def fetch_polygon_dividends(ticker):
     print("[INFO] Dividend data fetching complete.")
     return df
 
+def download_symbol(ticker, from_date, until_date, cache=None, base_url=BASE_URL):
+    """Download minute bars, daily bars and dividends for one symbol and save them per symbol."""
+    # Concurrent, rate-limited and resumable (see async_downloader.py); raw
+    # pages are kept in the local artifact cache, so reruns skip the network
+    with span('download.minute', ticker=ticker) as sp:
+        intra_data = download(ticker, from_date, until_date, 'minute', API_KEY, base_url=base_url, cache=cache)
+        sp.add(bars=len(intra_data))
+    with span('download.day', ticker=ticker):
+        daily_data = download(ticker, from_date, until_date, 'day', API_KEY, base_url=base_url, cache=cache)
+    with span('download.dividends', ticker=ticker):
+        dividends = fetch_polygon_dividends(ticker, cache=cache, base_url=base_url)
+
+    # ===== SAVE DATA (columnar store + CSV export) =====
+    for kind, df in (('intra_data', intra_data), ('daily_data', daily_data), ('dividends', dividends)):
+        write_table(df, table_name(ticker, kind))
+        df.to_csv(f"{table_name(ticker, kind)}.csv", index=False)
+    print(f"[INFO] {ticker}: all data has been saved successfully.")
+
 # ===== EXECUTION =====
 
-if __name__ == "__main__":
-    ticker = 'SPY'
-    from_date = '2016-01-02'
-    until_date = '2025-07-14'
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download minute/daily bars and dividends from Polygon.io.")
+    parser.add_argument("--tickers", nargs="+", default=['SPY'])
+    parser.add_argument("--from-date", default='2016-01-02')
+    parser.add_argument("--until-date", default='2025-07-14')
+    parser.add_argument("--base-url", default=BASE_URL)
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
 
-    spy_intra_data = fetch_polygon_data(ticker, from_date, until_date, 'minute')
-    spy_daily_data = fetch_polygon_data(ticker, from_date, until_date, 'day')
-    dividends = fetch_polygon_dividends(ticker)
+    # Symbols share one API key, so they are fetched one after the other;
+    # each download is already concurrent across date chunks
+    cache = ArtifactCache()
+    for ticker in args.tickers:
+        download_symbol(ticker, args.from_date, args.until_date, cache, args.base_url)
 
-    # ===== SAVE DATA TO CSV =====
-    spy_intra_data.to_csv('spy_intra_data.csv', index=False)
-    spy_daily_data.to_csv('spy_daily_data.csv', index=False)
-    dividends.to_csv('spy_dividends.csv', index=False)
 
-    print("[INFO] All data has been saved successfully.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import io
+import os
+
+import pandas as pd
+import numpy as np
+
+from backtest_engine import build_day_arrays
+from chunked import new_indicator_state, partition_indicators
+from data_store import append_day_arrays, append_table, has_table, read_day_arrays
+from instrumentation import add_trace_arguments, configure, span
+from prepare_indicators import compute_indicators, write_csv
+
+STATE_FILE = "spy_indicator_state.npz"
+PROCESSED_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'day', 'move_open', 'vwap', 'spy_dvol',
+                     'min_from_open', 'minute_of_day', 'move_open_rolling_mean', 'sigma_open', 'dividend']
+READ_BLOCK = 1 << 20         # bytes scanned back from the end of the intra CSV per step
+
+# Float tolerance used by validate(): sigma_open is pandas' rolling mean over the
+# carried windows, which could differ from a full recompute in the last bits.
+VALIDATE_RTOL = 1e-10
+
+
+def build_state(processed):
+    """Snapshot of everything the indicators need to extend `processed` by new days.
+
+    The carried state of chunked.py (see new_indicator_state()) plus the last
+    processed day.
+    """
+    state = new_indicator_state(processed)
+    state['last_day'] = str(pd.to_datetime(processed['day']).dt.date.iloc[-1])
+    return state
+
+
+def save_state(state, path=STATE_FILE):
+    np.savez(path, **state)
+
+
+def load_state(path=STATE_FILE):
+    with np.load(path) as data:
+        state = {key: data[key].item() if data[key].ndim == 0 else data[key] for key in data.files}
+    if 'window' not in state:
+        raise ValueError(f"[ERROR] '{path}' was written by an older version; run init again")
+    return state
+
+
+def read_intra_after(path, last_day, block_bytes=READ_BLOCK):
+    """Bars of a date-sorted intra CSV after `last_day`, parsing only the end of the file.
+
+    The file is scanned backwards a block at a time up to a bar of `last_day`
+    or earlier; only the lines from there on are parsed.
+    """
+    last = str(last_day).encode()
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if not header.startswith(b'caldt,'):
+            intra = pd.read_csv(path, parse_dates=["caldt"])
+            return intra[intra['caldt'].dt.date > pd.Timestamp(last_day).date()].reset_index(drop=True)
+        first = f.tell()
+        position = f.seek(0, os.SEEK_END)
+        while position > first:
+            position = max(first, position - block_bytes)
+            f.seek(position)
+            if position > first:
+                f.readline()             # partial line
+            start = f.tell()
+            line = f.readline()
+            if line and line[:len(last)] <= last:
+                break
+        else:
+            start = first
+        f.seek(start)
+        body = f.read()
+    intra = pd.read_csv(io.BytesIO(header + body), parse_dates=["caldt"])
+    return intra[intra['caldt'].dt.date > pd.Timestamp(last_day).date()].reset_index(drop=True)
+
+
+def update_indicators(state, intra, dividends):
+    """Processed rows for every day in `intra` after the state's last day; advances `state` in place."""
+    last_day = pd.Timestamp(state['last_day']).date()
+    intra = intra[pd.to_datetime(intra['caldt']).dt.date > last_day].reset_index(drop=True)
+    if not len(intra):
+        return pd.DataFrame(columns=PROCESSED_COLUMNS)
+    # Same step (and carried windows) as the partitions of chunked.py
+    new_rows = partition_indicators(intra, dividends, state)[PROCESSED_COLUMNS]
+    state['last_day'] = str(new_rows['day'].iloc[-1])
+    return new_rows
+
+
+def validate(processed, intra, dividends, rtol=VALIDATE_RTOL):
+    """Compare a processed file with a full recompute; returns a list of problems."""
+    full = compute_indicators(intra, dividends)
+    problems = []
+    if len(full) != len(processed):
+        return [f"row count {len(processed)} != full recompute {len(full)}"]
+    if not (pd.to_datetime(processed['day']).dt.date.to_numpy() == full['day'].to_numpy()).all():
+        problems.append("day column differs")
+    for column in PROCESSED_COLUMNS:
+        if column == 'day':
+            continue
+        a = processed[column].to_numpy(dtype=float)
+        b = full[column].to_numpy(dtype=float)
+        if not np.allclose(a, b, rtol=rtol, atol=0.0, equal_nan=True):
+            worst = np.nanmax(np.abs(a - b))
+            problems.append(f"{column}: max abs difference {worst:.3e}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental indicator updates for spy_processed_data.csv.")
+    parser.add_argument("command", choices=["init", "update", "validate"])
+    parser.add_argument("--intra", default="spy_intra_data.csv")
+    parser.add_argument("--dividends", default="spy_dividends.csv")
+    parser.add_argument("--processed", default="spy_processed_data.csv")
+    parser.add_argument("--state", default=STATE_FILE)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    dividends = pd.read_csv(args.dividends, parse_dates=["caldt"])
+
+    if args.command == "init":
+        if os.path.exists(args.processed):
+            # The carried move_open windows must hold the exact values written
+            processed = pd.read_csv(args.processed, index_col=0, float_precision='round_trip')
+        else:
+            processed = compute_indicators(pd.read_csv(args.intra, parse_dates=["caldt"]), dividends)
+            write_csv(processed, args.processed)
+        save_state(build_state(processed), args.state)
+        print(f"[INFO] State snapshot saved in '{args.state}'")
+
+    elif args.command == "update":
+        state = load_state(args.state)
+        last_close = state['last_close']
+        intra = read_intra_after(args.intra, state['last_day'])
+        with span('update_indicators') as sp:
+            new_rows = update_indicators(state, intra, dividends)
+            sp.add(bars=len(new_rows))
+        if len(new_rows):
+            new_rows.to_csv(args.processed, mode='a', header=False)
+            if has_table('spy_processed_data'):
+                # Only the new rows and days are written; the stored history is not read back
+                with span('update_store', bars=len(new_rows)):
+                    append_table(new_rows, 'spy_processed_data')
+                    if read_day_arrays() is not None:
+                        arrays = build_day_arrays(new_rows)
+                        arrays['prev_close'][0] = last_close
+                        arrays['prev_close_adjusted'] = arrays['prev_close'] - arrays['dividend']
+                        append_day_arrays(arrays)
+        save_state(state, args.state)
+        print(f"[INFO] Appended {len(new_rows)} rows ({new_rows['day'].nunique()} days) to '{args.processed}'")
+
+    else:
+        processed = pd.read_csv(args.processed, index_col=0)
+        problems = validate(processed, pd.read_csv(args.intra, parse_dates=["caldt"]), dividends)
+        if problems:
+            for problem in problems:
+                print(f"[ERROR] {problem}")
+            raise SystemExit(1)
+        print("[INFO] Processed data matches a full recompute")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import argparse
+import atexit
+import functools
+import glob
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+ENV_VAR = "MOMENTUM_TRACE"              # trace file path, or 1 for DEFAULT_TRACE_FILE
+ALLOC_ENV_VAR = "MOMENTUM_TRACE_ALLOC"  # 1 to also track Python/NumPy allocations (slower)
+OWNER_ENV_VAR = "MOMENTUM_TRACE_OWNER"  # pid of the process writing the trace, set for its workers
+DEFAULT_TRACE_FILE = "momentum_trace.json"
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_state = {'path': None, 'alloc': False, 'pid': None}
+_events = []
+_counters = {}
+_stack = threading.local()
+
+
+def enabled():
+    return _state['path'] is not None
+
+
+def _now_us():
+    return time.perf_counter_ns() // 1000
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+def _peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+def _part_path(pid):
+    return f"{_state['path']}.{pid}.part"
+
+
+def _emit(event):
+    # Worker processes append their events to a part file right away (pools
+    # may terminate them without running exit hooks); the main process merges them
+    if os.getpid() == _state['pid']:
+        _events.append(event)
+    else:
+        with open(_part_path(os.getpid()), 'a') as f:
+            f.write(json.dumps(event) + "\n")
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Timed region recorded as a complete ("X") trace event.
+
+    Records wall time, RSS at exit, the process peak RSS, and with allocation
+    tracking the peak traced allocation growth inside the span. Counts given
+    to add() are stored with the span, summed into the run counters, and get
+    a matching `<name>_per_sec` rate.
+    """
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = dict(args)
+        self.counts = {}
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def __enter__(self):
+        frames = _frames()
+        if _state['alloc']:
+            current, peak = tracemalloc.get_traced_memory()
+            if frames:
+                frames[-1].alloc_peak = max(frames[-1].alloc_peak, peak)
+            tracemalloc.reset_peak()
+            self.alloc_base = self.alloc_peak = current
+        frames.append(self)
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc):
+        end = _now_us()
+        frames = _frames()
+        frames.pop()
+        seconds = (end - self.start) / 1e6
+        args = {**self.args, **self.counts,
+                'rss_mb': _rss_bytes() / 2 ** 20, 'peak_rss_mb': _peak_rss_bytes() / 2 ** 20}
+        for key, value in self.counts.items():
+            args[f"{key}_per_sec"] = value / seconds if seconds > 0 else None
+            count(key, value)
+        if _state['alloc']:
+            self.alloc_peak = max(self.alloc_peak, tracemalloc.get_traced_memory()[1])
+            args['alloc_peak_mb'] = (self.alloc_peak - self.alloc_base) / 2 ** 20
+            if frames:
+                frames[-1].alloc_peak = max(frames[-1].alloc_peak, self.alloc_peak)
+        _emit({'name': self.name, 'ph': 'X', 'ts': self.start, 'dur': end - self.start,
+               'pid': os.getpid(), 'tid': threading.get_native_id(), 'args': args})
+        return False
+
+
+def _frames():
+    if not hasattr(_stack, 'frames'):
+        _stack.frames = []
+    return _stack.frames
+
+
+def span(name, **args):
+    """Context manager timing a named stage; a shared no-op when tracing is off."""
+    if _state['path'] is None:
+        return _NULL_SPAN
+    return Span(name, args)
+
+
+def traced(name):
+    """Decorator recording every call of a function as a span named `name`."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _state['path'] is None:
+                return func(*args, **kwargs)
+            with Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, value=1):
+    """Add to a run counter (days processed, trades emitted, ...); also a counter ("C") trace event."""
+    if _state['path'] is None:
+        return
+    if os.getpid() == _state['pid']:
+        _counters[name] = _counters.get(name, 0) + value
+        total = _counters[name]
+    else:
+        total = value
+    _emit({'name': name, 'ph': 'C', 'ts': _now_us(), 'pid': os.getpid(), 'args': {name: total}})
+
+
+def summarize(events):
+    """Totals per span name: calls, seconds, max RSS and max allocation peak."""
+    rows = {}
+    for event in events:
+        if event.get('ph') != 'X':
+            continue
+        row = rows.setdefault(event['name'], {'calls': 0, 'seconds': 0.0, 'peak_rss_mb': 0.0})
+        row['calls'] += 1
+        row['seconds'] += event['dur'] / 1e6
+        row['peak_rss_mb'] = max(row['peak_rss_mb'], event['args'].get('peak_rss_mb', 0.0))
+        if 'alloc_peak_mb' in event['args']:
+            row['alloc_peak_mb'] = max(row.get('alloc_peak_mb', 0.0), event['args']['alloc_peak_mb'])
+    return rows
+
+
+def write_trace(path=None):
+    """Write the Chrome trace-event JSON (chrome://tracing, Perfetto), merging worker processes.
+
+    `otherData` holds the run counters and per-span totals used by `diff`.
+    """
+    path = path or _state['path']
+    events = list(_events)
+    counters = dict(_counters)
+    for part in sorted(glob.glob(f"{glob.escape(_state['path'])}.*.part")):
+        with open(part) as f:
+            for line in f:
+                event = json.loads(line)
+                events.append(event)
+                if event['ph'] == 'C':
+                    counters[event['name']] = counters.get(event['name'], 0) + event['args'][event['name']]
+        os.remove(part)
+    events.sort(key=lambda event: event['ts'])
+    trace = {
+        'traceEvents': events,
+        'displayTimeUnit': 'ms',
+        'otherData': {'command': ' '.join(sys.argv), 'counters': counters, 'summary': summarize(events)},
+    }
+    with open(path, 'w') as f:
+        json.dump(trace, f, indent=1)
+    return path
+
+
+def _write_at_exit():
+    if enabled() and os.getpid() == _state['pid']:
+        path = write_trace()
+        print(f"[INFO] Trace saved in '{path}'")
+
+
+def enable(path=DEFAULT_TRACE_FILE, alloc=False):
+    """Turn tracing on for this process and the worker processes it starts."""
+    if enabled():
+        return
+    _state.update(path=os.path.abspath(path), alloc=alloc, pid=os.getpid())
+    for part in glob.glob(f"{glob.escape(_state['path'])}.*.part"):
+        os.remove(part)
+    os.environ[ENV_VAR] = _state['path']
+    os.environ[OWNER_ENV_VAR] = str(os.getpid())
+    if alloc:
+        os.environ[ALLOC_ENV_VAR] = "1"
+        tracemalloc.start()
+    atexit.register(_write_at_exit)
+
+
+def add_trace_arguments(parser):
+    parser.add_argument("--trace", nargs="?", const=DEFAULT_TRACE_FILE, default=None, metavar="PATH",
+                        help=f"Write a timing trace (default: {DEFAULT_TRACE_FILE}); also ${ENV_VAR}")
+    parser.add_argument("--trace-alloc", action="store_true", help="Also track allocations in the trace")
+
+
+def configure(args=None):
+    """Enable tracing from --trace/--trace-alloc (parsed `args`, or sys.argv for scripts without argparse)."""
+    if args is None:
+        parser = argparse.ArgumentParser(add_help=False)
+        add_trace_arguments(parser)
+        args, _ = parser.parse_known_args()
+    if args.trace:
+        enable(args.trace, args.trace_alloc)
+
+
+def _from_environment():
+    path = os.environ.get(ENV_VAR)
+    if not path:
+        return
+    alloc = os.environ.get(ALLOC_ENV_VAR) == "1"
+    owner = os.environ.get(OWNER_ENV_VAR)
+    if owner and int(owner) != os.getpid():
+        # Started by a traced process: events go to part files of its trace
+        _state.update(path=path, alloc=alloc, pid=int(owner))
+        if alloc:
+            tracemalloc.start()
+        return
+    enable(DEFAULT_TRACE_FILE if path == "1" else path, alloc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and compare trace files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_summary = sub.add_parser("summary", help="Time, memory and counters per span")
+    p_summary.add_argument("trace")
+    p_diff = sub.add_parser("diff", help="Compare the per-span totals of two traces")
+    p_diff.add_argument("before")
+    p_diff.add_argument("after")
+    args = parser.parse_args()
+
+    def load(path):
+        with open(path) as f:
+            return json.load(f)['otherData']
+
+    if args.command == "summary":
+        data = load(args.trace)
+        print(pd.DataFrame(data['summary']).T.round(3).to_string())
+        print("\n=== Counters ===")
+        for name, value in data['counters'].items():
+            print(f"{name}: {value}")
+    else:
+        before, after = load(args.before), load(args.after)
+        table = pd.DataFrame({
+            'seconds_before': pd.Series({k: v['seconds'] for k, v in before['summary'].items()}),
+            'seconds_after': pd.Series({k: v['seconds'] for k, v in after['summary'].items()}),
+            'rss_before': pd.Series({k: v['peak_rss_mb'] for k, v in before['summary'].items()}),
+            'rss_after': pd.Series({k: v['peak_rss_mb'] for k, v in after['summary'].items()}),
+        })
+        table['change (%)'] = (table['seconds_after'] / table['seconds_before'] - 1) * 100
+        print(table.round(3).to_string())
+
+
+_from_environment()
+
+if __name__ == "__main__":
+    main()
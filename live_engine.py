@@ -0,0 +1,333 @@
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (AUM_0, BAND_MULT, COMMISSION, MAX_LEVERAGE, MIN_COMM_PER_ORDER,
+                             MINUTES_PER_SESSION, SIZING_TYPE, TARGET_VOL, TRADE_FREQ,
+                             build_day_arrays, run_backtest)
+from chunked import new_indicator_state, next_sigma_open, partition_indicators
+from instrumentation import add_trace_arguments, configure, span
+from prepare_indicators import DVOL_WINDOW, compute_indicators, window_std
+from trade_log import TRADE_COLUMNS, extract_trades, time_labels
+
+SESSION_OPEN_MINUTE = 9 * 60 + 30
+
+
+class LiveEngine:
+    """Event-driven version of backtest_strategy.py for one minute bar at a time.
+
+    Session inputs (sigma_open for every minute of the day, spy_dvol, previous
+    close) come from the indicator state carried by chunked.py and are
+    prepared once in begin_day(). on_bar() then does a constant amount of
+    scalar work: running VWAP, band check, the trade_freq gate and the
+    trade-log state machine.
+    close_day() sizes the day's P&L like compound() and advances the state.
+
+    Bars are assumed to be stamped on whole minutes, as produced by
+    download_market_data.py; bars outside 09:30-15:59 ET are ignored. `aum`
+    is the starting balance and `AUM_0` the one compound() restarts from
+    after a day without sigma_open.
+    """
+
+    def __init__(self, state, aum=AUM_0, dividends=None, band_mult=BAND_MULT, trade_freq=TRADE_FREQ,
+                 commission=COMMISSION, min_comm_per_order=MIN_COMM_PER_ORDER,
+                 sizing_type=SIZING_TYPE, target_vol=TARGET_VOL, max_leverage=MAX_LEVERAGE, AUM_0=AUM_0):
+        self.state = state
+        self.aum = aum
+        self.AUM_0 = AUM_0
+        self.dividends = dividends or {}
+        self.band_mult = band_mult
+        self.trade_freq = trade_freq
+        self.commission = commission
+        self.min_comm_per_order = min_comm_per_order
+        self.sizing_type = sizing_type
+        self.target_vol = target_vol
+        self.max_leverage = max_leverage
+        self.trades = []
+        self.daily = []
+        self.day = None
+
+    # === Session open ===
+    def begin_day(self, day):
+        """Precompute everything that is fixed for the session."""
+        state = self.state
+        sigma = next_sigma_open(state, np.arange(MINUTES_PER_SESSION + 1))
+
+        self.day = day
+        self.dividend = float(self.dividends.get(day, 0.0))
+        self.prev_close_adjusted = float(state['last_close']) - self.dividend
+        self.spy_dvol = float(window_std(state['ret_tail'][:DVOL_WINDOW]))
+        self.sigma_open = sigma.tolist()
+        self.up_mult = (1 + self.band_mult * sigma).tolist()
+        self.down_mult = (1 - self.band_mult * sigma).tolist()
+        self.bars = []
+        self.weighted = np.zeros(MINUTES_PER_SESSION)
+
+        self.shares = 0
+        self.prev_aum = self.aum
+        self.has_sigma = False
+        self.cum_vol_x_hlc = 0.0
+        self.cum_volume = 0.0
+        self.prev_price = None
+        self.held = 0          # signal of the latest trade_freq gate
+        self.exposure = 0      # exposure of the previous bar
+        self.trades_count = 0
+        self.position = 0      # trade-log position
+        self.entry = None
+
+    def _size(self, open_price):
+        if self.sizing_type == "vol_target":
+            if math.isnan(self.spy_dvol) or self.spy_dvol == 0:
+                return round(self.prev_aum / open_price * self.max_leverage)
+            return round(self.prev_aum / open_price * min(self.target_vol / self.spy_dvol, self.max_leverage))
+        return round(self.prev_aum / open_price)
+
+    # === Per bar ===
+    def on_bar(self, timestamp, open_, high, low, close, volume):
+        """Process one bar; returns an order dict when the target position changes."""
+        minute = timestamp.hour * 60 + timestamp.minute - SESSION_OPEN_MINUTE + 1
+        if not 1 <= minute <= MINUTES_PER_SESSION:
+            # Pre-/post-market bars are not part of the processed data
+            return None
+        i = len(self.bars)
+        self.bars.append((timestamp, open_, high, low, close, volume))
+
+        if i == 0:
+            self.band_high = (max(open_, self.prev_close_adjusted)
+                              if self.prev_close_adjusted == self.prev_close_adjusted else math.nan)
+            self.band_low = (min(open_, self.prev_close_adjusted)
+                             if self.prev_close_adjusted == self.prev_close_adjusted else math.nan)
+            self.shares = self._size(open_)
+
+        # Running VWAP and bands for this minute
+        self.cum_vol_x_hlc += volume * ((high + low + close) / 3)
+        self.cum_volume += volume
+        vwap = self.cum_vol_x_hlc / self.cum_volume
+        upper = self.band_high * self.up_mult[minute]
+        lower = self.band_low * self.down_mult[minute]
+        if self.sigma_open[minute] == self.sigma_open[minute]:
+            self.has_sigma = True
+        signal = 1 if close > upper and close > vwap else -1 if close < lower and close < vwap else 0
+
+        # P&L of the exposure held over this bar (the latest gate's signal, lagged one bar)
+        exposure = self.held
+        if i:
+            self.weighted[i] = exposure * (close - self.prev_price)
+        self.trades_count += abs(exposure - self.exposure)
+        self.exposure = exposure
+        self.prev_price = close
+
+        self._track_trade(minute, close, exposure, signal, vwap, upper, lower)
+
+        # Position changes are decided on trade_freq boundaries only
+        if minute % self.trade_freq != 0:
+            return None
+        order = None
+        if signal != self.held:
+            order = {'time': timestamp, 'target': signal, 'shares': self.shares * signal}
+        self.held = signal
+        return order
+
+    def _track_trade(self, minute, price, exposure, signal, vwap, upper, lower):
+        """Trade-log state machine of backtest_strategy.py (see trade_log.positions)."""
+        if self.position == 0 and exposure != 0:
+            self.position = exposure
+            self.entry = (minute, price)
+        elif self.position != 0 and exposure != self.position:
+            if signal == 1:
+                reason = ("signal_change_ub_vwap" if price > upper and price > vwap else
+                          "signal_change_ub" if price > upper else "signal_change_vwap")
+            elif signal == -1:
+                reason = ("signal_change_lb_vwap" if price < lower and price < vwap else
+                          "signal_change_lb" if price < lower else "signal_change_vwap")
+            else:
+                reason = "signal_change_no_new_signal"
+            self._log_trade(minute, price, reason)
+
+    def _log_trade(self, exit_minute, exit_price, reason):
+        entry_minute, entry_price = self.entry
+        side = float(self.position)
+        entry_price = np.float64(entry_price)
+        pnl = (exit_price - entry_price) * self.shares * side
+        pnl_pct = (exit_price / entry_price - 1) * 100 * side
+        self.trades.append({
+            "Date": self.day,
+            "Open_Time": time_labels(entry_minute),
+            "Open_Price": round(entry_price, 2),
+            "Exit_Time": time_labels(exit_minute),
+            "Exit_Price": round(np.float64(exit_price), 2),
+            "Shares": self.shares * side,
+            "Profit%": round(pnl_pct, 2),
+            "P&L": round(pnl, 2),
+            "Account_Balance": round(self.prev_aum + pnl, 2),
+            "Side": "long" if side == 1 else "short",
+            "exit_reason": reason,
+        })
+        self.position = 0
+        self.entry = None
+
+    # === Session close ===
+    def close_day(self):
+        """Close open positions, book the day's P&L and roll the indicator state."""
+        n = len(self.bars)
+        if self.position != 0:
+            self._log_trade(MINUTES_PER_SESSION, self.prev_price, "end_of_day")
+        self.trades_count += abs(self.exposure)
+
+        traded = self.has_sigma and self.prev_close_adjusted == self.prev_close_adjusted
+        ret = math.nan
+        if traded:
+            gross_pnl = float(self.weighted[:n].sum()) * self.shares
+            net_pnl = gross_pnl - self.trades_count * max(self.min_comm_per_order, self.commission * self.shares)
+            self.aum = self.prev_aum + net_pnl
+            ret = net_pnl / self.prev_aum
+        else:
+            # Like compound(): a day that is not traded leaves AUM_0 as the next day's balance
+            self.aum = self.AUM_0
+        self.daily.append({'day': self.day, 'ret': ret, 'AUM': self.aum, 'shares': self.shares if traded else 0})
+
+        bars = pd.DataFrame(self.bars, columns=['caldt', 'open', 'high', 'low', 'close', 'volume'])
+        dividend = pd.DataFrame({'caldt': [pd.Timestamp(self.day)], 'dividend': [self.dividend]})
+        partition_indicators(bars, dividend, self.state)
+        self.day = None
+        return self.daily[-1]
+
+
+# === Replay harness ===
+def replay(engine, intra):
+    """Feed historical bars through `engine`; returns per-bar latencies in ns."""
+    caldt = pd.to_datetime(intra['caldt'])
+    days = caldt.dt.date.to_numpy()
+    timestamps = caldt.dt.to_pydatetime()
+    columns = [intra[c].to_numpy(dtype=float).tolist() for c in ['open', 'high', 'low', 'close', 'volume']]
+    latencies = np.empty(len(intra), dtype=np.int64)
+    clock = time.perf_counter_ns
+
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    stops = np.r_[starts[1:], len(days)]
+    for start, stop in zip(starts, stops):
+        engine.begin_day(days[start])
+        for i in range(start, stop):
+            t0 = clock()
+            engine.on_bar(timestamps[i], columns[0][i], columns[1][i], columns[2][i], columns[3][i],
+                          columns[4][i])
+            latencies[i] = clock() - t0
+        engine.close_day()
+    return latencies
+
+
+def latency_histogram(latencies, buckets_us=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)):
+    """Text histogram of per-bar latencies (ns) in microsecond buckets."""
+    us = np.asarray(latencies) / 1000
+    edges = [0, *buckets_us, np.inf]
+    counts, _ = np.histogram(us, bins=edges)
+    lines = [f"p50={np.percentile(us, 50):.1f}us  p99={np.percentile(us, 99):.1f}us  max={us.max():.1f}us"]
+    for lo, hi, count in zip(edges[:-1], edges[1:], counts):
+        label = f"{lo:g}-{hi:g}us" if np.isfinite(hi) else f">{lo:g}us"
+        bar = '#' * int(round(50 * count / max(counts.max(), 1)))
+        lines.append(f"{label:>12} {count:9d} {bar}")
+    return "\n".join(lines)
+
+
+def compare_with_batch(processed, intra, dividends, start_day, **params):
+    """Replay every day from `start_day` and compare trades/AUM with the batch backtest.
+
+    The engine is seeded with the indicator state and the batch AUM of the day
+    before `start_day`. Returns (problems, latencies).
+    """
+    processed = processed.copy()
+    processed['day'] = pd.to_datetime(processed['day']).dt.date
+    arrays = build_day_arrays(processed)
+    strat = run_backtest(arrays, **params)
+    batch_trades = extract_trades(arrays, strat, params.get('band_mult', BAND_MULT),
+                                  params.get('trade_freq', TRADE_FREQ))
+
+    history = processed[processed['day'] < start_day]
+    state = new_indicator_state(history)
+    dividends = dividends.copy()
+    dividend_by_day = dict(zip(pd.to_datetime(dividends['caldt']).dt.date, dividends['dividend']))
+    engine = LiveEngine(state, aum=float(strat['AUM'][strat.index < start_day].iloc[-1]),
+                        dividends=dividend_by_day, **params)
+    intra = intra[pd.to_datetime(intra['caldt']).dt.date >= start_day]
+    with span('replay') as sp:
+        latencies = replay(engine, intra)
+        sp.add(bars=len(latencies))
+
+    problems = []
+    live_trades = pd.DataFrame(engine.trades, columns=TRADE_COLUMNS)
+    expected = batch_trades[batch_trades['Date'] >= start_day].reset_index(drop=True)
+    if len(live_trades) != len(expected):
+        problems.append(f"{len(live_trades)} live trades vs {len(expected)} in the batch backtest")
+    elif live_trades.to_csv(index=False) != expected.to_csv(index=False):
+        differs = (live_trades.astype(str) != expected.astype(str)).any(axis=1)
+        problems.append(f"{int(differs.sum())} trades differ, first on {live_trades['Date'][differs.idxmax()]}")
+
+    daily = pd.DataFrame(engine.daily).set_index('day')
+    batch_aum = strat['AUM'].reindex(daily.index)
+    if not np.array_equal(daily['AUM'].to_numpy(), batch_aum.to_numpy()):
+        worst = np.nanmax(np.abs(daily['AUM'].to_numpy() - batch_aum.to_numpy()))
+        problems.append(f"AUM differs from the batch backtest (max abs difference {worst:.3e})")
+    return problems, latencies
+
+
+def no_sigma_day_inputs(n_days=40, gap_day=30, split_minute=200, seed=0):
+    """Generated (processed, intra, dividends, start_day) with one day that has no sigma_open.
+
+    Every day keeps its first `split_minute` bars except day `gap_day`, which
+    only keeps the later ones: none of its minutes has a sigma_open history,
+    so the batch backtest skips it and sizes the next day from AUM_0.
+    Replaying starts a few days before it.
+    """
+    from synthetic_data import generate_symbol
+
+    intra, _, dividends = generate_symbol('SPY', years=0.25, seed=seed)
+    caldt = pd.to_datetime(intra['caldt'])
+    days = caldt.dt.normalize()
+    day_index = np.searchsorted(days.unique(), days)
+    minute = (caldt - days) // pd.Timedelta(minutes=1) - SESSION_OPEN_MINUTE + 1
+    keep = (day_index < n_days) & ((minute <= split_minute) != (day_index == gap_day))
+    intra = intra[keep].reset_index(drop=True)
+    processed = compute_indicators(intra, dividends)
+    return processed, intra, dividends, processed['day'].unique()[gap_day - 5]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay historical bars through the live engine.")
+    parser.add_argument("--intra", default="spy_intra_data.csv")
+    parser.add_argument("--dividends", default="spy_dividends.csv")
+    parser.add_argument("--processed", default="spy_processed_data.csv")
+    parser.add_argument("--start", default=None, help="First replayed day (default: after --warmup-days)")
+    parser.add_argument("--warmup-days", type=int, default=20)
+    parser.add_argument("--band-mult", type=float, default=BAND_MULT)
+    parser.add_argument("--trade-freq", type=int, default=TRADE_FREQ)
+    parser.add_argument("--no-sigma-day", action="store_true",
+                        help="Replay generated bars with a day without sigma_open instead of the data files")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    if args.no_sigma_day:
+        processed, intra, dividends, start_day = no_sigma_day_inputs()
+    else:
+        processed = pd.read_csv(args.processed, index_col=0)
+        intra = pd.read_csv(args.intra, parse_dates=["caldt"])
+        dividends = pd.read_csv(args.dividends, parse_dates=["caldt"])
+        days = pd.to_datetime(processed['day']).dt.date.unique()
+        start_day = pd.Timestamp(args.start).date() if args.start else days[args.warmup_days]
+
+    problems, latencies = compare_with_batch(processed, intra, dividends, start_day,
+                                             band_mult=args.band_mult, trade_freq=args.trade_freq)
+    print(f"[INFO] Replayed {len(latencies)} bars from {start_day}")
+    print(latency_histogram(latencies))
+    if problems:
+        for problem in problems:
+            print(f"[ERROR] {problem}")
+        raise SystemExit(1)
+    print("[INFO] Live engine trades and AUM match the batch backtest")
+
+
+if __name__ == "__main__":
+    main()
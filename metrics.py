@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+ROLLING_WINDOWS = (63, 252)
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# Keys of matrix_metrics(), in the order performance_stats() prints them
+STATS = ['Total Return (%)', 'Annualized Return (%)', 'Annualized Volatility (%)', 'Sharpe Ratio',
+         'Hit Ratio (%)', 'Max Drawdown (%)', 'Alpha (%)', 'Beta']
+
+
+def max_drawdown(returns, growth=None):
+    """Max drawdown (%) of the equity curves compounded along axis 1, starting at 1.
+
+    Works in place on `returns`; the final equity of every row is written to
+    `growth` when given.
+    """
+    equity = np.add(returns, 1, out=returns)
+    np.cumprod(equity, axis=1, out=equity)
+    if growth is not None:
+        growth[:] = equity[:, -1]
+    peak = np.maximum.accumulate(equity, axis=1)
+    np.maximum(peak, 1.0, out=peak)
+    np.divide(equity, peak, out=peak)
+    return (1 - peak.min(axis=1)) * 100
+
+
+def alpha_beta(Y, X):
+    """Closed-form OLS of every row of Y on X (rows or one shared row): annualized alpha (%) and beta.
+
+    Days where X is NaN are left out of their row's regression.
+    """
+    n = Y.shape[-1]
+    missing = np.isnan(X)
+    if missing.any():
+        n = np.count_nonzero(~missing, axis=-1)
+        X = np.where(missing, 0.0, X)
+        Y = np.where(missing, 0.0, Y)
+        dx = np.where(missing, 0.0, X - X.sum(axis=-1, keepdims=True) / n[..., None])
+    else:
+        dx = X - X.sum(axis=-1, keepdims=True) / n
+    mean_y = Y.sum(axis=-1) / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        beta = (dx * Y).sum(axis=-1) / (dx * dx).sum(axis=-1)
+    return (mean_y - beta * X.sum(axis=-1) / n) * 100 * TRADING_DAYS, beta
+
+
+def matrix_metrics(Y, X, aum=None):
+    """performance_stats() metrics for every row of daily strategy (Y) and benchmark (X) returns.
+
+    One vectorized pass over a dense (series x days) matrix: each row is a
+    backtest, a bootstrap resample, ... `X` is a row per series or one shared
+    row. Max drawdown comes from `aum` (same shape) when given, else from the
+    returns compounded from 1. `Y` is overwritten.
+    """
+    n = Y.shape[1]
+    mean_y = Y.sum(axis=1) / n
+    std_y = np.sqrt(((Y - mean_y[:, None]) ** 2).sum(axis=1) / (n - 1))
+    alpha, beta = alpha_beta(Y, X)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hit = np.count_nonzero(Y > 0, axis=1) / np.count_nonzero(Y, axis=1) * 100
+        sharpe = mean_y / std_y * np.sqrt(TRADING_DAYS)
+    growth = np.empty(len(Y))
+    drawdown = max_drawdown(Y, growth)
+    if aum is not None:
+        drawdown = (1 - (aum / np.maximum.accumulate(aum, axis=1)).min(axis=1)) * 100
+    return {
+        'Total Return (%)': (growth - 1) * 100,
+        'Annualized Return (%)': (growth ** (TRADING_DAYS / n) - 1) * 100,
+        'Annualized Volatility (%)': std_y * np.sqrt(TRADING_DAYS) * 100,
+        'Sharpe Ratio': sharpe,
+        'Hit Ratio (%)': hit,
+        'Max Drawdown (%)': drawdown,
+        'Alpha (%)': alpha,
+        'Beta': beta,
+    }
+
+
+def score_runs(ret, aum, ret_bench):
+    """performance_stats() of many backtests at once; `ret`/`aum` are (runs x days), NaN on untraded days.
+
+    Runs over the same day arrays share their untraded days, so they are
+    scored as one dense matrix; otherwise each run is scored on its own days.
+    Alpha/beta skip the days where the benchmark is missing. Returns one row
+    per run.
+    """
+    ret, aum = np.asarray(ret, dtype=float), np.asarray(aum, dtype=float)
+    ret_bench = np.asarray(ret_bench, dtype=float)
+    traded = ~np.isnan(ret)
+    if not (traded == traded[:1]).all():
+        return pd.concat([score_runs(r[None], a[None], ret_bench) for r, a in zip(ret, aum)], ignore_index=True)
+
+    Y, X = ret[:, traded[0]], ret_bench[traded[0]]
+    paired = ~np.isnan(X)
+    scores = pd.DataFrame(matrix_metrics(Y.copy(), X, aum), columns=STATS)
+    if not paired.all():
+        scores['Alpha (%)'], scores['Beta'] = alpha_beta(Y[:, paired], X[paired])
+    return scores
+
+
+def drawdown_period(equity):
+    """Max drawdown (%) of an equity Series with the dates of its peak and valley."""
+    values = equity.to_numpy(dtype=float)
+    drawdown = values / np.maximum.accumulate(values) - 1
+    valley = int(np.argmin(drawdown))
+    peak = int(np.argmax(values[:valley + 1]))
+    return drawdown[valley] * -100, equity.index[peak], equity.index[valley]
+
+
+def performance_metrics(ret, ret_bench, equity=None):
+    """Full statistics of one daily return series against a benchmark.
+
+    The matrix_metrics() block (days where `ret` is NaN are skipped; alpha/beta
+    use the days where both series exist), plus win rate (share of positive
+    days), profit factor (gains over losses) and the drawdown peak/valley
+    dates. Drawdowns come from `equity` when given, else from compounded `ret`.
+    """
+    Y = ret.dropna()
+    X = ret_bench.reindex(Y.index)
+    y = Y.to_numpy(dtype=float)
+    stats = {k: v[0] for k, v in matrix_metrics(y[None, :].copy(), X.to_numpy(dtype=float)[None, :]).items()}
+    paired = X.notna().to_numpy()
+    if not paired.all():
+        alpha, beta = alpha_beta(y[None, paired], X.to_numpy(dtype=float)[None, paired])
+        stats.update({'Alpha (%)': alpha[0], 'Beta': beta[0]})
+
+    gains, losses = y[y > 0].sum(), y[y < 0].sum()
+    stats['Win Rate (%)'] = np.count_nonzero(y > 0) / len(y) * 100
+    stats['Profit Factor'] = gains / -losses if losses < 0 else np.nan
+    if equity is None:
+        equity = (1 + Y).cumprod()
+    stats['Max Drawdown (%)'], stats['Drawdown Peak'], stats['Drawdown Valley'] = drawdown_period(equity.dropna())
+    return stats
+
+
+def rolling_metrics(ret, ret_bench=None, windows=ROLLING_WINDOWS):
+    """Rolling Sharpe, volatility (%) and, with a benchmark, beta over each window of traded days."""
+    Y = ret.dropna()
+    columns = {}
+    for window in windows:
+        rolling = Y.rolling(window)
+        mean, std = rolling.mean(), rolling.std()
+        columns[f'sharpe_{window}'] = mean / std * np.sqrt(TRADING_DAYS)
+        columns[f'volatility_{window} (%)'] = std * np.sqrt(TRADING_DAYS) * 100
+        if ret_bench is not None:
+            X = ret_bench.reindex(Y.index)
+            columns[f'beta_{window}'] = rolling.cov(X) / X.rolling(window).var()
+    return pd.DataFrame(columns, index=Y.index)
+
+
+def period_returns(ret):
+    """Monthly returns (%) as a years x Jan..Dec table plus a Yearly column, compounded from daily returns."""
+    Y = ret.dropna()
+    index = pd.DatetimeIndex(Y.index)
+    growth = (1 + Y).groupby([index.year, index.month]).prod()
+    table = ((growth - 1) * 100).unstack(level=1).reindex(columns=range(1, 13))
+    table.columns = MONTHS
+    table['Yearly'] = (growth.groupby(level=0).prod() - 1) * 100
+    return table.rename_axis('Year')
@@ -0,0 +1,45 @@
+import argparse
+import importlib
+import os
+import sys
+
+# Figures are written to files, so no display is needed unless a backend is chosen
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+# Subcommand -> (module with main(argv), help). Modules are imported only when
+# their subcommand runs, so `momentum.py --help` or a backtest never pays for
+# the download stack (requests) or matplotlib.
+COMMANDS = {
+    'download': ('download_market_data', "Download minute/daily bars and dividends from Polygon.io"),
+    'align': ('session_grid', "Align minute bars on the session calendar and report coverage"),
+    'prepare': ('prepare_indicators', "Compute the strategy indicators"),
+    'pyramid': ('bar_pyramid', "Store and check the 5/15/30-minute bar levels"),
+    'backtest': ('backtest_strategy', "Backtest the strategy and log its trades"),
+    'report': ('check_results', "Post-analysis of trades.csv against SPY"),
+    'results': ('results_store', "Query the results database of backtests and sweeps"),
+    'compare': ('Polygon_Vs_Alpaca_Market_Data.compare_datasets', "Diff two minute-bar files (Polygon vs Alpaca)"),
+    'convert': ('Polygon_Vs_Alpaca_Market_Data.convert_data_from_alpaca', "Convert Alpaca 1-minute bars"),
+}
+
+
+def run(command, argv=()):
+    """Run one subcommand with its own arguments, e.g. run('backtest', ['--no-plot'])."""
+    module, _ = COMMANDS[command]
+    return importlib.import_module(module).main(list(argv))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="momentum.py", description="Intraday momentum strategy pipeline.",
+                                     epilog="Run 'momentum.py <command> --help' for the options of a command.")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (_, help_text) in COMMANDS.items():
+        # Options are forwarded untouched and parsed by the command's own main()
+        sub.add_parser(name, help=help_text, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+    # The command's parser takes its usage name from argv[0]: "momentum.py backtest"
+    sys.argv[0] = f"{parser.prog} {args.command}"
+    return run(args.command, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import argparse
+import itertools
+import os
+import tempfile
+from multiprocessing import Pool
+
+import pandas as pd
+
+from backtest_engine import (AUM_0, BAND_MULT, COMMISSION, MAX_LEVERAGE, MIN_COMM_PER_ORDER, SIZING_TYPE,
+                             TARGET_VOL, TRADE_FREQ, build_day_arrays, load_daily_returns, load_day_arrays,
+                             load_processed_data, performance_stats, save_day_arrays)
+from bar_pyramid import sweep_arrays
+from batch_backtest import DEFAULT_MAX_BYTES, run_batch
+from stage_cache import DEFAULT_CACHE_BYTES, StageCache, StagedPipeline, data_version
+from instrumentation import add_trace_arguments, configure, span
+from metrics import score_runs
+from results_store import DB_FILE, ResultsWriter
+
+# Parameters that can be swept, in the order they appear in the results table
+SWEEP_PARAMS = ['band_mult', 'trade_freq', 'target_vol', 'max_leverage', 'sizing_type']
+
+# Parameters every run uses without sweeping them, recorded with each run in the results database
+FIXED_PARAMS = {'AUM_0': AUM_0, 'commission': COMMISSION, 'min_comm_per_order': MIN_COMM_PER_ORDER}
+
+# Per-worker state, attached once by _init_worker()
+_PIPELINE = None
+_RET_SPY = None
+_WRITER = None
+_RESULTS = None
+
+
+def expand_grid(grid):
+    """Cartesian product of a {param: [values]} grid as a list of param dicts."""
+    names = [name for name in SWEEP_PARAMS if name in grid]
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"[ERROR] Unknown sweep parameters: {sorted(unknown)}")
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def _init_worker(arrays_dir, ret_spy, cache_bytes, cache_dir, results=None):
+    global _PIPELINE, _RET_SPY, _WRITER, _RESULTS
+    arrays = load_day_arrays(arrays_dir, mmap_mode='r')
+    _PIPELINE = StagedPipeline(arrays, StageCache(cache_bytes, cache_dir))
+    _RET_SPY = ret_spy
+    _RESULTS = results
+    if results is not None:
+        _WRITER = ResultsWriter(results['path'], 'sweep', results['label'])
+
+
+def _run_chunk(chunk):
+    """Backtest a chunk of combinations; with a results database, the chunk is appended as one batch."""
+    rows = []
+    for params in chunk:
+        strat = _PIPELINE.run(**params)
+        strat['ret_spy'] = _RET_SPY.where(strat['ret'].notna())
+        stats = performance_stats(strat)
+        rows.append({**params, **stats})
+        if _WRITER is not None:
+            daily = strat[['ret', 'AUM']] if _RESULTS['store_daily'] else None
+            _WRITER.add({**FIXED_PARAMS, **params}, stats, _RESULTS['data_hash'], daily)
+    if _WRITER is not None:
+        _WRITER.flush()
+    return rows, os.getpid(), _PIPELINE.cache.stats()
+
+
+def _merge_cache_stats(per_worker):
+    merged = {}
+    for stats in per_worker.values():
+        for stage, counts in stats.items():
+            if isinstance(counts, dict):
+                total = merged.setdefault(stage, {'memory_hits': 0, 'disk_hits': 0, 'misses': 0})
+                for name in total:
+                    total[name] += counts[name]
+    for counts in merged.values():
+        lookups = sum(counts.values())
+        counts['hit_rate'] = (counts['memory_hits'] + counts['disk_hits']) / lookups if lookups else 0.0
+    return merged
+
+
+def _data_hash(df, arrays, resolution):
+    """Version of the minute data, so sweeps on any bar level match backtests in the results database."""
+    return data_version(arrays if resolution == 1 else build_day_arrays(df))
+
+
+def run_sweep(grid, df=None, ret_spy=None, workers=None, chunksize=None,
+              cache_bytes=DEFAULT_CACHE_BYTES, cache_dir=None, results_db=None, label=None, store_daily=False,
+              resolution=1):
+    """Backtest every combination in `grid` across a process pool.
+
+    The processed data is reshaped once and written as .npy files that every
+    worker memory-maps read-only, so the minute arrays are never pickled.
+    Each worker memoizes the signal/exposure stages (see stage_cache.py), and
+    combinations are handed out in contiguous chunks so runs that differ only
+    in sizing or commission land on the same worker and reuse them.
+    With `results_db`, every worker appends its chunks to the results
+    database (results_store.py), with the daily series when `store_daily`.
+    With `resolution` > 1, the arrays hold `resolution`-minute bars whose
+    ends fall on every trade_freq gate (bar_pyramid.py).
+    Returns one row per combination with the performance_stats() metrics and
+    the merged per-stage cache statistics.
+    """
+    if df is None:
+        df = load_processed_data()
+    if ret_spy is None:
+        ret_spy = load_daily_returns()
+
+    arrays = sweep_arrays(df, grid.get('trade_freq', [TRADE_FREQ]), resolution)
+    ret_spy = ret_spy.reindex(arrays['days'])
+    combos = expand_grid(grid)
+    workers = min(workers or os.cpu_count(), len(combos))
+    if chunksize is None:
+        chunksize = max(1, len(combos) // (workers * 4))
+
+    results = None
+    if results_db:
+        results = {'path': results_db, 'label': label, 'store_daily': store_daily,
+                   'data_hash': _data_hash(df, arrays, resolution)}
+    chunks = [combos[i:i + chunksize] for i in range(0, len(combos), chunksize)]
+
+    with tempfile.TemporaryDirectory(prefix="momentum_sweep_") as arrays_dir:
+        save_day_arrays(arrays, arrays_dir)
+        del arrays
+        initargs = (arrays_dir, ret_spy, cache_bytes, cache_dir, results)
+        with Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            outputs = pool.map(_run_chunk, chunks, chunksize=1)
+
+    per_worker = {pid: stats for _, pid, stats in outputs}
+    return pd.DataFrame([row for rows, _, _ in outputs for row in rows]), _merge_cache_stats(per_worker)
+
+
+def run_sweep_batch(grid, df=None, ret_spy=None, max_bytes=DEFAULT_MAX_BYTES, results_db=None, label=None,
+                    store_daily=False, resolution=1):
+    """Same results table as run_sweep(), computed in one broadcast pass in-process."""
+    if df is None:
+        df = load_processed_data()
+    if ret_spy is None:
+        ret_spy = load_daily_returns()
+
+    arrays = sweep_arrays(df, grid.get('trade_freq', [TRADE_FREQ]), resolution)
+    ret_spy = ret_spy.reindex(arrays['days'])
+    combos = pd.DataFrame(expand_grid(grid))
+    _, ret, aum = run_batch(arrays, {name: combos[name].tolist() for name in combos}, max_bytes)
+
+    with span('score', runs=len(combos)):
+        scores = score_runs(ret.to_numpy().T, aum.to_numpy().T, ret_spy.to_numpy())
+    if results_db:
+        data_hash = _data_hash(df, arrays, resolution)
+        with span('results_db', runs=len(combos)), ResultsWriter(results_db, 'sweep', label) as writer:
+            for i, (params, stats) in enumerate(zip(combos.to_dict('records'), scores.to_dict('records'))):
+                daily = pd.DataFrame({'ret': ret[i], 'AUM': aum[i]}) if store_daily else None
+                writer.add({**FIXED_PARAMS, **params}, stats, data_hash, daily)
+    return pd.concat([combos, scores], axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter sweep for the intraday momentum strategy.")
+    parser.add_argument("--band-mult", type=float, nargs="+", default=[BAND_MULT])
+    parser.add_argument("--trade-freq", type=int, nargs="+", default=[TRADE_FREQ])
+    parser.add_argument("--target-vol", type=float, nargs="+", default=[TARGET_VOL])
+    parser.add_argument("--max-leverage", type=float, nargs="+", default=[MAX_LEVERAGE])
+    parser.add_argument("--sizing-type", nargs="+", default=[SIZING_TYPE], choices=["vol_target", "full"])
+    parser.add_argument("--data", default="spy_processed_data.csv")
+    parser.add_argument("--daily", default="spy_daily_data.csv")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Evaluate all combinations in one broadcast pass instead of a process pool")
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES,
+                        help="Memory budget per broadcast chunk with --batch")
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help="Per-worker in-memory stage cache size")
+    parser.add_argument("--cache-dir", default=None, help="Optional on-disk stage cache directory")
+    parser.add_argument("--resolution", type=int, default=1, metavar="MINUTES",
+                        help="Bar size; 5/15/30 backtest coarse bars dividing every --trade-freq (default: 1)")
+    parser.add_argument("--output", default="sweep_results.csv")
+    parser.add_argument("--results-db", nargs="?", const=DB_FILE, default=None, metavar="PATH",
+                        help=f"Also record every run in {DB_FILE} (see results_store.py)")
+    parser.add_argument("--label", default=None, help="Label stored with the runs in --results-db")
+    parser.add_argument("--store-daily", action="store_true", help="Store the daily series of every run too")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    grid = {
+        'band_mult': args.band_mult,
+        'trade_freq': args.trade_freq,
+        'target_vol': args.target_vol,
+        'max_leverage': args.max_leverage,
+        'sizing_type': args.sizing_type,
+    }
+    df = load_processed_data(args.data)
+    ret_spy = load_daily_returns(args.daily)
+    with span('sweep', batch=args.batch) as sp:
+        if args.batch:
+            results = run_sweep_batch(grid, df, ret_spy, args.max_bytes, args.results_db, args.label,
+                                      args.store_daily, args.resolution)
+        else:
+            results, cache_stats = run_sweep(grid, df, ret_spy, args.workers,
+                                             cache_bytes=args.cache_mb * 1024 * 1024, cache_dir=args.cache_dir,
+                                             results_db=args.results_db, label=args.label,
+                                             store_daily=args.store_daily, resolution=args.resolution)
+        sp.add(combinations=len(results))
+    if not args.batch:
+        for stage, counts in cache_stats.items():
+            print(f"[INFO] Cache {stage}: hit rate {counts['hit_rate']:.1%} "
+                  f"({counts['memory_hits']} memory, {counts['disk_hits']} disk, {counts['misses']} misses)")
+    results.to_csv(args.output, index=False)
+    print(f"[INFO] {len(results)} combinations saved to {args.output}")
+    if args.results_db:
+        print(f"[INFO] Runs recorded in {args.results_db}")
+    print(results.sort_values('Sharpe Ratio', ascending=False).head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
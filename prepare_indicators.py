@@ -1,62 +1,228 @@
+import argparse
+import os
+from functools import partial
+from multiprocessing import Pool
+
 import pandas as pd
 import numpy as np
 
-# Carregar os dados exportados anteriormente
-spy_intra_data = pd.read_csv("spy_intra_data.csv", parse_dates=["caldt"])
-dividends = pd.read_csv("spy_dividends.csv", parse_dates=["caldt"])
+from artifact_cache import ArtifactCache
+from backtest_engine import build_day_arrays
+from bar_pyramid import write_levels
+from data_store import load_table, table_name, write_day_arrays, write_table
+from instrumentation import add_trace_arguments, configure, span
+from session_grid import align_bars, session_bars
+from universe import map_symbols
+
+DVOL_WINDOW = 14      # dias de retorno usados em spy_dvol
+SIGMA_WINDOW = 14     # dias por minuto usados em sigma_open
+SIGMA_MIN_PERIODS = 13
+CSV_BLOCK_ROWS = 100_000
+
+
+def day_layout(day):
+    """Codes, first row and intra-day position of every row, for contiguous days."""
+    codes, all_days = pd.factorize(day, sort=False)
+    n_bars = np.bincount(codes, minlength=len(all_days))
+    first_row = np.concatenate(([0], np.cumsum(n_bars)[:-1]))
+    position = np.arange(len(codes)) - first_row[codes]
+    return codes, all_days, n_bars, first_row, position
+
+
+def per_day_cumsum(values, codes, position, n_days, width):
+    """Cumulative sum restarting every day.
+
+    Rows are packed into a (days x width) matrix so each day is summed by its
+    own sequential np.cumsum, exactly like `Series.cumsum()` on the day slice.
+    """
+    dense = np.zeros((n_days, width))
+    dense[codes, position] = values
+    return np.cumsum(dense, axis=1)[codes, position]
+
+
+def window_std(windows):
+    """Sample std of each row with pandas' nanvar arithmetic (skipna=False, ddof=1).
+
+    Mean first, then summed squared deviations, so every row matches
+    `pd.Series(row).std(skipna=False)` bit for bit.
+    """
+    windows = np.ascontiguousarray(windows, dtype=float)
+    n = windows.shape[-1]
+    avg = windows.sum(axis=-1, dtype=np.float64) / n
+    sqr = (avg[..., None] - windows) ** 2
+    return np.sqrt(sqr.sum(axis=-1, dtype=np.float64) / (n - 1))
+
+
+def trailing_std(spy_ret, window=DVOL_WINDOW):
+    """std of spy_ret[d-window-1:d-1] for every day d > window, NaN before.
+
+    Same values as `spy_ret.iloc[d - 15:d - 1].std(skipna=False)` in the
+    original loop (note the window stops one day before d - 1).
+    """
+    n_days = len(spy_ret)
+    out = np.full(n_days, np.nan)
+    if n_days <= window + 1:
+        return out
+    std = window_std(np.lib.stride_tricks.sliding_window_view(spy_ret, window))
+    out[window + 1:] = std[:n_days - window - 1]
+    return out
+
+
+def compute_indicators(spy_intra_data, dividends):
+    """VWAP, move_open, spy_dvol and sigma_open for every minute bar.
+
+    Vectorized equivalent of the original day-by-day loop; the first day only
+    seeds the previous close, so its indicators stay NaN.
+    """
+    # === Etapa 1: Preparar DataFrame ===
+    with span('indicators.prepare') as sp:
+        df = spy_intra_data.copy()
+        df['day'] = pd.to_datetime(df['caldt']).dt.date
+        df.set_index('caldt', inplace=True)
+
+        codes, all_days, n_bars, first_row, position = day_layout(df['day'])
+        n_days = len(all_days)
+        width = int(n_bars.max())
+        first_day = codes == 0
+        last_row = first_row + n_bars - 1
+        sp.add(bars=len(df))
+
+    # === Etapa 2: VWAP e move_open por dia ===
+    with span('indicators.vwap'):
+        high = df['high'].to_numpy(dtype=float)
+        low = df['low'].to_numpy(dtype=float)
+        close = df['close'].to_numpy(dtype=float)
+        volume = df['volume'].to_numpy(dtype=float)
+
+        hlc = (high + low + close) / 3
+        cum_vol_x_hlc = per_day_cumsum(volume * hlc, codes, position, n_days, width)
+        cum_volume = per_day_cumsum(volume, codes, position, n_days, width)
+        vwap = cum_vol_x_hlc / cum_volume
+
+        open_price = df['open'].to_numpy(dtype=float)[first_row]
+        move_open = np.abs(close / open_price[codes] - 1)
+
+        vwap[first_day] = np.nan
+        move_open[first_day] = np.nan
+        df['move_open'] = move_open
+        df['vwap'] = vwap
+
+    # === Etapa 3: Volatilidade diária ===
+    with span('indicators.dvol'):
+        day_close = close[last_row]
+        spy_ret = np.full(n_days, np.nan)
+        spy_ret[1:] = day_close[1:] / day_close[:-1] - 1
+        df['spy_dvol'] = trailing_std(spy_ret)[codes]
+
+    # === Etapa 4: Métricas por minuto ===
+    with span('indicators.sigma_open'):
+        df['min_from_open'] = ((df.index - df.index.normalize()) / pd.Timedelta(minutes=1)) - (9 * 60 + 30) + 1
+        df['minute_of_day'] = df['min_from_open'].round().astype(int)
+
+        # Rolling por grupo em Cython (sem lambda por grupo); cada minuto reinicia a janela
+        minute_groups = pd.Series(move_open).groupby(df['minute_of_day'].to_numpy())
+        rolling_mean = minute_groups.rolling(window=SIGMA_WINDOW, min_periods=SIGMA_MIN_PERIODS).mean()
+        rolling_mean = rolling_mean.droplevel(0).sort_index()
+        df['move_open_rolling_mean'] = rolling_mean.to_numpy()
+        df['sigma_open'] = rolling_mean.groupby(df['minute_of_day'].to_numpy()).shift(1).to_numpy()
+
+    # === Etapa 5: Mesclar dividendos ===
+    with span('indicators.dividends'):
+        dividends = dividends.copy()
+        dividends['day'] = pd.to_datetime(dividends['caldt']).dt.date
+        df = df.merge(dividends[['day', 'dividend']], on='day', how='left')
+        df['dividend'] = df['dividend'].fillna(0)
+    return df
+
+
+def _format_csv_block(args):
+    block, header = args
+    return block.to_csv(header=header)
 
-# === Etapa 1: Preparar DataFrame ===
-df = spy_intra_data.copy()
-df['day'] = pd.to_datetime(df['caldt']).dt.date
-df.set_index('caldt', inplace=True)
 
-# === Etapa 2: Agrupamento diário ===
-daily_groups = df.groupby('day')
-all_days = df['day'].unique()
+def write_csv(df, path, workers=None):
+    """Same bytes as `df.to_csv(path)`, with float formatting spread over processes.
 
-# Inicialização
-df['move_open'] = np.nan
-df['vwap'] = np.nan
-df['spy_dvol'] = np.nan
-spy_ret = pd.Series(index=all_days, dtype=float)
+    Formatting floats dominates the runtime once the indicators are vectorized,
+    so row blocks are rendered in parallel and written out in order.
+    """
+    workers = workers or os.cpu_count()
+    with span('write_csv', path=path):
+        if workers <= 1 or len(df) <= CSV_BLOCK_ROWS:
+            df.to_csv(path)
+            return
+        blocks = [(df.iloc[i:i + CSV_BLOCK_ROWS], i == 0) for i in range(0, len(df), CSV_BLOCK_ROWS)]
+        with Pool(workers) as pool, open(path, 'w', newline='') as f:
+            for text in pool.imap(_format_csv_block, blocks):
+                f.write(text)
 
-# === Etapa 3: Métricas por dia ===
-for d in range(1, len(all_days)):
-    current_day = all_days[d]
-    prev_day = all_days[d - 1]
-    
-    current_day_data = daily_groups.get_group(current_day)
-    prev_day_data = daily_groups.get_group(prev_day)
 
-    hlc = (current_day_data['high'] + current_day_data['low'] + current_day_data['close']) / 3
-    vol_x_hlc = current_day_data['volume'] * hlc
-    cum_vol_x_hlc = vol_x_hlc.cumsum()
-    cum_volume = current_day_data['volume'].cumsum()
+def prepare_symbol(ticker, csv_workers=None, align=False, fill_gaps=False, resolutions=()):
+    """Indicators for one symbol, written per symbol to the store, day arrays and CSV.
 
-    df.loc[current_day_data.index, 'vwap'] = cum_vol_x_hlc / cum_volume
+    With `align`, the bars are first put on the session calendar (session_grid.py):
+    bars outside the session and repeated timestamps are dropped, and with
+    `fill_gaps` missing minutes are filled from the previous close.
+    Each of `resolutions` (minutes) is also stored as a coarser level (bar_pyramid.py).
+    """
+    # Carregar os dados exportados anteriormente (store colunar, ou CSV)
+    intra_name = table_name(ticker, 'intra_data')
+    dividends_name = table_name(ticker, 'dividends')
+    intra_data = load_table(intra_name, f"{intra_name}.csv", parse_dates=["caldt"])
+    dividends = load_table(dividends_name, f"{dividends_name}.csv", parse_dates=["caldt"])
+    if align:
+        intra_data = session_bars(align_bars(intra_data, fill_gaps)[0])
 
-    open_price = current_day_data['open'].iloc[0]
-    df.loc[current_day_data.index, 'move_open'] = (current_day_data['close'] / open_price - 1).abs()
+    with span('indicators', ticker=ticker):
+        df = compute_indicators(intra_data, dividends)
 
-    spy_ret.loc[current_day] = current_day_data['close'].iloc[-1] / prev_day_data['close'].iloc[-1] - 1
+    # === Salvar resultado ===
+    name = table_name(ticker, 'processed_data')
+    with span('write_store', ticker=ticker):
+        write_table(df, name, csv_index=True)
+        arrays = build_day_arrays(df)
+        write_day_arrays(arrays, name)
+    if resolutions:
+        write_levels(df, ticker, resolutions, arrays)
+    write_csv(df, f"{name}.csv", csv_workers)
+    print(f"[INFO] Calculated indicators and data saved in '{name}.csv'")
 
-    if d > 14:
-        df.loc[current_day_data.index, 'spy_dvol'] = spy_ret.iloc[d - 15:d - 1].std(skipna=False)
 
-# === Etapa 4: Métricas por minuto ===
-df['min_from_open'] = ((df.index - df.index.normalize()) / pd.Timedelta(minutes=1)) - (9 * 60 + 30) + 1
-df['minute_of_day'] = df['min_from_open'].round().astype(int)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute the strategy indicators for one or more symbols.")
+    parser.add_argument("--tickers", nargs="+", default=['SPY'])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--align", action="store_true", help="Align the bars on the session calendar first")
+    parser.add_argument("--fill-gaps", action="store_true", help="With --align, fill missing minutes")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[], metavar="MINUTES",
+                        help="Also store coarser bar levels, e.g. 5 15 30")
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
 
-minute_groups = df.groupby('minute_of_day')
-df['move_open_rolling_mean'] = minute_groups['move_open'].transform(lambda x: x.rolling(window=14, min_periods=13).mean())
-df['sigma_open'] = minute_groups['move_open_rolling_mean'].transform(lambda x: x.shift(1))
+    # Pular os símbolos cujas entradas e parâmetros não mudaram desde a última execução
+    cache = ArtifactCache()
+    params = {'dvol_window': DVOL_WINDOW, 'sigma_window': SIGMA_WINDOW, 'sigma_min_periods': SIGMA_MIN_PERIODS}
+    if args.align:
+        params.update(align=True, fill_gaps=args.fill_gaps)
+    if args.resolutions:
+        params['resolutions'] = sorted(args.resolutions)
+    inputs = {ticker: [f"{table_name(ticker, kind)}.csv" for kind in ('intra_data', 'dividends')
+                       if os.path.exists(f"{table_name(ticker, kind)}.csv")] for ticker in args.tickers}
+    outputs = {ticker: f"{table_name(ticker, 'processed_data')}.csv" for ticker in args.tickers}
+    todo = [ticker for ticker in args.tickers
+            if not (inputs[ticker] and cache.is_up_to_date(outputs[ticker], inputs[ticker], params))]
+    for ticker in sorted(set(args.tickers) - set(todo)):
+        print(f"[INFO] Inputs unchanged; '{outputs[ticker]}' is up to date")
 
-# === Etapa 5: Mesclar dividendos ===
-dividends['day'] = pd.to_datetime(dividends['caldt']).dt.date
-df = df.merge(dividends[['day', 'dividend']], on='day', how='left')
-df['dividend'] = df['dividend'].fillna(0)
+    # Um processo por símbolo; o CSV só é formatado em paralelo quando há um único símbolo
+    csv_workers = 1 if len(todo) > 1 and (args.workers or os.cpu_count()) > 1 else None
+    map_symbols(partial(prepare_symbol, csv_workers=csv_workers, align=args.align, fill_gaps=args.fill_gaps,
+                        resolutions=args.resolutions), todo, args.workers)
+    for ticker in todo:
+        if inputs[ticker]:
+            cache.record_artifact(outputs[ticker], inputs[ticker], params)
 
-# === Salvar resultado ===
-df.to_csv("spy_processed_data.csv")
 
-print("[INFO] Calculated indicators and data saved in 'spy_processed_data.csv'")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import argparse
+import json
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from metrics import STATS
+from trade_log import TRADE_COLUMNS
+
+DB_FILE = "results.db"
+BATCH_RUNS = 500                # runs per write transaction
+BUSY_TIMEOUT = 60               # seconds a writer waits for another writer's batch
+
+# Run parameters with a column (and an index) of their own; the full set is kept as JSON
+PARAM_COLUMNS = {
+    'band_mult': 'REAL',
+    'trade_freq': 'INTEGER',
+    'target_vol': 'REAL',
+    'max_leverage': 'REAL',
+    'sizing_type': 'TEXT',
+    'commission': 'REAL',
+    'min_comm_per_order': 'REAL',
+    'AUM_0': 'REAL',
+}
+# performance_stats() key -> column
+METRIC_COLUMNS = dict(zip(STATS, ['total_return', 'annual_return', 'volatility', 'sharpe', 'hit_ratio',
+                                  'max_drawdown', 'alpha', 'beta']))
+# Columns query_runs() can sort on; its ORDER BY is built from the name
+ORDER_COLUMNS = [*METRIC_COLUMNS.values(), 'run_id']
+TRADE_SQL_COLUMNS = dict(zip(TRADE_COLUMNS, ['date', 'open_time', 'open_price', 'exit_time', 'exit_price', 'shares',
+                                             'profit_pct', 'pnl', 'account_balance', 'side', 'exit_reason']))
+# Parameter indexes carry sharpe too, so "param = x ... ORDER BY sharpe" reads the index in order
+INDEXED = {**{column: f'{column}, sharpe' for column in ['band_mult', 'trade_freq', 'target_vol', 'max_leverage',
+                                                          'sizing_type']},
+           **{column: column for column in ['data_hash', 'label', *METRIC_COLUMNS.values()]}}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    source TEXT NOT NULL,
+    label TEXT,
+    data_hash TEXT,
+    {', '.join(f'{column.lower()} {kind}' for column, kind in PARAM_COLUMNS.items())},
+    params TEXT NOT NULL,
+    {', '.join(f'{column} REAL' for column in METRIC_COLUMNS.values())}
+);
+CREATE TABLE IF NOT EXISTS daily (
+    run_id INTEGER PRIMARY KEY REFERENCES runs(run_id),
+    days BLOB NOT NULL,
+    ret BLOB NOT NULL,
+    aum BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trades (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    trade_no INTEGER NOT NULL,
+    {', '.join(f'{column} {"TEXT" if column in ("date", "open_time", "exit_time", "side", "exit_reason") else "REAL"}'
+               for column in TRADE_SQL_COLUMNS.values())},
+    PRIMARY KEY (run_id, trade_no)
+) WITHOUT ROWID;
+{''.join(f'CREATE INDEX IF NOT EXISTS runs_{name} ON runs({key});' for name, key in INDEXED.items())}
+"""
+
+
+def connect(path=DB_FILE):
+    """Open (and create) the results database in WAL mode.
+
+    WAL lets readers run while a writer appends, and writers wait up to
+    BUSY_TIMEOUT for each other instead of failing. Transactions are managed
+    explicitly (autocommit connection).
+    """
+    con = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(SCHEMA)
+    return con
+
+
+def _day_numbers(days):
+    return np.asarray(pd.to_datetime(np.asarray(days)).to_numpy(dtype='datetime64[D]'), dtype=np.int32)
+
+
+class ResultsWriter:
+    """Buffers runs and appends them `batch_runs` at a time, one write transaction per batch.
+
+    Each process (e.g. every sweep worker) opens its own writer; batching keeps
+    the write lock short, so concurrent writers rarely wait for each other.
+    """
+
+    def __init__(self, path=DB_FILE, source='backtest', label=None, batch_runs=BATCH_RUNS):
+        self.con = connect(path)
+        self.source = source
+        self.label = label
+        self.batch_runs = batch_runs
+        self.pending = []
+        self.written = 0
+
+    def add(self, params, stats, data_hash=None, daily=None, trades=None):
+        """Queue one run: its parameters, performance_stats(), optional daily ret/AUM frame and trade log."""
+        self.pending.append((params, stats, data_hash, daily, trades))
+        if len(self.pending) >= self.batch_runs:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        created = pd.Timestamp.now().isoformat(timespec='seconds')
+        param_names = list(PARAM_COLUMNS)
+        columns = ['run_id', 'created', 'source', 'label', 'data_hash', *(c.lower() for c in param_names), 'params',
+                   *METRIC_COLUMNS.values()]
+        insert_run = f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        run_rows, daily_rows, trade_rows = [], [], []
+        cur = self.con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            # The write lock is held from here, so the next run_ids are ours
+            next_id = cur.execute("SELECT coalesce(max(run_id), 0) + 1 FROM runs").fetchone()[0]
+            for run_id, (params, stats, data_hash, daily, trades) in enumerate(self.pending, next_id):
+                run_rows.append([run_id, created, self.source, self.label, data_hash,
+                                 *(_sql_value(params.get(name)) for name in param_names),
+                                 json.dumps(params, sort_keys=True, default=str),
+                                 *(_sql_value(stats.get(key)) for key in METRIC_COLUMNS)])
+                if daily is not None:
+                    daily_rows.append((run_id, _day_numbers(daily.index).tobytes(),
+                                       daily['ret'].to_numpy(dtype=np.float64).tobytes(),
+                                       daily['AUM'].to_numpy(dtype=np.float64).tobytes()))
+                if trades is not None and len(trades):
+                    records = trades[TRADE_COLUMNS].astype(object).where(trades[TRADE_COLUMNS].notna(), None)
+                    records['Date'] = records['Date'].astype(str)
+                    trade_rows.extend((run_id, i, *row) for i, row in enumerate(records.itertuples(index=False)))
+            cur.executemany(insert_run, run_rows)
+            cur.executemany("INSERT INTO daily VALUES (?, ?, ?, ?)", daily_rows)
+            cur.executemany(f"INSERT INTO trades VALUES ({', '.join('?' * (len(TRADE_COLUMNS) + 2))})", trade_rows)
+            cur.execute("COMMIT")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        self.written += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.con.execute("PRAGMA optimize")
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _sql_value(value):
+    """NumPy scalars as plain Python values; NaN as NULL."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def query_runs(con, where=None, order_by='sharpe', descending=True, limit=20, args=()):
+    """Runs matching an SQL `where` clause on the runs columns, best `order_by` first.
+
+    `where` is SQL and is pasted as is; pass values through `?` placeholders
+    and `args`. `order_by` must be one of ORDER_COLUMNS.
+    """
+    if order_by not in ORDER_COLUMNS:
+        raise ValueError(f"[ERROR] Cannot order runs by '{order_by}'; expected one of {', '.join(ORDER_COLUMNS)}")
+    sql = "SELECT * FROM runs"
+    if where:
+        sql += f" WHERE {where}"
+    sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'} NULLS LAST LIMIT ?"
+    return pd.read_sql_query(sql, con, params=(*args, limit))
+
+
+def load_daily(con, run_id):
+    """Daily ret/AUM of one run, indexed by date."""
+    row = con.execute("SELECT days, ret, aum FROM daily WHERE run_id = ?", (run_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"[ERROR] No daily series stored for run {run_id}")
+    days = np.frombuffer(row[0], dtype=np.int32).astype('datetime64[D]')
+    return pd.DataFrame({'ret': np.frombuffer(row[1]), 'AUM': np.frombuffer(row[2])},
+                        index=pd.DatetimeIndex(days, name='day'))
+
+
+def load_trades(con, run_id):
+    """Trade log of one run with the trades.csv columns."""
+    trades = pd.read_sql_query(f"SELECT {', '.join(TRADE_SQL_COLUMNS.values())} FROM trades "
+                               "WHERE run_id = ? ORDER BY trade_no", con, params=(run_id,))
+    return trades.set_axis(TRADE_COLUMNS, axis=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the backtest / sweep results database.")
+    parser.add_argument("--db", default=DB_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_query = sub.add_parser("query", help="Best runs matching a filter")
+    p_query.add_argument("--where", default=None, help="SQL filter, e.g. \"max_drawdown < 15 AND trade_freq >= 15\"")
+    p_query.add_argument("--by", default="sharpe", choices=ORDER_COLUMNS)
+    p_query.add_argument("--ascending", action="store_true")
+    p_query.add_argument("--top", type=int, default=20)
+    p_show = sub.add_parser("show", help="Statistics, daily series and trades of one run")
+    p_show.add_argument("run_id", type=int)
+    sub.add_parser("summary", help="Runs per source and label")
+    args = parser.parse_args(argv)
+
+    con = connect(args.db)
+    if args.command == "query":
+        start = time.perf_counter()
+        runs = query_runs(con, args.where, args.by, not args.ascending, args.top)
+        elapsed = time.perf_counter() - start
+        columns = ['run_id', 'source', 'label', *(c.lower() for c in PARAM_COLUMNS if c != 'AUM_0'),
+                   *METRIC_COLUMNS.values()]
+        print(runs[columns].round({column: 3 for column in METRIC_COLUMNS.values()}).to_string(index=False))
+        print(f"[INFO] {len(runs)} runs in {elapsed * 1000:.1f} ms")
+    elif args.command == "show":
+        run = query_runs(con, "run_id = ?", args=(args.run_id,), limit=1)
+        if run.empty:
+            raise ValueError(f"[ERROR] No run {args.run_id} in {args.db}")
+        print(run.iloc[0].to_string())
+        n_days = con.execute("SELECT length(ret) / 8 FROM daily WHERE run_id = ?", (args.run_id,)).fetchone()
+        n_trades = con.execute("SELECT count(*) FROM trades WHERE run_id = ?", (args.run_id,)).fetchone()[0]
+        print(f"[INFO] {n_days[0] if n_days else 0} daily returns, {n_trades} trades stored")
+    else:
+        print(pd.read_sql_query("SELECT source, label, count(*) AS runs, min(created) AS first, "
+                                "max(created) AS last FROM runs GROUP BY source, label", con).to_string(index=False))
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
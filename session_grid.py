@@ -0,0 +1,224 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay,
+                                    USMartinLutherKingJr, USMemorialDay, USPresidentsDay, USThanksgivingDay,
+                                    nearest_workday, sunday_to_monday)
+
+from backtest_engine import MINUTES_PER_SESSION
+from data_store import load_table, table_name, write_day_arrays
+from instrumentation import add_trace_arguments, configure, span
+
+HALF_SESSION = 210              # 09:30-12:59 on early-close days
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+SESSION_OPEN_MINUTE = 9 * 60 + 30
+OHLCV = ['open', 'high', 'low', 'close', 'volume']
+WORST_DAYS = 10                 # days listed in the printed coverage summary
+
+# One-off NYSE closures (national days of mourning, September 11th, Hurricane Sandy)
+AD_HOC_CLOSURES = {
+    'September11': ['2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14'],
+    'MourningReagan': ['2004-06-11'],
+    'MourningFord': ['2007-01-02'],
+    'HurricaneSandy': ['2012-10-29', '2012-10-30'],
+    'MourningBushSr': ['2018-12-05'],
+    'MourningCarter': ['2025-01-09'],
+}
+
+
+class ExchangeHolidayCalendar(AbstractHolidayCalendar):
+    """Full-day US equity market holidays, including the one-off AD_HOC_CLOSURES."""
+    rules = [
+        Holiday('NewYearsDay', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('IndependenceDay', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+        *[Holiday(f"{name}{i}", year=day.year, month=day.month, day=day.day)
+          for name, dates in AD_HOC_CLOSURES.items() for i, day in enumerate(pd.to_datetime(dates))],
+    ]
+
+
+def trading_days(start, end):
+    """Sessions between `start` and `end` (inclusive) and a mask of early-close days.
+
+    Early closes: July 3rd, the day after Thanksgiving and December 24th when
+    they are sessions.
+    """
+    holidays = ExchangeHolidayCalendar().holidays(start, end)
+    days = pd.bdate_range(start, end, freq='C', holidays=holidays)
+    thanksgiving = pd.DatetimeIndex(USThanksgivingDay.dates(start, end))
+    half_day = (((days.month == 7) & (days.day == 3))
+                | ((days.month == 12) & (days.day == 24))
+                | days.isin(thanksgiving + pd.Timedelta(days=1)))
+    return days, np.asarray(half_day)
+
+
+def align_bars(intra, fill_gaps=False):
+    """Map minute bars onto a fixed (sessions x 390) grid of the exchange calendar.
+
+    Slot k of a row is the bar of 09:30 + k minutes, so every stage can index
+    minutes by position. Sessions span the first to the last day of `intra`,
+    including sessions without any bar. Bars before the open, after the close
+    (12:59 on early-close days) or on days that are not sessions are left
+    out and counted; of repeated timestamps the first bar is kept.
+    With `fill_gaps`, missing bars inside a session carry the previous close
+    (the first bar's open before it) with zero volume and are flagged in
+    'filled'. Returns (grid, bars per unscheduled day).
+    """
+    with span('align.map', bars=len(intra)):
+        ts = pd.to_datetime(intra['caldt']).to_numpy(dtype='datetime64[ns]')
+        day = ts.astype('datetime64[D]')
+        slot = (ts - day) // np.timedelta64(1, 'm') - SESSION_OPEN_MINUTE
+
+        days, half_day = trading_days(day.min(), day.max())
+        days = days.to_numpy(dtype='datetime64[D]')
+        session_length = np.where(half_day, HALF_SESSION, MINUTES_PER_SESSION).astype(np.int16)
+        n_days = len(days)
+
+        row = np.minimum(np.searchsorted(days, day), max(n_days - 1, 0))
+        scheduled = (days[row] == day) if n_days else np.zeros(len(day), dtype=bool)
+        in_session = scheduled & (slot >= 0) & (slot < session_length[row])
+
+        # First bar of every (session, slot); later ones are duplicates
+        key = row * MINUTES_PER_SESSION + slot
+        first = np.zeros(len(key), dtype=bool)
+        first[np.flatnonzero(in_session)[np.unique(key[in_session], return_index=True)[1]]] = True
+
+    with span('align.grid', days=n_days):
+        valid = np.zeros((n_days, MINUTES_PER_SESSION), dtype=bool)
+        valid[row[first], slot[first]] = True
+        grid = {
+            'days': days,
+            'session_length': session_length,
+            'valid': valid,
+            'n_valid': valid.sum(axis=1),
+            'last_slot': np.where(valid.any(axis=1), MINUTES_PER_SESSION - 1 - np.argmax(valid[:, ::-1], axis=1), -1),
+            'outside': np.bincount(row[scheduled & ~in_session], minlength=n_days),
+            'duplicates': np.bincount(row[in_session & ~first], minlength=n_days),
+        }
+        for column in OHLCV:
+            dense = np.full((n_days, MINUTES_PER_SESSION), np.nan)
+            dense[row[first], slot[first]] = intra[column].to_numpy(dtype=float)[first]
+            grid[column] = dense
+        if fill_gaps:
+            fill_session_gaps(grid)
+
+    unscheduled = pd.Series(day[~scheduled]).value_counts().sort_index()
+    return grid, unscheduled.rename_axis('day').rename('bars')
+
+
+def fill_session_gaps(grid):
+    """Fill the missing slots of every session in place from the previous close.
+
+    Slots before a session's first bar take that bar's open; sessions without
+    bars stay empty. Filled bars have open = high = low = close and no volume.
+    """
+    valid = grid['valid']
+    inside = np.arange(MINUTES_PER_SESSION) < grid['session_length'][:, None]
+    has_bars = valid.any(axis=1)
+    rows = np.arange(len(valid))[:, None]
+
+    # Index of the last real bar at or before each slot (-1 before the first bar)
+    last = np.maximum.accumulate(np.where(valid, np.arange(MINUTES_PER_SESSION), -1), axis=1)
+    first_slot = np.argmax(valid, axis=1)
+    price = np.where(last >= 0, grid['close'][rows, np.maximum(last, 0)], grid['open'][rows, first_slot[:, None]])
+
+    filled = inside & ~valid & has_bars[:, None]
+    for column in ['open', 'high', 'low', 'close']:
+        grid[column][filled] = price[filled]
+    grid['volume'][filled] = 0.0
+    grid['filled'] = filled
+    return grid
+
+
+def session_bars(grid):
+    """Minute bars of the grid (real and filled slots) in the layout of the intra CSVs."""
+    present = grid['valid'] | grid.get('filled', False)
+    day_index, slot = np.nonzero(present)
+    caldt = (pd.to_datetime(np.asarray(grid['days'])[day_index]) + SESSION_OPEN
+             + pd.to_timedelta(slot, unit='min'))
+    return pd.DataFrame({'caldt': caldt, **{column: grid[column][present] for column in OHLCV}})
+
+
+def coverage_report(grid, unscheduled=None):
+    """Per-day coverage of the grid: scheduled length, bars, missing slots and dropped bars.
+
+    Days with bars that are not sessions (calendar mismatches) are listed with
+    a session length of 0 and their bars under 'outside'.
+    """
+    session_length = np.asarray(grid['session_length'], dtype=int)
+    n_valid = np.asarray(grid['n_valid'], dtype=int)
+    report = pd.DataFrame({
+        'session_length': session_length,
+        'bars': n_valid,
+        'missing': session_length - n_valid,
+        'coverage (%)': n_valid / session_length * 100,
+        'observed_length': np.asarray(grid['last_slot']) + 1,
+        'early_close': session_length < MINUTES_PER_SESSION,
+        'outside': np.asarray(grid['outside']),
+        'duplicates': np.asarray(grid['duplicates']),
+    }, index=pd.DatetimeIndex(np.asarray(grid['days'])).rename('day'))
+    if 'filled' in grid:
+        report.insert(3, 'filled', np.asarray(grid['filled']).sum(axis=1))
+    if unscheduled is not None and len(unscheduled):
+        extra = pd.DataFrame({'outside': unscheduled.to_numpy()}, index=pd.DatetimeIndex(unscheduled.index))
+        report = pd.concat([report, extra.rename_axis('day')]).sort_index()
+        report = report.fillna({'early_close': False}).fillna(0)
+        report = report.astype({column: int for column in report.columns
+                                if column not in ('coverage (%)', 'early_close')}).astype({'early_close': bool})
+    return report
+
+
+def print_summary(report, ticker):
+    sessions = report[report['session_length'] > 0]
+    print(f"\n=== {ticker}: session coverage ===")
+    print(f"Sessions: {len(sessions)} ({int(sessions['early_close'].sum())} early closes)")
+    print(f"Complete sessions: {int((sessions['missing'] == 0).sum())}")
+    print(f"Sessions without bars: {int((sessions['bars'] == 0).sum())}")
+    print(f"Missing bars: {int(sessions['missing'].sum())} "
+          f"(mean coverage {sessions['coverage (%)'].mean():.2f}%)")
+    print(f"Bars outside the session: {int(report['outside'].sum())}, duplicates: {int(report['duplicates'].sum())}")
+    unscheduled = report[report['session_length'] == 0]
+    if len(unscheduled):
+        print(f"[!] Bars on {len(unscheduled)} days that are not sessions: "
+              f"{', '.join(str(d.date()) for d in unscheduled.index[:WORST_DAYS])}")
+    worst = sessions[sessions['missing'] > 0].sort_values('coverage (%)').head(WORST_DAYS)
+    if len(worst):
+        print("\nLowest coverage:")
+        print(worst.round(2).to_string())
+
+
+def align_symbol(ticker, fill_gaps=False):
+    """Align one symbol's minute bars; stores the grid and writes <ticker>_coverage.csv."""
+    intra_name = table_name(ticker, 'intra_data')
+    intra = load_table(intra_name, f"{intra_name}.csv", parse_dates=["caldt"])
+    grid, unscheduled = align_bars(intra, fill_gaps)
+    write_day_arrays(grid, table_name(ticker, 'session_grid'))
+    report = coverage_report(grid, unscheduled)
+    report.to_csv(f"{table_name(ticker, 'coverage')}.csv")
+    print_summary(report, ticker)
+    print(f"[INFO] Coverage per day saved in '{table_name(ticker, 'coverage')}.csv'")
+    return grid, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Align minute bars on the exchange session calendar.")
+    parser.add_argument("--tickers", nargs="+", default=['SPY'])
+    parser.add_argument("--fill-gaps", action="store_true", help="Fill missing bars from the previous close")
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
+
+    for ticker in args.tickers:
+        align_symbol(ticker, args.fill_gaps)
+
+
+if __name__ == "__main__":
+    main()
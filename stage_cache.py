@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (AUM_0, BAND_MULT, COMMISSION, MAX_LEVERAGE, MIN_COMM_PER_ORDER,
+                             SIZING_TYPE, TARGET_VOL, TRADE_FREQ, compound, compute_exposure,
+                             compute_signals, daily_pnl_per_share)
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+# Arrays that define the input data version of a pipeline
+_VERSION_KEYS = ['n_bars', 'close', 'vwap', 'sigma_open', 'min_from_open',
+                 'open_price', 'prev_close_adjusted', 'spy_dvol']
+
+
+def data_version(arrays):
+    """Short content hash of the day arrays used by the strategy stages."""
+    digest = hashlib.sha256()
+    for key in _VERSION_KEYS:
+        value = np.ascontiguousarray(arrays[key])
+        digest.update(key.encode())
+        digest.update(str(value.dtype).encode())
+        digest.update(str(value.shape).encode())
+        digest.update(value.data)
+    return digest.hexdigest()[:16]
+
+
+def stage_key(version, stage, **params):
+    """Cache key for one stage: data version plus only the parameters it consumes."""
+    payload = json.dumps({'version': version, 'stage': stage, 'params': params}, sort_keys=True, default=str)
+    return f"{stage}-{hashlib.sha256(payload.encode()).hexdigest()[:24]}"
+
+
+def _nbytes(value):
+    return sum(v.nbytes for v in value)
+
+
+class StageCache:
+    """In-process LRU cache of stage outputs with an optional on-disk layer.
+
+    Values are tuples of NumPy arrays. Both layers evict least recently used
+    entries once their total size exceeds `max_bytes` / `max_disk_bytes`.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, disk_dir=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self.counts = defaultdict(lambda: {'memory_hits': 0, 'disk_hits': 0, 'misses': 0})
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get_or_compute(self, key, compute):
+        stage = key.split('-', 1)[0]
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.counts[stage]['memory_hits'] += 1
+            return self._entries[key]
+
+        value = self._load(key)
+        if value is not None:
+            self.counts[stage]['disk_hits'] += 1
+        else:
+            self.counts[stage]['misses'] += 1
+            value = compute()
+            value = value if isinstance(value, tuple) else (value,)
+            self._store(key, value)
+
+        for v in value:
+            v.setflags(write=False)
+        self._entries[key] = value
+        self._size += _nbytes(value)
+        self._evict()
+        return value
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, value = self._entries.popitem(last=False)
+            self._size -= _nbytes(value)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _load(self, key):
+        if not self.disk_dir or not os.path.exists(self._path(key)):
+            return None
+        os.utime(self._path(key))
+        with np.load(self._path(key)) as data:
+            return tuple(data[f"arr_{i}"] for i in range(len(data.files)))
+
+    def _store(self, key, value):
+        if not self.disk_dir:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, *value)
+        os.replace(tmp, self._path(key))
+        if self.max_disk_bytes is not None:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        files = [os.path.join(self.disk_dir, f) for f in os.listdir(self.disk_dir) if f.endswith(".npz")]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        while total > self.max_disk_bytes and len(files) > 1:
+            oldest = files.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+    def stats(self):
+        """Per-stage hit counts and hit rates."""
+        report = {}
+        for stage, c in self.counts.items():
+            lookups = c['memory_hits'] + c['disk_hits'] + c['misses']
+            report[stage] = {**c, 'hit_rate': (c['memory_hits'] + c['disk_hits']) / lookups if lookups else 0.0}
+        report['memory_bytes'] = self._size
+        return report
+
+
+class StagedPipeline:
+    """The backtest split into cached stages keyed by the parameters each consumes.
+
+    signals    <- band_mult
+    exposure   <- band_mult, trade_freq
+    pnl inputs <- band_mult, trade_freq (per-day per-share PnL and trade counts)
+    compound   <- sizing and commission terms; always recomputed, it is the cheap step
+
+    Share counts are rounded from the previous day's AUM, so sizing and
+    commissions cannot be cached independently of the compounding itself.
+    """
+
+    def __init__(self, arrays, cache=None):
+        self.arrays = arrays
+        self.cache = cache if cache is not None else StageCache()
+        self.version = data_version(arrays)
+
+    def signals(self, band_mult=BAND_MULT):
+        key = stage_key(self.version, 'signals', band_mult=float(band_mult))
+        return self.cache.get_or_compute(key, lambda: compute_signals(self.arrays, band_mult))[0]
+
+    def exposure(self, band_mult=BAND_MULT, trade_freq=TRADE_FREQ):
+        key = stage_key(self.version, 'exposure', band_mult=float(band_mult),
+                        trade_freq=float(trade_freq))
+        return self.cache.get_or_compute(
+            key, lambda: compute_exposure(self.arrays, self.signals(band_mult), trade_freq))[0]
+
+    def pnl_inputs(self, band_mult=BAND_MULT, trade_freq=TRADE_FREQ):
+        key = stage_key(self.version, 'pnl', band_mult=float(band_mult), trade_freq=float(trade_freq))
+        return self.cache.get_or_compute(
+            key, lambda: daily_pnl_per_share(self.arrays, self.exposure(band_mult, trade_freq)))
+
+    def run(self, band_mult=BAND_MULT, trade_freq=TRADE_FREQ, AUM_0=AUM_0, commission=COMMISSION,
+            min_comm_per_order=MIN_COMM_PER_ORDER, sizing_type=SIZING_TYPE,
+            target_vol=TARGET_VOL, max_leverage=MAX_LEVERAGE):
+        """Same output as backtest_engine.run_backtest(), reusing cached stages."""
+        pnl_per_share, trades_count = self.pnl_inputs(band_mult, trade_freq)
+        ret, aum, shares = compound(self.arrays, pnl_per_share, trades_count, AUM_0=AUM_0,
+                                    commission=commission, min_comm_per_order=min_comm_per_order,
+                                    sizing_type=sizing_type, target_vol=target_vol,
+                                    max_leverage=max_leverage)
+        return pd.DataFrame({'ret': ret, 'AUM': aum, 'shares': shares}, index=self.arrays['days'])
@@ -0,0 +1,184 @@
+import argparse
+import os
+import zlib
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import MINUTES_PER_SESSION
+from data_store import table_name, write_table
+from session_grid import HALF_SESSION, SESSION_OPEN, trading_days
+from universe import map_symbols
+
+DEFAULT_START = "2016-01-04"
+DEFAULT_YEARS = 1
+DEFAULT_SEED = 0
+OUTPUT_DIR = "synthetic"
+BENCHMARK = 'SPY'
+
+# Market factor: AR(1) log-volatility around ~16% annualized
+MARKET_DRIFT = 0.08 / 252
+MARKET_VOL = 0.010
+VOL_PERSISTENCE = 0.97
+VOL_OF_VOL = 0.15
+OVERNIGHT_SHARE = 0.2           # share of the daily variance realized in the overnight gap
+DIVIDEND_YIELD = 0.004          # quarterly cash dividend as a fraction of the price
+
+
+def synthetic_tickers(n_symbols):
+    """SPY followed by SYN001, SYN002, ... for an `n_symbols` universe."""
+    return [BENCHMARK] + [f"SYN{i:03d}" for i in range(1, n_symbols)]
+
+
+def _session_profile(width):
+    """U-shaped intraday activity: busier around the open and the close."""
+    m = np.arange(width)
+    return 1 + 2 * np.exp(-m / 20) + 1.5 * np.exp(-(width - 1 - m) / 15)
+
+
+def _market_factor(seed, n_days):
+    """Daily volatility, overnight gaps and minute shocks shared by every symbol."""
+    rng = np.random.default_rng([seed, 0])
+    shocks = rng.standard_normal(n_days) * VOL_OF_VOL
+    log_vol = np.empty(n_days)
+    level = mu = np.log(MARKET_VOL)
+    for d in range(n_days):
+        level = mu + VOL_PERSISTENCE * (level - mu) + shocks[d]
+        log_vol[d] = level
+    vol = np.exp(log_vol)
+    gaps = rng.standard_normal(n_days)
+    minutes = rng.standard_normal((n_days, MINUTES_PER_SESSION))
+    return vol, gaps, minutes
+
+
+def generate_symbol(ticker, start=DEFAULT_START, years=DEFAULT_YEARS, seed=DEFAULT_SEED):
+    """Minute bars, daily bars and dividends of one synthetic symbol.
+
+    Deterministic for a given (ticker, start, years, seed): every symbol loads
+    the same market factor (volatility clustering, overnight gaps) and adds
+    its own beta and idiosyncratic noise, so a symbol's data does not depend
+    on the rest of the universe. SPY is the market factor itself.
+    Bars are on the exchange calendar (09:30-15:59, 12:59 on early closes),
+    some minutes are missing, prices are in cents and ex-dividend days gap
+    down by the dividend. Returns (intra, daily, dividends) in the layout of
+    the downloaded CSVs.
+    """
+    start = pd.Timestamp(start)
+    days, half_day = trading_days(start, start + pd.Timedelta(days=round(365.25 * years) - 1))
+    n_days = len(days)
+    if n_days == 0:
+        raise ValueError(f"[ERROR] No trading days in {years} year(s) from {start.date()}")
+    market_vol, market_gaps, market_minutes = _market_factor(seed, n_days)
+
+    rng = np.random.default_rng([seed, zlib.crc32(ticker.encode())])
+    if ticker == BENCHMARK:
+        beta, idio_ratio, price_0, missing_rate, volume_level = 1.0, 0.0, 200.0, 0.0005, 150_000
+    else:
+        beta = rng.uniform(0.6, 1.4)
+        idio_ratio = rng.uniform(0.3, 1.2)
+        price_0 = rng.uniform(20, 400)
+        missing_rate = rng.uniform(0.0005, 0.01)
+        volume_level = rng.uniform(2_000, 80_000)
+
+    # === Returns: overnight gap in column 0, then one return per minute ===
+    n_bars = np.where(half_day, HALF_SESSION, MINUTES_PER_SESSION)
+    in_session = np.arange(MINUTES_PER_SESSION) < n_bars[:, None]
+    profile = _session_profile(MINUTES_PER_SESSION)
+    weight = np.sqrt(profile / profile.sum() * (1 - OVERNIGHT_SHARE))
+    idio_vol = market_vol * idio_ratio
+    minute_ret = ((beta * market_minutes * market_vol[:, None]
+                   + rng.standard_normal((n_days, MINUTES_PER_SESSION)) * idio_vol[:, None]) * weight
+                  + MARKET_DRIFT * beta / MINUTES_PER_SESSION)
+    minute_ret[~in_session] = 0.0
+    overnight = np.sqrt(OVERNIGHT_SHARE) * (beta * market_gaps * market_vol
+                                            + rng.standard_normal(n_days) * idio_vol)
+    overnight[0] = 0.0
+
+    # Quarterly ex-dividend dates: first session on or after the third Friday of Mar/Jun/Sep/Dec
+    ex_dates = pd.date_range(start, days[-1], freq='WOM-3FRI')
+    ex_dates = ex_dates[ex_dates.month % 3 == 0]
+    ex_days = np.unique(np.searchsorted(days, ex_dates))
+    ex_days = ex_days[(ex_days > 0) & (ex_days < n_days)]
+    overnight[ex_days] += np.log(1 - DIVIDEND_YIELD)
+
+    minute_ret[:, 0] += overnight
+    log_close = np.log(price_0) + np.cumsum(minute_ret.ravel()).reshape(minute_ret.shape)
+    close = np.exp(log_close)
+    open_ = np.exp(log_close - minute_ret)
+    open_[:, 0] = np.exp(log_close[:, 0] - minute_ret[:, 0] + overnight)
+    spread = np.abs(rng.standard_normal((2, n_days, MINUTES_PER_SESSION))) * (market_vol[:, None] * weight) * 0.5
+    high = np.maximum(open_, close) * (1 + spread[0])
+    low = np.minimum(open_, close) * (1 - spread[1])
+
+    activity = profile * rng.lognormal(0.0, 0.5, (n_days, MINUTES_PER_SESSION))
+    volume = np.maximum(np.round(volume_level * activity * (market_vol / MARKET_VOL)[:, None]), 100)
+
+    # === Gaps: drop random minutes (the opening bar is always kept) ===
+    keep = in_session & (rng.random((n_days, MINUTES_PER_SESSION)) >= missing_rate)
+    keep[:, 0] = True
+    day_index, minute = np.nonzero(keep)
+
+    open_c = np.round(open_[keep], 2)
+    close_c = np.round(close[keep], 2)
+    intra = pd.DataFrame({
+        'caldt': days[day_index] + SESSION_OPEN + pd.to_timedelta(minute, unit='min'),
+        'open': open_c,
+        'high': np.maximum(np.round(high[keep], 2), np.maximum(open_c, close_c)),
+        'low': np.minimum(np.round(low[keep], 2), np.minimum(open_c, close_c)),
+        'close': close_c,
+        'volume': volume[keep],
+    })
+
+    daily = intra.groupby(days[day_index]).agg(open=('open', 'first'), high=('high', 'max'),
+                                               low=('low', 'min'), close=('close', 'last'),
+                                               volume=('volume', 'sum'))
+    daily = daily.rename_axis('caldt').reset_index()
+
+    prev_close = daily['close'].to_numpy()[ex_days - 1]
+    dividends = pd.DataFrame({
+        'caldt': days[ex_days],
+        'dividend': np.round(prev_close * DIVIDEND_YIELD, 4),
+    })
+    return intra, daily, dividends
+
+
+def write_symbol(ticker, start=DEFAULT_START, years=DEFAULT_YEARS, seed=DEFAULT_SEED, directory=OUTPUT_DIR,
+                 store=False):
+    """Generate one symbol and save <ticker>_intra_data/_daily_data/_dividends.csv in `directory`.
+
+    With `store`, the tables are also written to the columnar store under
+    `directory`, like download_market_data.py does.
+    """
+    os.makedirs(directory, exist_ok=True)
+    intra, daily, dividends = generate_symbol(ticker, start, years, seed)
+    for kind, df in (('intra_data', intra), ('daily_data', daily), ('dividends', dividends)):
+        name = table_name(ticker, kind)
+        if store:
+            write_table(df, name, root=os.path.join(directory, 'market_data'))
+        df.to_csv(os.path.join(directory, f"{name}.csv"), index=False)
+    print(f"[INFO] {ticker}: {len(daily)} days, {len(intra)} minute bars, {len(dividends)} dividends")
+    return len(intra)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate deterministic SPY-like minute bars, daily bars and dividends.")
+    parser.add_argument("--tickers", nargs="+", default=None, help="Symbols to generate (default: --symbols)")
+    parser.add_argument("--symbols", type=int, default=1, help="Universe size: SPY plus SYN001, SYN002, ...")
+    parser.add_argument("--years", type=float, default=DEFAULT_YEARS)
+    parser.add_argument("--start", default=DEFAULT_START)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--store", action="store_true", help="Also write the columnar store")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    tickers = args.tickers or synthetic_tickers(args.symbols)
+    years = int(args.years) if args.years.is_integer() else args.years
+    rows = map_symbols(partial(write_symbol, start=args.start, years=years, seed=args.seed,
+                               directory=args.output_dir, store=args.store), tickers, args.workers)
+    print(f"[INFO] {len(tickers)} symbol(s), {sum(rows)} minute bars saved in '{args.output_dir}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+from backtest_engine import MINUTES_PER_SESSION, compute_bands, compute_exposure, compute_signals, minute_values
+from instrumentation import count, traced
+
+TRADE_COLUMNS = ["Date", "Open_Time", "Open_Price", "Exit_Time", "Exit_Price", "Shares", "Profit%",
+                 "P&L", "Account_Balance", "Side", "exit_reason"]
+
+# "HH:MM:SS" of every minute of the day
+CLOCK_LABELS = np.array([f"{m // 60:02d}:{m % 60:02d}:00" for m in range(24 * 60)], dtype=object)
+
+
+def time_labels(minutes):
+    """"HH:MM:SS" of whole-minute offsets from 09:30, like minute_to_time() of any offset (wraps at midnight).
+
+    Offset MINUTES_PER_SESSION, 16:00:00, is the exit time of positions closed
+    at the end of the day.
+    """
+    return CLOCK_LABELS[(9 * 60 + 30 + np.asarray(minutes, dtype=np.int64)) % (24 * 60)]
+
+
+def positions(exposure):
+    """Position held after each bar by the trade-log state machine.
+
+    The log enters when flat and exposure is non-zero, and exits (to flat) as
+    soon as exposure differs from the open position; a flip therefore exits on
+    one bar and re-enters on the next. Outside flips the position equals the
+    exposure. Inside a run of consecutive flip bars it alternates flat, exposure,
+    flat, ... starting from the first flip.
+    """
+    e = exposure.astype(np.int8)
+    prev = np.zeros_like(e)
+    prev[:, 1:] = e[:, :-1]
+    flip = (e != 0) & (prev != 0) & (e != prev)
+    columns = np.arange(e.shape[1])
+    last_steady = np.maximum.accumulate(np.where(flip, 0, columns), axis=1)
+    run_index = columns - last_steady - 1
+    return np.where(flip & (run_index % 2 == 0), 0, e)
+
+
+@traced('trade_log')
+def extract_trades(arrays, strat, band_mult, trade_freq):
+    """Trade log for a backtest, built for all days at once.
+
+    Produces the same rows as the per-minute loop it replaces: one row per
+    round trip, open positions closed at 16:00:00 with exit_reason "end_of_day".
+    `strat` is the run_backtest() frame (AUM and shares per day).
+    """
+    n_days = len(arrays['days'])
+    n_bars = np.asarray(arrays['n_bars'])
+    UB, LB = compute_bands(arrays, band_mult)
+    signals = compute_signals(arrays, band_mult)
+    exposure = compute_exposure(arrays, signals, trade_freq)
+
+    # Days the loop skipped trade nothing; an extra flat column closes open positions
+    traded = np.asarray(arrays['has_sigma']).copy()
+    traded[:1] = False
+    width = exposure.shape[1]
+    held = np.zeros((n_days, width + 1), dtype=np.int8)
+    held[traded, :width] = exposure[traded]
+    held[:, :width][np.arange(width) >= n_bars[:, None]] = 0
+    pos = positions(held)
+
+    prev = np.zeros_like(pos)
+    prev[:, 1:] = pos[:, :-1]
+    entry_day, entry_bar = np.nonzero((prev == 0) & (pos != 0))
+    exit_day, exit_bar = np.nonzero((prev != 0) & (pos == 0))
+    side = pos[entry_day, entry_bar].astype(float)
+
+    end_of_day = exit_bar >= n_bars[exit_day]
+    price_bar = np.where(end_of_day, n_bars[exit_day] - 1, exit_bar)
+    close = minute_values(arrays, 'close')
+    entry_price = close[entry_day, entry_bar]
+    exit_price = close[exit_day, price_bar]
+
+    prev_aum = np.concatenate(([np.nan], strat['AUM'].to_numpy()[:-1]))[entry_day]
+    shares = strat['shares'].to_numpy()[entry_day]
+    pnl = (exit_price - entry_price) * shares * side
+    pnl_pct = (exit_price / entry_price - 1) * 100 * side
+
+    # === Exit reason
+    sig_now = signals[exit_day, price_bar]
+    vwap_now = minute_values(arrays, 'vwap')[exit_day, price_bar]
+    ub_now = UB[exit_day, price_bar]
+    lb_now = LB[exit_day, price_bar]
+    long_now = ~end_of_day & (sig_now == 1)
+    short_now = ~end_of_day & (sig_now == -1)
+    exit_reason = np.select(
+        [end_of_day,
+         long_now & (exit_price > ub_now) & (exit_price > vwap_now),
+         long_now & (exit_price > ub_now),
+         long_now & (exit_price > vwap_now),
+         short_now & (exit_price < lb_now) & (exit_price < vwap_now),
+         short_now & (exit_price < lb_now),
+         short_now & (exit_price < vwap_now),
+         ~long_now & ~short_now],
+        ["end_of_day", "signal_change_ub_vwap", "signal_change_ub", "signal_change_vwap",
+         "signal_change_lb_vwap", "signal_change_lb", "signal_change_vwap", "signal_change_no_new_signal"],
+        default="",
+    ).astype(object)
+    unclassified = np.flatnonzero(exit_reason == "")
+    if len(unclassified):
+        k = unclassified[0]
+        kind = "long" if sig_now[k] == 1 else "short"
+        raise ValueError(f"[ERROR] Unclassified signal_change ({kind}) on "
+                         f"{arrays['days'][exit_day[k]]} @ {exit_bar[k]}")
+
+    min_from_open = minute_values(arrays, 'min_from_open')
+    open_minute = min_from_open[entry_day, entry_bar].astype(int)
+    exit_minute = np.where(end_of_day, MINUTES_PER_SESSION, min_from_open[exit_day, price_bar]).astype(int)
+
+    count('trades', len(entry_day))
+    return pd.DataFrame({
+        "Date": np.asarray(arrays['days'])[entry_day],
+        "Open_Time": time_labels(open_minute),
+        "Open_Price": np.round(entry_price, 2),
+        "Exit_Time": time_labels(exit_minute),
+        "Exit_Price": np.round(exit_price, 2),
+        "Shares": shares * side,
+        "Profit%": np.round(pnl_pct, 2),
+        "P&L": np.round(pnl, 2),
+        "Account_Balance": np.round(prev_aum + pnl, 2),
+        "Side": np.where(side == 1, "long", "short").astype(object),
+        "exit_reason": exit_reason,
+    }, columns=TRADE_COLUMNS)
@@ -0,0 +1,144 @@
+import argparse
+import os
+from multiprocessing import Pool
+
+import pandas as pd
+
+from backtest_engine import (AUM_0, BAND_MULT, MAX_LEVERAGE, SIZING_TYPE, STATS_DECIMALS, TARGET_VOL,
+                             TRADE_FREQ, build_day_arrays, performance_stats, run_backtest)
+from data_store import load_table, read_day_arrays, table_name, write_table
+from instrumentation import add_trace_arguments, configure, span
+from trade_log import extract_trades
+
+DEFAULT_TICKERS = ['SPY']
+BENCHMARK = 'SPY'
+
+
+def map_symbols(func, tickers, workers=None):
+    """Run `func(ticker)` for every symbol in worker processes, preserving order.
+
+    Each symbol runs in a fresh process (maxtasksperchild=1), so its minute
+    data goes back to the OS as soon as the symbol is done.
+    """
+    workers = min(workers or os.cpu_count(), len(tickers))
+    if workers <= 1:
+        return [func(ticker) for ticker in tickers]
+    with Pool(workers, maxtasksperchild=1) as pool:
+        return pool.map(func, tickers, chunksize=1)
+
+
+def parse_weights(tickers, weights=None):
+    """Capital share per symbol: equal by default, or {ticker: weight} normalized to 1."""
+    if not weights:
+        return {ticker: 1 / len(tickers) for ticker in tickers}
+    missing = [ticker for ticker in tickers if ticker not in weights]
+    if missing:
+        raise ValueError(f"[ERROR] No weight given for {missing}")
+    total = sum(weights[ticker] for ticker in tickers)
+    return {ticker: weights[ticker] / total for ticker in tickers}
+
+
+def load_symbol_arrays(ticker):
+    """Dense day arrays of one symbol: memory-mapped from the store, or built from its CSV."""
+    name = table_name(ticker, 'processed_data')
+    arrays = read_day_arrays(name)
+    if arrays is None:
+        df = pd.read_csv(f"{name}.csv", index_col=0)
+        df['day'] = pd.to_datetime(df['day']).dt.date
+        arrays = build_day_arrays(df)
+    return arrays
+
+
+def daily_returns(ticker):
+    """Close-to-close returns of a symbol indexed by date (its buy & hold benchmark)."""
+    name = table_name(ticker, 'daily_data')
+    daily = load_table(name, f"{name}.csv", parse_dates=['caldt'])
+    close = daily.set_index(pd.to_datetime(daily['caldt']).dt.date)['close']
+    return close.diff() / close.shift()
+
+
+def backtest_symbol(job):
+    """Backtest one symbol with its share of the capital and write its trade log."""
+    ticker, capital, params = job
+    with span('symbol', ticker=ticker):
+        arrays = load_symbol_arrays(ticker)
+        strat = run_backtest(arrays, AUM_0=capital, **params)
+        trades = extract_trades(arrays, strat, params['band_mult'], params['trade_freq'])
+    trades.to_csv(f"{table_name(ticker, 'trades')}.csv", index=False)
+    if len(trades):
+        write_table(trades, table_name(ticker, 'trades'))
+
+    strat['ret_spy'] = daily_returns(ticker).reindex(strat.index).where(strat['ret'].notna())
+    stats = performance_stats(strat)
+    print(f"[INFO] {ticker}: {len(arrays['days'])} days, {len(trades)} trades")
+    return ticker, strat[['ret', 'AUM']], stats
+
+
+def aggregate_portfolio(sleeves, capital):
+    """Sum per-symbol AUM (each sleeve compounds its own capital) into a portfolio AUM.
+
+    Sleeves are aligned on the union of trading days; a symbol's AUM is carried
+    forward over days it did not trade and equals its allocation before its
+    first day.
+    """
+    days = sorted(set().union(*(sleeve.index for sleeve in sleeves.values())))
+    aum = pd.DataFrame({ticker: sleeve['AUM'].reindex(days).ffill().fillna(capital[ticker])
+                        for ticker, sleeve in sleeves.items()}, index=days)
+    portfolio = pd.DataFrame({'AUM': aum.sum(axis=1)}, index=days)
+    portfolio['ret'] = portfolio['AUM'].pct_change()
+    return aum, portfolio
+
+
+def run_universe(tickers, weights=None, AUM_0=AUM_0, workers=None, benchmark=BENCHMARK, **params):
+    """Backtest every symbol in parallel and combine them into one portfolio.
+
+    Returns (per-symbol AUM, portfolio ret/AUM, stats table with one row per
+    symbol plus 'PORTFOLIO').
+    """
+    params = {'band_mult': BAND_MULT, 'trade_freq': TRADE_FREQ, 'sizing_type': SIZING_TYPE,
+              'target_vol': TARGET_VOL, 'max_leverage': MAX_LEVERAGE, **params}
+    shares = parse_weights(tickers, weights)
+    capital = {ticker: AUM_0 * share for ticker, share in shares.items()}
+    outputs = map_symbols(backtest_symbol, [(t, capital[t], params) for t in tickers], workers)
+
+    sleeves = {ticker: strat for ticker, strat, _ in outputs}
+    stats = pd.DataFrame({ticker: row for ticker, _, row in outputs}).T
+    aum, portfolio = aggregate_portfolio(sleeves, capital)
+
+    portfolio['ret_spy'] = daily_returns(benchmark).reindex(portfolio.index).where(portfolio['ret'].notna())
+    stats.loc['PORTFOLIO'] = performance_stats(portfolio)
+    stats.insert(0, 'weight', pd.Series({**shares, 'PORTFOLIO': 1.0}))
+    return aum, portfolio, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the momentum backtest over a universe of symbols.")
+    parser.add_argument("--tickers", nargs="+", default=DEFAULT_TICKERS)
+    parser.add_argument("--weights", nargs="+", default=None, metavar="TICKER=WEIGHT",
+                        help="Capital allocation (default: equal weights)")
+    parser.add_argument("--capital", type=float, default=AUM_0)
+    parser.add_argument("--benchmark", default=BENCHMARK)
+    parser.add_argument("--band-mult", type=float, default=BAND_MULT)
+    parser.add_argument("--trade-freq", type=int, default=TRADE_FREQ)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="portfolio_daily.csv")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    weights = None
+    if args.weights:
+        weights = {item.split('=')[0]: float(item.split('=')[1]) for item in args.weights}
+    aum, portfolio, stats = run_universe(args.tickers, weights, args.capital, args.workers, args.benchmark,
+                                         band_mult=args.band_mult, trade_freq=args.trade_freq)
+
+    aum.assign(PORTFOLIO=portfolio['AUM']).to_csv(args.output, index_label='day')
+    for column, decimals in STATS_DECIMALS.items():
+        stats[column] = stats[column].astype(float).round(decimals)
+    stats.to_csv("universe_stats.csv", index_label='ticker')
+    print(stats.to_string())
+    print(f"[INFO] Portfolio AUM saved in '{args.output}', statistics in 'universe_stats.csv'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import os
+import tempfile
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (AUM_0, BAND_MULT, MAX_LEVERAGE, SIZING_TYPE, STATS_DECIMALS, TARGET_VOL,
+                             TRADE_FREQ, load_daily_returns, load_day_arrays, load_processed_data,
+                             performance_stats, save_day_arrays)
+from bar_pyramid import sweep_arrays
+from batch_backtest import compound_batch, make_param_table, signal_stage_batch
+from parameter_sweep import expand_grid
+from instrumentation import add_trace_arguments, configure, span
+
+# Selection metrics (keys of fold_metrics()) and whether larger is better
+METRICS = {
+    'sharpe': True,
+    'annual_return': True,
+    'total_return': True,
+    'max_drawdown': False,
+}
+COMPOUND_KEYS = ['open_price', 'spy_dvol', 'has_sigma']
+
+# Per-worker day arrays, attached once by _init_worker()
+_ARRAYS = None
+
+
+def monthly_folds(days, train_months, test_months=1, mode="rolling"):
+    """(train_start, test_start, test_stop) day indices stepping by `test_months`.
+
+    Rolling windows keep the last `train_months` months before each test
+    window; expanding windows train on everything before it.
+    """
+    if mode not in ("rolling", "expanding"):
+        raise ValueError(f"[ERROR] Unknown walk-forward mode '{mode}'")
+    months = pd.PeriodIndex(pd.to_datetime(pd.Series(days)), freq='M')
+    month_codes, unique_months = pd.factorize(months, sort=True)
+    month_start = np.searchsorted(month_codes, np.arange(len(unique_months) + 1))
+
+    folds = []
+    for m in range(train_months, len(unique_months), test_months):
+        train_start = month_start[m - train_months] if mode == "rolling" else 0
+        folds.append((int(train_start), int(month_start[m]),
+                      int(month_start[min(m + test_months, len(unique_months))])))
+    return folds
+
+
+def fold_metrics(ret, aum):
+    """Selection metrics for every parameter set; `ret`/`aum` are (days x params)."""
+    valid = ~np.isnan(ret)
+    count = valid.sum(axis=0)
+    values = np.where(valid, ret, 0.0)
+    growth = (1 + values).prod(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = values.sum(axis=0) / count
+        std = np.sqrt((np.where(valid, ret - mean, 0.0) ** 2).sum(axis=0) / (count - 1))
+        return {
+            'sharpe': mean / std * np.sqrt(252),
+            'annual_return': (growth ** (252 / count) - 1) * 100,
+            'total_return': (growth - 1) * 100,
+            'max_drawdown': (aum / np.maximum.accumulate(aum, axis=0) - 1).min(axis=0) * -100,
+        }
+
+
+def _init_worker(arrays_dir):
+    global _ARRAYS
+    _ARRAYS = load_day_arrays(arrays_dir, mmap_mode='r')
+
+
+def _signal_chunk(pairs):
+    return signal_stage_batch(_ARRAYS, pairs)
+
+
+def _compound_window(pnl_per_share, trades_count, table, start, stop, seed_aum=None, offset=0):
+    """Compound days [start, stop) for every row of `table`, starting from `seed_aum`.
+
+    The day before `start` is prepended as the seed day holding `seed_aum`, so
+    the first day of the window is traded from it exactly as it would be inside
+    a full run; untraded days still hold the table's AUM_0, as in compound().
+    `pnl_per_share`/`trades_count` columns start at day `offset`.
+    """
+    seed = max(start - 1, 0)
+    window = {key: np.asarray(_ARRAYS[key][seed:stop]) for key in COMPOUND_KEYS}
+    ret, aum = compound_batch(window, pnl_per_share[:, seed - offset:stop - offset],
+                              trades_count[:, seed - offset:stop - offset], table, seed_aum)
+    return ret[start - seed:], aum[start - seed:]
+
+
+def _optimize_fold(job):
+    """Pick the parameter row with the best train-window metric."""
+    pnl_per_share, trades_count, table, (train_start, test_start, _), metric = job
+    offset = max(train_start - 1, 0)
+    ret, aum = _compound_window(pnl_per_share, trades_count, table, train_start, test_start, offset=offset)
+    scores = fold_metrics(ret, aum)[metric]
+    if not np.isfinite(scores).any():
+        return 0, np.nan
+    best = np.nanargmax(scores) if METRICS[metric] else np.nanargmin(scores)
+    return int(best), float(scores[best])
+
+
+def walk_forward(grid, df=None, ret_spy=None, train_months=24, test_months=1, mode="rolling",
+                 metric="sharpe", AUM_0=AUM_0, workers=None, resolution=1):
+    """Optimize on each train window, trade the winner on the next test window.
+
+    The signal stage (per-share PnL and trade counts per day) depends only on
+    band_mult/trade_freq, so it is computed once for the whole history, split
+    over a process pool that memory-maps the day arrays. Folds then only
+    re-compound slices of it and are optimized concurrently. The out-of-sample
+    test windows are chained on one AUM, so with a single parameter set the
+    stitched curve is run_backtest() started the day before the first test
+    window. With `resolution` > 1, folds run on
+    `resolution`-minute bars (bar_pyramid.py).
+    Returns (folds table, stitched out-of-sample ret/AUM/ret_spy frame).
+    """
+    if metric not in METRICS:
+        raise ValueError(f"[ERROR] Unknown metric '{metric}'; choose from {sorted(METRICS)}")
+    if df is None:
+        df = load_processed_data()
+    if ret_spy is None:
+        ret_spy = load_daily_returns()
+
+    arrays = sweep_arrays(df, grid.get('trade_freq', [TRADE_FREQ]), resolution)
+    days = arrays['days']
+    combos = pd.DataFrame(expand_grid(grid))
+    table = make_param_table({**{name: combos[name].tolist() for name in combos}, 'AUM_0': AUM_0})
+    pairs = table[['band_mult', 'trade_freq']].drop_duplicates().reset_index(drop=True)
+    pair_of = table.merge(pairs.reset_index(), on=['band_mult', 'trade_freq'], how='left')['index'].to_numpy()
+    folds = monthly_folds(days, train_months, test_months, mode)
+    if not folds:
+        raise ValueError(f"[ERROR] Not enough history for a {train_months}-month train window")
+    workers = workers or os.cpu_count()
+
+    global _ARRAYS
+    with tempfile.TemporaryDirectory(prefix="momentum_wf_") as arrays_dir:
+        save_day_arrays(arrays, arrays_dir)
+        del arrays
+        with Pool(workers, initializer=_init_worker, initargs=(arrays_dir,)) as pool:
+            with span('walk_forward.signals', pairs=len(pairs)):
+                chunks = np.array_split(np.arange(len(pairs)), min(workers, len(pairs)))
+                stages = pool.map(_signal_chunk, [pairs.iloc[chunk] for chunk in chunks])
+                pnl_per_share = np.concatenate([pnl for pnl, _ in stages])[pair_of]
+                trades_count = np.concatenate([count for _, count in stages])[pair_of]
+
+            # Each fold only receives the columns of its own train window
+            with span('walk_forward.optimize') as sp:
+                jobs = []
+                for fold in folds:
+                    window = slice(max(fold[0] - 1, 0), fold[1])
+                    jobs.append((pnl_per_share[:, window], trades_count[:, window], table, fold, metric))
+                winners = pool.map(_optimize_fold, jobs)
+                sp.add(folds=len(folds))
+
+        # === Stitched out-of-sample curve (sequential: each window starts from the last AUM) ===
+        _init_worker(arrays_dir)
+        seed_aum = AUM_0
+        rows, ret_parts, aum_parts = [], [], []
+        for (train_start, test_start, test_stop), (best, score) in zip(folds, winners):
+            params = table.iloc[[best]].reset_index(drop=True)
+            ret, aum = _compound_window(pnl_per_share[[best]], trades_count[[best]], params,
+                                        test_start, test_stop, seed_aum)
+            ret_parts.append(ret[:, 0])
+            aum_parts.append(aum[:, 0])
+            rows.append({
+                'train_start': days[train_start], 'test_start': days[test_start],
+                'test_end': days[test_stop - 1],
+                **{name: params.loc[0, name] for name in combos.columns},
+                f'train_{metric}': score,
+                'test_return (%)': (aum[-1, 0] / seed_aum - 1) * 100,
+            })
+            seed_aum = float(aum[-1, 0])
+        _ARRAYS = None
+
+    index = days[folds[0][1]:folds[-1][2]]
+    strat = pd.DataFrame({'ret': np.concatenate(ret_parts), 'AUM': np.concatenate(aum_parts)}, index=index)
+    strat['ret_spy'] = ret_spy.reindex(index).where(strat['ret'].notna())
+    return pd.DataFrame(rows), strat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward optimization of the intraday momentum strategy.")
+    parser.add_argument("--band-mult", type=float, nargs="+", default=[BAND_MULT])
+    parser.add_argument("--trade-freq", type=int, nargs="+", default=[TRADE_FREQ])
+    parser.add_argument("--target-vol", type=float, nargs="+", default=[TARGET_VOL])
+    parser.add_argument("--max-leverage", type=float, nargs="+", default=[MAX_LEVERAGE])
+    parser.add_argument("--sizing-type", nargs="+", default=[SIZING_TYPE], choices=["vol_target", "full"])
+    parser.add_argument("--train-months", type=int, default=24)
+    parser.add_argument("--test-months", type=int, default=1)
+    parser.add_argument("--mode", choices=["rolling", "expanding"], default="rolling")
+    parser.add_argument("--metric", choices=sorted(METRICS), default="sharpe")
+    parser.add_argument("--data", default="spy_processed_data.csv")
+    parser.add_argument("--daily", default="spy_daily_data.csv")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--resolution", type=int, default=1, metavar="MINUTES",
+                        help="Bar size; 5/15/30 backtest coarse bars dividing every --trade-freq (default: 1)")
+    parser.add_argument("--output", default="walk_forward_folds.csv")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    grid = {
+        'band_mult': args.band_mult,
+        'trade_freq': args.trade_freq,
+        'target_vol': args.target_vol,
+        'max_leverage': args.max_leverage,
+        'sizing_type': args.sizing_type,
+    }
+    folds, strat = walk_forward(grid, load_processed_data(args.data), load_daily_returns(args.daily),
+                                args.train_months, args.test_months, args.mode, args.metric,
+                                workers=args.workers, resolution=args.resolution)
+    folds.to_csv(args.output, index=False)
+    strat[['ret', 'AUM']].to_csv("walk_forward_equity.csv", index_label='day')
+    print(f"[INFO] {len(folds)} folds saved to {args.output}, out-of-sample equity to walk_forward_equity.csv")
+
+    # === Regression stats (out-of-sample)
+    stats = {k: round(v, STATS_DECIMALS[k]) for k, v in performance_stats(strat).items()}
+
+    print("\n=== Strategy Performance Metrics ===")
+    for k, v in stats.items():
+        print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()